@@ -0,0 +1,212 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiofiles
+from aiohttp import BodyPartReader, web
+
+from mining.settings import BASE_DIR
+
+DEFAULT_BLOB_ROOT = BASE_DIR / 'data' / 'blobs'
+MAX_PHOTO_SIZE = 10 * 1024 ** 2
+CHUNK_SIZE = 64 * 1024
+
+BLOB_PREFIX = 'blob:'
+BLOB_URL_PREFIX = '/assets/blobs/'
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# served bytes never change for a digest
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# ids accepted by one batched album request
+MAX_ALBUM_BATCH = 50
+
+# responsive variants derived by mining/images.py, narrowest first
+VARIANT_WIDTHS = (320, 640, 1280)
+VARIANT_FORMATS = {
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    # trust the bytes, not the client supplied mime type
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def blob_ref(digest: str) -> str:
+    return BLOB_PREFIX + digest
+
+
+def parse_ref(value: Any) -> Optional[str]:
+    if isinstance(value, str) and value.startswith(BLOB_PREFIX) and DIGEST_RE.match(value[len(BLOB_PREFIX):]):
+        return value[len(BLOB_PREFIX):]
+    return None
+
+
+def blob_url(digest: str) -> str:
+    return BLOB_URL_PREFIX + digest
+
+
+def variant_name(width: int, fmt: str) -> str:
+    return f'{width}.{fmt}'
+
+
+def variant_urls(digest: str) -> List[Dict[str, Any]]:
+    return [
+        {'width': width, 'format': fmt, 'url': f'{BLOB_URL_PREFIX}{digest}/{variant_name(width, fmt)}'}
+        for fmt in VARIANT_FORMATS for width in VARIANT_WIDTHS
+    ]
+
+
+def with_photo_url(photo: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Replace the `blob:<sha256>` reference stored for a photo by its URLs."""
+    if not photo:
+        return photo
+    photo = dict(photo)
+    for key, value in list(photo.items()):
+        digest = parse_ref(value)
+        if digest is not None:
+            del photo[key]
+            photo['url'] = blob_url(digest)
+            photo['variants'] = variant_urls(digest)
+    return photo
+
+
+def with_album_urls(album: Any) -> Any:
+    """Apply `with_photo_url` to every photo of an album."""
+    if isinstance(album, list):
+        return [with_photo_url(photo) for photo in album]
+    if isinstance(album, dict) and isinstance(album.get('photos'), list):
+        return dict(album, photos=[with_photo_url(photo) for photo in album['photos']])
+    return album
+
+
+def with_albums_urls(albums: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Apply `with_album_urls` to the albums of a `fetch_albums` batch."""
+    return [dict(album, album=with_album_urls(album['album'])) for album in albums]
+
+
+class BlobStore:
+    """Content-addressed files on local disk, keyed by their SHA-256.
+
+    Writes go to a temporary file first and are renamed into place, so a
+    blob is either complete or absent; storing the same bytes twice keeps
+    a single copy.
+    """
+
+    def __init__(self, root: os.PathLike):
+        self.root = Path(root)
+        (self.root / 'tmp').mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: str) -> bool:
+        return bool(DIGEST_RE.match(digest)) and self.path(digest).is_file()
+
+    @lru_cache(maxsize=4096)
+    def content_type(self, digest: str) -> Optional[str]:
+        with open(self.path(digest), 'rb') as f:
+            return sniff_image_type(f.read(16))
+
+    def _commit(self, tmp: Path, sha: 'hashlib._Hash') -> str:
+        digest = sha.hexdigest()
+        target = self.path(digest)
+        if target.exists():
+            tmp.unlink()
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, target)
+        return digest
+
+    async def put_part(self, part: BodyPartReader, max_size: int = MAX_PHOTO_SIZE) -> Tuple[str, int, Optional[str]]:
+        """Stream a multipart file part into the store.
+
+        Returns the digest, the size and the sniffed image type.
+        """
+        tmp = self.root / 'tmp' / uuid.uuid4().hex
+        sha = hashlib.sha256()
+        size = 0
+        head = b''
+        try:
+            async with aiofiles.open(tmp, 'wb') as f:
+                while True:
+                    chunk = await part.read_chunk(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise web.HTTPRequestEntityTooLarge(max_size=max_size, actual_size=size)
+                    if len(head) < 16:
+                        head += chunk[:16 - len(head)]
+                    sha.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return self._commit(tmp, sha), size, sniff_image_type(head)
+
+    async def put_bytes(self, data: bytes) -> Tuple[str, int, Optional[str]]:
+        tmp = self.root / 'tmp' / uuid.uuid4().hex
+        async with aiofiles.open(tmp, 'wb') as f:
+            await f.write(data)
+        return self._commit(tmp, hashlib.sha256(data)), len(data), sniff_image_type(data[:16])
+
+
+def decode_base64_photo(data: str) -> bytes:
+    # the legacy JSON upload, optionally as a `data:` URL
+    if data.startswith('data:') and ',' in data:
+        data = data.split(',', 1)[1]
+    try:
+        return base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise web.HTTPBadRequest(reason='图片数据不正确')
+
+
+@lru_cache(maxsize=None)
+def _etag(digest: str) -> str:
+    return f'"{digest}"'
+
+
+async def get_blob(request: web.Request) -> web.StreamResponse:
+    store: BlobStore = request.app['blobs']
+    digest = request.match_info['digest']
+    if not store.exists(digest):
+        raise web.HTTPNotFound()
+
+    etag = _etag(digest)
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers={'ETag': etag, 'Cache-Control': IMMUTABLE})
+
+    # FileResponse hands the file to the kernel with sendfile
+    return web.FileResponse(store.path(digest), headers={
+        'Content-Type': store.content_type(digest) or 'application/octet-stream',
+        'Cache-Control': IMMUTABLE,
+        'ETag': etag,
+    })
+
+
+async def _on_startup(app: web.Application):
+    store = BlobStore(app['config'].get('blobs', {}).get('root', DEFAULT_BLOB_ROOT))
+    app['blobs'] = store
+    for sub in app._subapps:
+        sub['blobs'] = store
+
+
+def setup(app: web.Application):
+    app.on_startup.append(_on_startup)
@@ -0,0 +1,182 @@
+import asyncio
+import csv
+import json
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from typing import IO, Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import psycopg2.extras
+from aiohttp import web
+from marshmallow import Schema, ValidationError
+
+logger = logging.getLogger('bulk')
+
+BULK_FORMATS = ('ndjson', 'csv')
+# rows sent to the staging table per statement
+BULK_CHUNK_ROWS = 2000
+MAX_BULK_ROWS = 500000
+# errors listed in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+# validated rows are kept in memory up to this size, then in a temp file
+SPOOL_MEMORY = 16 * 1024 ** 2
+
+
+def bulk_format(request: web.Request, bulk_format: Optional[str] = None) -> str:
+    if bulk_format:
+        return bulk_format
+    if request.content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    return 'ndjson'
+
+
+async def iter_records(request: web.Request, bulk_format: str) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (line number, record) from a streamed NDJSON or CSV body.
+
+    The body is consumed line by line as it arrives; CSV needs a header
+    line and does not support line breaks inside quoted values. A line
+    that cannot be decoded is yielded as a record holding only `None`
+    under the `_error` key.
+    """
+    header = None
+    line_no = 0
+    async for raw in request.content:
+        line_no += 1
+        if line_no == 1 and raw.startswith(b'\xef\xbb\xbf'):
+            raw = raw[3:]
+        try:
+            line = raw.decode('utf-8').rstrip('\r\n')
+        except UnicodeDecodeError:
+            yield line_no, {'_error': '不是 UTF-8 编码'}
+            continue
+        if not line.strip():
+            continue
+        if bulk_format == 'csv':
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [value.strip() for value in values]
+                continue
+            if len(values) != len(header):
+                yield line_no, {'_error': f'应有 {len(header)} 列, 实际 {len(values)} 列'}
+                continue
+            yield line_no, {key: value if value != '' else None for key, value in zip(header, values)}
+        else:
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield line_no, {'_error': f'JSON 格式不正确: {str(exc)}'}
+                continue
+            if not isinstance(record, dict):
+                yield line_no, {'_error': '每行应为一个 JSON 对象'}
+                continue
+            yield line_no, record
+
+
+class BulkReport:
+    def __init__(self):
+        self.rows = 0
+        self.staged = 0
+        self.error_count = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def add_error(self, line: Optional[int], reason: Any, **extra: Any):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(dict(extra, line=line, reason=reason))
+
+    def add_errors(self, errors: Optional[List[Dict[str, Any]]]):
+        for error in errors or []:
+            self.add_error(**error)
+
+    def to_json(self, **summary: Any) -> Dict[str, Any]:
+        return dict(summary, rows=self.rows, staged=self.staged, errorCount=self.error_count, errors=self.errors)
+
+
+async def iter_chunks(request: web.Request, bulk_format: str, schema: Schema, report: BulkReport,
+                      chunk_rows: int = BULK_CHUNK_ROWS) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Validate streamed records with `schema` and yield them in chunks.
+
+    Valid rows carry their line number under `line`; invalid ones go to
+    the report and are not staged.
+    """
+    chunk = []
+    async for line, record in iter_records(request, bulk_format):
+        report.rows += 1
+        if report.rows > MAX_BULK_ROWS:
+            raise web.HTTPRequestEntityTooLarge(max_size=MAX_BULK_ROWS, actual_size=report.rows)
+        if '_error' in record:
+            report.add_error(line, record['_error'])
+            continue
+        try:
+            row = schema.load(record)
+        except ValidationError as exc:
+            report.add_error(line, exc.messages)
+            continue
+        row['line'] = line
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            report.staged += len(chunk)
+            yield chunk
+            chunk = []
+    if chunk:
+        report.staged += len(chunk)
+        yield chunk
+
+
+async def spool_chunks(chunks: AsyncIterator[List[Dict[str, Any]]], spool: IO[bytes]):
+    """Write every chunk to `spool` as one JSON array per line.
+
+    Consumes the whole request body, so a slow or oversized upload fails
+    here, before a connection is taken from the pool.
+    """
+    loop = asyncio.get_event_loop()
+    async for chunk in chunks:
+        await loop.run_in_executor(None, spool.write, json.dumps(chunk, default=str).encode('utf-8') + b'\n')
+    spool.seek(0)
+
+
+async def stage_chunks(cur, table: str, spool: IO[bytes]):
+    """Load the spooled chunks into a staging table shaped like the rows.
+
+    aiopg runs psycopg2 in asynchronous mode, which does not support COPY,
+    so each chunk goes in as one JSON array expanded server side.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        payload = await loop.run_in_executor(None, spool.readline)
+        if not payload:
+            break
+        await cur.execute(f"INSERT INTO {table} SELECT * FROM json_populate_recordset(NULL::{table}, %s)",
+                          (payload.decode('utf-8'), ))
+
+
+@asynccontextmanager
+async def transaction(cur):
+    # aiopg connections are in autocommit mode, so the transaction is explicit
+    await cur.execute('BEGIN')
+    try:
+        yield cur
+    except BaseException:
+        await cur.execute('ROLLBACK')
+        raise
+    await cur.execute('COMMIT')
+
+
+async def ingest(pool, table: str, columns: str, chunks: AsyncIterator[List[Dict[str, Any]]], apply_sql: str, args: Tuple) -> Any:
+    """Stage `chunks` in a temporary `table` and apply them, in one transaction.
+
+    `columns` starts with `line integer`; `apply_sql` reads the staging
+    table and returns one value, usually a JSON summary. The chunks are
+    spooled first, so the connection and the transaction are only held
+    while the rows go to PostgreSQL, never while the client uploads.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY) as spool:
+        await spool_chunks(chunks, spool)
+        async with pool.acquire() as conn:
+            async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                async with transaction(cur):
+                    await cur.execute(f"CREATE TEMP TABLE {table} ({columns}) ON COMMIT DROP")
+                    await stage_chunks(cur, table, spool)
+                    await cur.execute(apply_sql, args)
+                    result = await cur.fetchone()
+                    return result[0] if result else None
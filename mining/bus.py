@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import random
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger('bus')
+
+CHANNEL = 'yj_cache_invalidation'
+
+# a LISTEN connection that has been quiet for this long is probed with a
+# round trip, so a dead socket is noticed even when nobody is publishing
+HEARTBEAT_INTERVAL = 30
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 30
+
+_Callback = Callable[[Dict[str, Any]], Optional[Awaitable[None]]]
+
+
+class InvalidationBus:
+    """Cross-worker invalidation bus on PostgreSQL LISTEN/NOTIFY.
+
+    Every worker keeps one dedicated connection from the `Database` pool in
+    LISTEN mode. Cache invalidations made locally are published on
+    `CHANNEL` and replayed into the caches of the other workers. Messages
+    missed while the listener was disconnected cannot be recovered, so the
+    caches are flushed entirely after every reconnect.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.origin = uuid.uuid4().hex
+        self._subscribers: Dict[str, List[_Callback]] = {}
+        self._resync_callbacks: List[Callable[[], Optional[Awaitable[None]]]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._pending = set()
+        self._delay = RECONNECT_MIN_DELAY
+        self.connected = False
+        self.reconnects = 0
+        self.received = 0
+        self.published = 0
+
+    def subscribe(self, kind: str, callback: _Callback):
+        self._subscribers.setdefault(kind, []).append(callback)
+
+    def on_resync(self, callback: Callable[[], Optional[Awaitable[None]]]):
+        self._resync_callbacks.append(callback)
+
+    def publish(self, kind: str, data: Dict[str, Any]):
+        payload = json.dumps(dict(data, kind=kind, origin=self.origin))
+        task = asyncio.ensure_future(self._notify(payload))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def publish_invalidation(self, namespace: str, scope: Optional[Hashable]):
+        self.publish('cache', {'namespace': namespace, 'scope': scope})
+
+    async def _notify(self, payload: str):
+        try:
+            async with self.db.db.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+            self.published += 1
+        except Exception as exc:
+            logger.error(f"""Publish invalidation failed, reason: {str(exc)}""")
+
+    async def _dispatch(self, payload: str):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning(f"""Ignore malformed notification: {payload}""")
+            return
+
+        if message.get('origin') == self.origin:
+            return
+
+        self.received += 1
+        if message.get('kind') == 'cache':
+            self.db.cache.invalidate(message['namespace'], message.get('scope'), propagate=False)
+
+        for callback in self._subscribers.get(message.get('kind'), []):
+            try:
+                result = callback(message)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as exc:
+                logger.error(f"""Notification handler failed, reason: {str(exc)}""")
+
+    async def _resync(self):
+        self.db.cache.clear()
+        for callback in self._resync_callbacks:
+            try:
+                result = callback()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as exc:
+                logger.error(f"""Resync handler failed, reason: {str(exc)}""")
+
+    async def _listen_once(self):
+        conn = await self.db.db.acquire()
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute(f"LISTEN {CHANNEL}")
+            self.connected = True
+            self._delay = RECONNECT_MIN_DELAY
+            if self.reconnects:
+                logger.warning('Invalidation listener reconnected, flush local caches')
+                await self._resync()
+
+            while True:
+                try:
+                    notify = await asyncio.wait_for(conn.notifies.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    async with conn.cursor() as cur:
+                        await cur.execute("SELECT 1")
+                    continue
+                await self._dispatch(notify.payload)
+        finally:
+            self.connected = False
+            conn.close()
+            await self.db.db.release(conn)
+
+    async def run(self):
+        while True:
+            try:
+                await self._listen_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.error(f"""Invalidation listener lost, reason: {str(exc)}""")
+            self.reconnects += 1
+            await asyncio.sleep(self._delay + random.uniform(0, self._delay))
+            self._delay = min(self._delay * 2, RECONNECT_MAX_DELAY)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+async def _on_startup(app: web.Application):
+    bus = InvalidationBus(app['db'])
+    app['db'].cache.add_listener(bus.publish_invalidation)
+    bus.start()
+    app['bus'] = bus
+    for sub in app._subapps:
+        sub['bus'] = bus
+
+
+async def _on_shutdown(app: web.Application):
+    # must release the LISTEN connection before the pool is closed on cleanup
+    await app['bus'].stop()
+
+
+def setup(app: web.Application):
+    app.on_startup.append(_on_startup)
+    app.on_shutdown.append(_on_shutdown)
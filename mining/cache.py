@@ -0,0 +1,164 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from mining.utils import make_etag
+
+logger = logging.getLogger('cache')
+
+# seconds an entry may be served before it is re-read from PostgreSQL, even
+# without an explicit invalidation from an admin mutation
+DEFAULT_TTLS = {
+    'notices': 60,
+    'products': 30,
+    'agreement': 600,
+    'agreements': 600,
+    'app_release': 300,
+    'platform': 300,
+    'flashes': 60,
+}
+# entries kept per worker; per-customer keys (notices, flashes) would
+# otherwise grow with the number of customers
+MAX_ENTRIES = 20000
+# expired entries are swept at most this often, on the next store
+SWEEP_INTERVAL = 60
+
+
+class CacheEntry:
+    __slots__ = ('value', 'expires_at', '_body', '_etag')
+
+    def __init__(self, value: Any, expires_at: float):
+        self.value = value
+        self.expires_at = expires_at
+        self._body = None
+        self._etag = None
+
+    @property
+    def body(self) -> bytes:
+        # serialized exactly like `web.json_response` so the ETag matches the
+        # one the conditional middleware would compute for the same payload
+        if self._body is None:
+            self._body = json.dumps(self.value).encode('utf-8')
+        return self._body
+
+    @property
+    def etag(self) -> str:
+        if self._etag is None:
+            self._etag = make_etag(self.body)
+        return self._etag
+
+
+class Cache:
+    """In-process read-through cache for platform-wide reference data.
+
+    Entries are keyed by `(namespace, scope, version, *key)` where `scope` is
+    usually the platform id. Invalidating a scope bumps its version so every
+    entry derived from it (e.g. each customer's notice list of a platform)
+    becomes unreachable at once; invalidating with `scope=None` drops the whole
+    namespace. At most `size` entries are kept, least recently used first
+    out, and expired ones are swept periodically.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, int]] = None, size: int = MAX_ENTRIES):
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.size = size
+        self._entries: 'OrderedDict[Tuple, CacheEntry]' = OrderedDict()
+        self._swept_at = time.monotonic()
+        self._versions: Dict[Tuple[str, Hashable], int] = {}
+        self._generations: Dict[str, int] = {}
+        self._listeners = []
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.invalidations: Dict[str, int] = {}
+
+    def add_listener(self, listener: Callable[[str, Optional[Hashable]], None]):
+        self._listeners.append(listener)
+
+    def _key(self, namespace: str, scope: Hashable, key: Tuple) -> Tuple:
+        return (namespace, self._generations.get(namespace, 0), scope, self._versions.get((namespace, scope), 0)) + key
+
+    def entry(self, namespace: str, scope: Hashable, *key: Hashable) -> Optional[CacheEntry]:
+        k = self._key(namespace, scope, key)
+        entry = self._entries.get(k)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            del self._entries[k]
+            return None
+        self._entries.move_to_end(k)
+        return entry
+
+    def _store(self, k: Tuple, entry: CacheEntry):
+        now = time.monotonic()
+        if now - self._swept_at > SWEEP_INTERVAL:
+            self._swept_at = now
+            for stale in [key for key, e in self._entries.items() if e.expires_at < now]:
+                del self._entries[stale]
+        self._entries[k] = entry
+        self._entries.move_to_end(k)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    async def load_entry(self, namespace: str, scope: Hashable, key: Tuple, loader: Callable[[], Awaitable[Any]]) -> Optional[CacheEntry]:
+        entry = self.entry(namespace, scope, *key)
+        if entry is not None:
+            self.hits[namespace] = self.hits.get(namespace, 0) + 1
+            return entry
+
+        self.misses[namespace] = self.misses.get(namespace, 0) + 1
+        # resolve the key before loading so an invalidation racing the load
+        # stores the stale value under the superseded version
+        k = self._key(namespace, scope, key)
+        value = await loader()
+        if value is None:
+            return None
+        entry = CacheEntry(value, time.monotonic() + self.ttls.get(namespace, 60))
+        self._store(k, entry)
+        return entry
+
+    async def get_or_load(self, namespace: str, scope: Hashable, key: Tuple, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = await self.load_entry(namespace, scope, key, loader)
+        return entry.value if entry is not None else None
+
+    def discard(self, namespace: str, scope: Hashable, *key: Hashable):
+        self._entries.pop(self._key(namespace, scope, key), None)
+
+    def invalidate(self, namespace: str, scope: Optional[Hashable] = None, propagate: bool = True):
+        self.invalidations[namespace] = self.invalidations.get(namespace, 0) + 1
+        if scope is None:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            stale = [k for k in self._entries if k[0] == namespace]
+        else:
+            self._versions[(namespace, scope)] = self._versions.get((namespace, scope), 0) + 1
+            stale = [k for k in self._entries if k[0] == namespace and k[2] == scope]
+        for k in stale:
+            self._entries.pop(k, None)
+
+        if propagate:
+            for listener in self._listeners:
+                try:
+                    listener(namespace, scope)
+                except Exception as exc:
+                    logger.error(f"""Cache invalidation listener failed, reason: {str(exc)}""")
+
+    def clear(self):
+        for namespace in set(k[0] for k in self._entries) | set(self.ttls):
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        namespaces = sorted(set(self.ttls) | set(self.hits) | set(self.misses))
+        return {
+            'size': len(self._entries),
+            'maxSize': self.size,
+            'namespaces': {
+                ns: {
+                    'hits': self.hits.get(ns, 0),
+                    'misses': self.misses.get(ns, 0),
+                    'invalidations': self.invalidations.get(ns, 0),
+                    'ttl': self.ttls.get(ns),
+                } for ns in namespaces
+            },
+        }
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+from mining.units import DEFAULT_LOCALE, convert_many, formatter
+
+HEADERS = {
+    'USER-AGENT': 'Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/40.0.2214.85 Safari/537.36',
+}
+
+# every key may be overridden from the optional `crawler` section of the
+# config file, e.g. to point the sources at a mirror or a local fake server
+DEFAULT_CONFIG = {
+    'filscan_url': 'https://api.filscan.io:8700/rpc/v1',
+    'coingecko_url': 'https://api.coingecko.com/api/v3/simple/price?ids=binance-peg-filecoin&vs_currencies=usd',
+    'timeout': 10,
+    'retries': 2,
+    'backoff': 0.5,
+    'breaker_threshold': 3,
+    'breaker_reset': 300,
+}
+
+logger = logging.getLogger('crawler')
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling a source after `threshold` consecutive failed runs.
+
+    Once `reset_timeout` seconds have passed a single trial call is let
+    through; its outcome closes the breaker again or restarts the wait.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # a half-open trial call is in flight, the others are turned away
+        self.trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'open' or self.trial:
+            return False
+        self.trial = True
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def failure(self):
+        self.trial = False
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+_Fetch = Callable[[aiohttp.ClientSession, str], Awaitable[Dict[str, Any]]]
+
+
+class Source:
+    def __init__(self, name: str, url: str, fetch: _Fetch, config: Dict[str, Any]):
+        self.name = name
+        self.url = url
+        self.fetch = fetch
+        self.timeout = config['timeout']
+        self.retries = config['retries']
+        self.backoff = config['backoff']
+        self.breaker = CircuitBreaker(config['breaker_threshold'], config['breaker_reset'])
+        self.last_error: Optional[str] = None
+        self.last_success: Optional[float] = None
+
+    async def run(self, session: aiohttp.ClientSession) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            raise CircuitOpen(f'circuit open for {self.name}')
+
+        try:
+            fields = await self._attempts(session)
+        except asyncio.CancelledError:
+            # no outcome, the next call may be the trial instead
+            self.breaker.trial = False
+            raise
+        except Exception:
+            self.breaker.failure()
+            raise
+        self.breaker.success()
+        return fields
+
+    async def _attempts(self, session: aiohttp.ClientSession) -> Dict[str, Any]:
+        for attempt in range(self.retries + 1):
+            try:
+                fields = await asyncio.wait_for(self.fetch(session, self.url), timeout=self.timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.last_error = str(exc) or exc.__class__.__name__
+                if attempt < self.retries:
+                    # full jitter keeps the workers from retrying in lockstep
+                    await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                continue
+            self.last_error = None
+            self.last_success = time.time()
+            return fields
+
+        raise RuntimeError(self.last_error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.breaker.state,
+            'failures': self.breaker.failures,
+            'lastError': self.last_error,
+            'lastSuccess': self.last_success,
+        }
+
+
+# filscan field -> raw kind: power in bytes, FIL/TiB figures in attoFIL/TiB
+FILSCAN_FIELDS = {
+    'total_quality_power': 'bytes',
+    'power_increase_24h': 'bytes',
+    'fil_per_tera': 'atto',
+    'pledge_per_tera': 'atto',
+    'gas_in_32g': 'atto',
+    'gas_in_64g': 'atto',
+    'add_power_in_32g': 'atto',
+    'add_power_in_64g': 'atto',
+}
+
+# display field -> (raw field, unit, decimal places)
+NETWORK_INFO_FORMATS = {
+    'filPrice': ('fil_price_usd', 'USD', None),
+    'networkStoragePower': ('total_quality_power', 'EiB', 4),
+    'latest24hPowerGrowth': ('power_increase_24h', 'PiB', 4),
+    'latest24hEfficiencny': ('fil_per_tera', 'FIL/TiB', 4),
+    'sectorInitialPledge': ('pledge_per_tera', 'FIL/TiB', 4),
+    'gasUsedOf32GSector': ('gas_in_32g', 'FIL/TiB', 4),
+    'gasUsedOf64GSector': ('gas_in_64g', 'FIL/TiB', 4),
+    'costOfSeal32GSector': ('add_power_in_32g', 'FIL/TiB', 4),
+    'costOfSeal64GSector': ('add_power_in_64g', 'FIL/TiB', 4),
+}
+
+
+def _convert(source: str, values: Dict[str, Any], kinds: Dict[str, str]) -> Dict[str, Any]:
+    # a single missing or malformed field must not discard its siblings
+    fields, errors = convert_many(values, kinds)
+    for name, reason in errors.items():
+        logger.warning(f"""Skip {source} field `{name}`, reason: {reason}""")
+    return fields
+
+
+async def fetch_filscan(session: aiohttp.ClientSession, url: str) -> Dict[str, Any]:
+    payload = {"id": 1, "jsonrpc": "2.0", "method": 'filscan.StatChainInfo'}
+    async with session.post(url, data=json.dumps(payload).encode("utf-8")) as response:
+        response.raise_for_status()
+        res = await response.json(content_type=None)
+
+    data = (res.get('result') or {}).get('data')
+    if not data:
+        raise ValueError('empty filscan result')
+    return _convert('filscan', data, FILSCAN_FIELDS)
+
+
+async def fetch_coingecko(session: aiohttp.ClientSession, url: str) -> Dict[str, Any]:
+    async with session.get(url) as response:
+        response.raise_for_status()
+        res = await response.json(content_type=None)
+
+    price = (res.get('binance-peg-filecoin') or {}).get('usd')
+    return _convert('coingecko', {'fil_price_usd': price}, {'fil_price_usd': 'decimal'})
+
+
+def format_network_info(sample: Dict[str, Any], locale: str = DEFAULT_LOCALE) -> Dict[str, str]:
+    """Render a raw sample into the display strings of `/filecoin/network`."""
+    return {
+        name: formatter(unit, places, locale)(sample[field])
+        for name, (field, unit, places) in NETWORK_INFO_FORMATS.items()
+        if sample.get(field) is not None
+    }
+
+
+class Crawler:
+    """Fetches every source concurrently over one shared client session.
+
+    Sources return raw values (see `mining.units`) keyed by the filscan
+    field names.
+    Fields are merged one by one over the last known good values, so a
+    source that is down, or a field it stopped reporting, keeps its previous
+    value instead of blanking the whole network info.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.sources: List[Source] = [
+            Source('filscan', self.config['filscan_url'], fetch_filscan, self.config),
+            Source('coingecko', self.config['coingecko_url'], fetch_coingecko, self.config),
+        ]
+        self.last_good: Dict[str, Any] = {}
+        # only the fields actually fetched by the latest crawl
+        self.fresh: Dict[str, Any] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            headers=HEADERS,
+            connector=aiohttp.TCPConnector(limit_per_host=4, ttl_dns_cache=300),
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def crawl(self) -> Optional[Dict[str, Any]]:
+        """Return the merged raw sample, or None when no source produced a field."""
+        results = await asyncio.gather(*(source.run(self.session) for source in self.sources), return_exceptions=True)
+
+        merged: Dict[str, Any] = {}
+        for source, result in zip(self.sources, results):
+            if isinstance(result, CircuitOpen):
+                logger.info(f"""Skip source `{source.name}`, circuit is open""")
+            elif isinstance(result, BaseException):
+                logger.error(f"""Crawl source `{source.name}` failed, reason: {str(result)}""")
+            else:
+                merged.update(result)
+
+        self.fresh = merged
+        if not merged:
+            return None
+        self.last_good.update(merged)
+        return dict(self.last_good)
+
+    def stats(self) -> Dict[str, Any]:
+        return {source.name: source.stats() for source in self.sources}
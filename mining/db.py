@@ -1,26 +1,42 @@
 import io
 import json
+import logging
 import time
-from datetime import date
-from typing import Any, Dict, List, Optional, Tuple
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 import psycopg2
 import psycopg2.extras
 from aiopg import create_pool, Pool
 from aiohttp import web
 from decimal import *
 
+from mining.bulk import ingest
+from mining.cache import Cache, CacheEntry
+from mining.export import iter_cursor
+from mining.metrics import TimedPool
+from mining.pagination import keyset_call
+
+logger = logging.getLogger('db')
+
+# materialized statistics older than this are recomputed on read, which
+# bounds how stale they get after mutations that do not touch them, e.g.
+# fixes made directly in PostgreSQL
+STATISTICS_MAX_AGE = 10 * 60
+
 
 class Database:
     def __init__(self, db: Pool):
         self.db = db
-        self.customer = self.Customer(self.db)
-        self.platform = self.Platform(self.db)
+        self.cache = Cache()
+        self.statistics = self.Statistics(self.db)
+        self.customer = self.Customer(self.db, self.cache, self.statistics)
+        self.platform = self.Platform(self.db, self.cache, self.statistics)
 
     @classmethod
     async def create(cls, app):
         dsn = f"""dbname={app['config']['postgres']['database']} host={app['config']['postgres']['host']} port={app['config']['postgres']['port']}"""
         # dsn = f"""dbname={app['config']['postgres']['database']} user={app['config']['postgres']['user']}  password={app['config']['postgres']['password']} host={app['config']['postgres']['host']} port={app['config']['postgres']['port']}"""
-        return cls(await create_pool(dsn))
+        return cls(TimedPool(await create_pool(dsn)))
 
     async def close(self, *args):
         self.db.close()
@@ -38,6 +54,99 @@ class Database:
                 result = await cur.fetchone()
                 return result['o_network_info'] if result else None
 
+    async def add_filecoin_network_sample(self, sample: Dict[str, Any]):
+        async with self.db.acquire() as conn:
+            async with conn.cursor() as cur:
+                # numeric values travel as strings so no precision is lost to float
+                await cur.execute("SELECT yj_add_filecoin_network_sample(%s)", (json.dumps(sample, default=str), ))
+
+    async def get_filecoin_network_history(self, from_at: datetime, to_at: datetime, step: str) -> List[Dict[str, Any]]:
+        async with self.db.acquire() as conn:
+            async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                await cur.execute("SELECT yj_get_filecoin_network_history(%s, %s, %s) as o_history", (from_at, to_at, step))
+                result = await cur.fetchone()
+                return result['o_history'] if result else []
+
+    async def add_currency_price(self, base: str, counter: str, price: Decimal, source: str, quoted_at: datetime):
+        async with self.db.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT yj_add_currency_price(%s, %s, %s, %s, %s)", (base, counter, price, source, quoted_at))
+
+    async def get_latest_currency_prices(self) -> List[Dict[str, Any]]:
+        async with self.db.acquire() as conn:
+            async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                await cur.execute("SELECT yj_get_latest_currency_prices() as o_prices")
+                result = await cur.fetchone()
+                return result['o_prices'] if result else []
+
+    async def get_currency_price_at(self, base: str, counter: str, at: datetime) -> Optional[Decimal]:
+        async with self.db.acquire() as conn:
+            async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                await cur.execute("SELECT yj_get_currency_price_at(%s, %s, %s) as o_price", (base, counter, at))
+                result = await cur.fetchone()
+                return result['o_price'] if result else None
+
+    async def try_claim_job(self, name: str, owner: str, interval: int, lease: int) -> bool:
+        async with self.db.acquire() as conn:
+            async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                await cur.execute("SELECT yj_job_try_claim(%s, %s, %s, %s) as o_claimed", (name, owner, interval, lease))
+                result = await cur.fetchone()
+                return bool(result and result['o_claimed'])
+
+    async def finish_job(self, name: str, owner: str, duration: float, error: Optional[str] = None):
+        async with self.db.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT yj_job_finish(%s, %s, %s, %s)", (name, owner, duration, error))
+
+    async def fetch_job_list(self) -> List[Dict[str, Any]]:
+        async with self.db.acquire() as conn:
+            async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                await cur.execute("SELECT yj_job_fetch_list() as o_jobs")
+                result = await cur.fetchone()
+                return result['o_jobs'] if result else []
+
+    async def begin_idempotency_key(self, key: str, fingerprint: str, ttl: int, lease: int) -> Dict[str, Any]:
+        async with self.db.acquire() as conn:
+            async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                await cur.execute("SELECT * FROM yj_idempotency_begin(%s, %s, %s, %s)", (key, fingerprint, ttl, lease))
+                result = await cur.fetchone()
+                return dict(result)
+
+    async def finish_idempotency_key(self, key: str, status: int, content_type: str, body: bytes):
+        async with self.db.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT yj_idempotency_finish(%s, %s, %s, %s)", (key, status, content_type, psycopg2.Binary(body)))
+
+    async def abandon_idempotency_key(self, key: str):
+        async with self.db.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT yj_idempotency_abandon(%s)", (key, ))
+
+    async def release_idempotency_key(self, key: str):
+        async with self.db.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT yj_idempotency_release(%s)", (key, ))
+
+    async def cleanup_idempotency_keys(self) -> int:
+        async with self.db.acquire() as conn:
+            async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                await cur.execute("SELECT yj_idempotency_cleanup() as o_deleted")
+                result = await cur.fetchone()
+                return result['o_deleted'] if result else 0
+
+    async def fail_settlement_checkpoint(self, platform_id: int, settle_day: date, owner: str, attempts: int, duration: float, error: str):
+        async with self.db.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT yj_settlement_checkpoint_fail(%s, %s, %s, %s, %s, %s)",
+                                  (platform_id, settle_day, owner, attempts, duration, error))
+
+    async def fetch_settlement_checkpoint_list(self, settle_day: date) -> List[Dict[str, Any]]:
+        async with self.db.acquire() as conn:
+            async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                await cur.execute("SELECT yj_settlement_checkpoint_fetch_list(%s) as o_checkpoints", (settle_day, ))
+                result = await cur.fetchone()
+                return result['o_checkpoints'] if result else []
+
     async def get_filecoin_mining_efficiency(self, day_at: date) -> Optional[Dict[str, Any]]:
         async with self.db.acquire() as conn:
             async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
@@ -76,10 +185,52 @@ class Database:
             async with conn.cursor() as cur:
                 await cur.execute("SELECT yj_save_session(%s, %s, %s, %s, to_timestamp(%s))", (id, is_customer, user_id, session, int(time.time() + max_age)))
 
-    class Customer:
+    class Statistics:
+        """Materialized revenue statistics, see sql/statistics.sql."""
+
         def __init__(self, db: Pool):
             self.db = db
 
+        async def _get(self, kind: str, key: int, platform_id: Optional[int] = None) -> Any:
+            async with self.db.acquire() as conn:
+                async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                    await cur.execute("select yj_statistics_get(%s, %s, %s, %s) as o_statistics", (kind, key, platform_id, STATISTICS_MAX_AGE))
+                    result = await cur.fetchone()
+                    return result['o_statistics'] if result else None
+
+        async def get_customer_revenue(self, customer_id: int, platform_id: Optional[int] = None) -> List[Dict[str, Any]]:
+            return await self._get('customer_revenue', customer_id, platform_id)
+
+        async def get_platform(self, platform_id: int) -> Dict[str, Any]:
+            return await self._get('platform', platform_id, platform_id)
+
+        async def get_owner(self) -> List[Dict[str, Any]]:
+            return await self._get('owner', 0)
+
+        async def touch(self, platform_id: Optional[int] = None, customer_id: Optional[int] = None):
+            # only marks the affected rows stale, they are recomputed on their
+            # next read; if this fails the rows still expire after
+            # STATISTICS_MAX_AGE
+            try:
+                async with self.db.acquire() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute("select yj_statistics_touch(%s, %s)", (platform_id, customer_id))
+            except Exception as exc:
+                logger.error(f"""Refresh statistics of platform {platform_id} customer {customer_id} failed, reason: {str(exc)}""")
+
+        async def rebuild(self) -> int:
+            async with self.db.acquire() as conn:
+                async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                    await cur.execute("select yj_statistics_rebuild() as o_rows")
+                    result = await cur.fetchone()
+                    return result['o_rows']
+
+    class Customer:
+        def __init__(self, db: Pool, cache: Cache, statistics: 'Database.Statistics'):
+            self.db = db
+            self.cache = cache
+            self.statistics = statistics
+
         async def mobile_signin(self, mobile: str, nick_name: Optional[str] = None, referral_code: Optional[str] = None) -> Optional[Tuple[int, int, bool]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
@@ -127,6 +278,9 @@ class Database:
                     return result['o_profile']
 
         async def get_latest_app_release(self, platform: str) -> Optional[Dict[str, any]]:
+            return await self.cache.get_or_load('app_release', platform, (), lambda: self._get_latest_app_release(platform))
+
+        async def _get_latest_app_release(self, platform: str) -> Optional[Dict[str, any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_release from yj_get_latest_app_release(%s)", (platform,))
@@ -134,6 +288,12 @@ class Database:
                     return result['o_release']
 
         async def get_fetch_notice_list(self, platform_id: int, customer_id: int) -> Optional[List[Dict[str, Any]]]:
+            return await self.cache.get_or_load('notices', platform_id, (customer_id,), lambda: self._get_fetch_notice_list(platform_id, customer_id))
+
+        async def get_fetch_notice_list_entry(self, platform_id: int, customer_id: int) -> Optional[CacheEntry]:
+            return await self.cache.load_entry('notices', platform_id, (customer_id,), lambda: self._get_fetch_notice_list(platform_id, customer_id))
+
+        async def _get_fetch_notice_list(self, platform_id: int, customer_id: int) -> Optional[List[Dict[str, Any]]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_notice_list from yj_customer_fetch_notice_list(%s, %s)", (platform_id, customer_id))
@@ -148,13 +308,26 @@ class Database:
                     return result['o_notice'] if result else None
 
         async def get_agreement(self, agreement_id: int) -> Optional[Dict[str, Any]]:
+            return await self.cache.get_or_load('agreement', agreement_id, (), lambda: self._get_agreement(agreement_id))
+
+        async def _get_agreement(self, agreement_id: int) -> Optional[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_agreement from yj_get_agreement(%s)", (agreement_id,))
                     result = await cur.fetchone()
                     return result['o_agreement'] if result else None
 
+        async def fetch_albums(self, platform_id: int, ids: List[int]) -> List[Dict[str, Any]]:
+            async with self.db.acquire() as conn:
+                async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                    await cur.execute("select yj_fetch_albums(%s, %s::integer[]) as o_albums", (platform_id, ids))
+                    result = await cur.fetchone()
+                    return result['o_albums'] if result else []
+
         async def get_product_list(self, platform_id: int) -> Optional[List[Dict[str, Any]]]:
+            return await self.cache.get_or_load('products', platform_id, (), lambda: self._get_product_list(platform_id))
+
+        async def _get_product_list(self, platform_id: int) -> Optional[List[Dict[str, Any]]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_product_list from yj_customer_fetch_product_list(%s)", (platform_id,))
@@ -168,12 +341,23 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_product'] if result else None
 
-        async def purchase_product(self, product_id: int, customer_id: int, qty: int, comment: Optional[str] = None) -> int:
+        async def purchase_products(self, product_id: int, purchases: List[Dict[str, Any]], platform_id: int) -> List[Tuple[int, Optional[Dict[str, Any]]]]:
+            # purchases are {'customerId', 'qty', 'comment'}; results come back in the same order
             async with self.db.acquire() as conn:
-                async with conn.cursor() as cur:
-                    await cur.execute("select yj_customer_product_purchase(%s, %s, %s, %s)", (product_id, customer_id, qty, comment))
+                async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                    await cur.execute("select o_position, o_order_id, o_order from yj_customer_product_purchase_batch(%s, %s)", (product_id, json.dumps(purchases)))
+                    rows = await cur.fetchall()
+            if any(row['o_order_id'] > 0 for row in rows):
+                # the product list shows the stock left
+                self.cache.invalidate('products', platform_id)
+            return [(row['o_order_id'], row['o_order']) for row in sorted(rows, key=lambda row: row['o_position'])]
+
+        async def get_product_available_qty(self, product_id: int) -> Optional[int]:
+            async with self.db.acquire() as conn:
+                async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                    await cur.execute("select yj_product_available_qty(%s) as o_qty", (product_id, ))
                     result = await cur.fetchone()
-                    return result[0]
+                    return result['o_qty'] if result else None
 
         async def get_order(self, order_id: int) -> Optional[Dict[str, Any]]:
             async with self.db.acquire() as conn:
@@ -182,10 +366,10 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_order'] if result else None
 
-        async def get_order_list(self, customer_id: int) -> List[Dict[str, Any]]:
+        async def get_order_list(self, customer_id: int, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_order_list from yj_customer_fetch_order_list(%s)", (customer_id, ))
+                    await cur.execute(*keyset_call('yj_customer_fetch_order_list', 'o_order_list', (customer_id, ), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_order_list']
 
@@ -201,10 +385,10 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_seal_cost'] if result else None
 
-        async def get_filecoin_seal_cost_payment_list(self, customer_id: int, order_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        async def get_filecoin_seal_cost_payment_list(self, customer_id: int, order_id: Optional[int] = None, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_payment_list from yj_customer_fetch_filecoin_seal_cost_payment_list(%s, %s)", (customer_id, order_id,))
+                    await cur.execute(*keyset_call('yj_customer_fetch_filecoin_seal_cost_payment_list', 'o_payment_list', (customer_id, order_id), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_payment_list'] if result else None
 
@@ -213,37 +397,40 @@ class Database:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_withdraw_id from yj_customer_filecoin_withdraw_apply(%s, %s, %s)", (platform_id, customer_id, amount))
                     result = await cur.fetchone()
-                    return result['o_withdraw_id']
+            await self.statistics.touch(platform_id=platform_id, customer_id=customer_id)
+            return result['o_withdraw_id']
 
-        async def get_filecoin_withdraw_list(self, customer_id: int, state: Optional[str] = None) -> List[Dict[str, Any]]:
+        async def get_filecoin_withdraw_list(self, customer_id: int, state: Optional[str] = None, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_withdraw_list from yj_customer_fetch_filecoin_withdraw_list(%s, %s)", (customer_id, state))
+                    await cur.execute(*keyset_call('yj_customer_fetch_filecoin_withdraw_list', 'o_withdraw_list', (customer_id, state), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_withdraw_list']
 
-        async def get_filecoin_settlement_list(self, customer_id: int) -> List[Dict[str, Any]]:
+        async def get_filecoin_settlement_list(self, customer_id: int, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_settlement_list from yj_filecoin_customer_settlement_fetch_list(%s)", (customer_id,))
+                    await cur.execute(*keyset_call('yj_filecoin_customer_settlement_fetch_list', 'o_settlement_list', (customer_id, ), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_settlement_list']
 
-        async def get_filecoin_settlement_referrer_list(self, customer_id: int) -> List[Dict[str, Any]]:
+        async def get_filecoin_settlement_referrer_list(self, customer_id: int, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_settlement_list from yj_filecoin_customer_settlement_fetch_referrer_list(%s)", (customer_id,))
+                    await cur.execute(*keyset_call('yj_filecoin_customer_settlement_fetch_referrer_list', 'o_settlement_list', (customer_id, ), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_settlement_list']
 
-        async def get_filecoin_revenue_statitics(self, customer_id: int) -> List[Dict[str, Any]]:
-            async with self.db.acquire() as conn:
-                async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_revenue_statitics from yj_customer_filecoin_revenue_statitics(%s)", (customer_id,))
-                    result = await cur.fetchone()
-                    return result['o_revenue_statitics']
+        async def get_filecoin_revenue_statitics(self, customer_id: int, platform_id: Optional[int] = None) -> List[Dict[str, Any]]:
+            return await self.statistics.get_customer_revenue(customer_id, platform_id)
 
         async def get_fetch_flash_list(self, platform_id: int, customer_id: int) -> Optional[List[Dict[str, Any]]]:
+            return await self.cache.get_or_load('flashes', platform_id, (customer_id,), lambda: self._get_fetch_flash_list(platform_id, customer_id))
+
+        async def get_fetch_flash_list_entry(self, platform_id: int, customer_id: int) -> Optional[CacheEntry]:
+            return await self.cache.load_entry('flashes', platform_id, (customer_id,), lambda: self._get_fetch_flash_list(platform_id, customer_id))
+
+        async def _get_fetch_flash_list(self, platform_id: int, customer_id: int) -> Optional[List[Dict[str, Any]]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_flash_list from yj_customer_fetch_flash_list(%s, %s)", (platform_id, customer_id))
@@ -257,10 +444,12 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_flash'] if result else None
 
-        async def flash_confirm_read(self, customer_id: int, flash_id: int):
+        async def flash_confirm_read(self, customer_id: int, flash_id: int, platform_id: Optional[int] = None):
             async with self.db.acquire() as conn:
                 async with conn.cursor() as cur:
                     await cur.execute("select yj_customer_flash_read(%s, %s)", (customer_id, flash_id))
+            if platform_id is not None:
+                self.cache.discard('flashes', platform_id, customer_id)
 
         async def edit_customer_independent_node(self, id: int, withdrawn_address: str):
             async with self.db.acquire() as conn:
@@ -272,7 +461,8 @@ class Database:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_withdraw_id from yj_customer_independent_node_withdraw_apply(%s, %s, %s)", (customer_id, amount, node_id))
                     result = await cur.fetchone()
-                    return result['o_withdraw_id']
+            await self.statistics.touch(customer_id=customer_id)
+            return result['o_withdraw_id']
 
         async def get_customer_independent_node_list(self, customer_id: int, state: str) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
@@ -281,16 +471,18 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_customer_node_list'] if result else None
 
-        async def get_customer_expense_list(self, customer_id: int, filter_by: str, filter: str) -> List[Dict[str, Any]]:
+        async def get_customer_expense_list(self, customer_id: int, filter_by: str, filter: str, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_customer_expense_list from get_customer_filcoin_expense_list(%s,%s,%s)", (customer_id, filter_by, filter))
+                    await cur.execute(*keyset_call('get_customer_filcoin_expense_list', 'o_customer_expense_list', (customer_id, filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_customer_expense_list'] if result else None
 
     class Platform:
-        def __init__(self, db: Pool):
+        def __init__(self, db: Pool, cache: Cache, statistics: 'Database.Statistics'):
             self.db = db
+            self.cache = cache
+            self.statistics = statistics
 
         async def mobile_signin(self, mobile: str) -> Tuple[int, Dict[str, Any]]:
             async with self.db.acquire() as conn:
@@ -310,21 +502,25 @@ class Database:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_create_app_release(%s, %s, %s, %s, %s)", (version, platform, release_notes, download_url, comment))
+            self.cache.invalidate('app_release')
 
         async def owner_edit_app_release(self, id: int, version: str, platform: str, release_notes: str, download_url: str, comment: str):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_edit_app_release(%s, %s, %s, %s, %s, %s)", (id, version, platform, release_notes, download_url, comment))
+            self.cache.invalidate('app_release')
 
         async def owner_app_release_publish(self, id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_publish_app_release(%s)", (id, ))
+            self.cache.invalidate('app_release')
 
         async def owner_app_release_revoke(self, id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_revoke_published_app_release(%s)", (id, ))
+            self.cache.invalidate('app_release')
 
         async def owner_upload_android_release_apk(self, release_id: int, file_name: str, file: io.BufferedReader):
             async with self.db.acquire() as conn:
@@ -347,6 +543,7 @@ class Database:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_owner_setting_platform(%s, %s, %s,%s, %s)", (id, is_self_operated, is_demo_platform, language, value))
+            self.cache.invalidate('platform', id)
 
         async def owner_fetch_platform_list(self) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
@@ -356,6 +553,9 @@ class Database:
                     return result['o_platform_list']
 
         async def get_platform(self, platform_id: int) -> Dict[str, Any]:
+            return await self.cache.get_or_load('platform', platform_id, (), lambda: self._get_platform(platform_id))
+
+        async def _get_platform(self, platform_id: int) -> Dict[str, Any]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_platform from yj_platform_get(%s)", (platform_id,))
@@ -378,8 +578,12 @@ class Database:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_platform_edit(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", (platform_id, name, carousels_album_id, referrer_album_id, intro, language, json.dumps(order_pay_methods), user_service_agreement_id, privacy_policy_agreement_id, sales_contract_and_hosting_service_agreement_id, about_us_agreement_id, json.dumps(customer_service_contact)))
+            self.cache.invalidate('platform', platform_id)
 
         async def fetch_agreement_list(self, platform_id: int) -> List[Dict[str, Any]]:
+            return await self.cache.get_or_load('agreements', platform_id, (), lambda: self._fetch_agreement_list(platform_id))
+
+        async def _fetch_agreement_list(self, platform_id: int) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_agreement_list from yj_fetch_agreement_list(%s)", (platform_id,))
@@ -398,12 +602,15 @@ class Database:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_agreement_id from yj_agreement_create(%s, %s, %s)", (platform_id, title, content))
                     result = await cur.fetchone()
-                    return result['o_agreement_id']
+            self.cache.invalidate('agreements', platform_id)
+            return result['o_agreement_id']
 
-        async def edit_agreement(self, id: int, title: str, content: str):
+        async def edit_agreement(self, id: int, title: str, content: str, *, platform_id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_agreement_edit(%s, %s, %s)", (id, title, content))
+            self.cache.invalidate('agreement', id)
+            self.cache.invalidate('agreements', platform_id)
 
         async def get_notice(self, id: int) -> Optional[Dict[str, Any]]:
             async with self.db.acquire() as conn:
@@ -425,22 +632,26 @@ class Database:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_notice_id from yj_notice_create(%s, %s, %s, %s, %s)", (platform_id, title, content, display_popup, read_confirm))
                     result = await cur.fetchone()
-                    return result['o_notice_id']
+            self.cache.invalidate('notices', platform_id)
+            return result['o_notice_id']
 
-        async def edit_notice(self, id: int, title: str, content: str, display_popup: bool = False, read_confirm=False):
+        async def edit_notice(self, id: int, title: str, content: str, display_popup: bool = False, read_confirm=False, *, platform_id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_notice_edit(%s, %s, %s, %s, %s)", (id, title, content, display_popup, read_confirm))
+            self.cache.invalidate('notices', platform_id)
 
-        async def publish_notice(self, id: int):
+        async def publish_notice(self, id: int, *, platform_id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_notice_publish(%s)", (id,))
+            self.cache.invalidate('notices', platform_id)
 
-        async def revoke_notice(self, id: int):
+        async def revoke_notice(self, id: int, *, platform_id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_notice_revoke(%s)", (id,))
+            self.cache.invalidate('notices', platform_id)
 
         async def create_album(self, platform_id: int, title: str) -> int:
             async with self.db.acquire() as conn:
@@ -449,17 +660,19 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_album_id']
 
-        async def get_photo(self, id: int) -> Optional[Dict[str, Any]]:
+        async def get_photo(self, platform_id: int, id: int) -> Optional[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_photo from yj_get_photo(%s)", (id, ))
+                    await cur.execute("select yj_platform_get_photo(%s, %s) as o_photo", (platform_id, id))
                     result = await cur.fetchone()
                     return result['o_photo'] if result else None
 
-        async def remove_photo(self, id: int):
+        async def remove_photo(self, platform_id: int, id: int) -> bool:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select yj_remove_photo(%s)", (id, ))
+                    await cur.execute("select yj_platform_remove_photo(%s, %s) as o_removed", (platform_id, id))
+                    result = await cur.fetchone()
+                    return bool(result and result['o_removed'])
 
         async def upload_photo(self, platform_id: int, mime_type: str, height: int, width: int, photo: str, album_id: Optional[int] = None) -> int:
             async with self.db.acquire() as conn:
@@ -468,12 +681,19 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_photo_id']
 
-        async def fetch_album_photos(self, id: int) -> List[Dict[str, Any]]:
+        async def fetch_album_photos(self, platform_id: int, id: int) -> Optional[List[Dict[str, Any]]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_album from yj_fetch_album_photos(%s)", (id, ))
+                    await cur.execute("select yj_platform_fetch_album_photos(%s, %s) as o_album", (platform_id, id))
                     result = await cur.fetchone()
-                    return result['o_album']
+                    return result['o_album'] if result else None
+
+        async def fetch_albums(self, platform_id: int, ids: List[int]) -> List[Dict[str, Any]]:
+            async with self.db.acquire() as conn:
+                async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                    await cur.execute("select yj_fetch_albums(%s, %s::integer[]) as o_albums", (platform_id, ids))
+                    result = await cur.fetchone()
+                    return result['o_albums'] if result else []
 
         async def get_customer(self, id: int) -> Optional[Dict[str, Any]]:
             async with self.db.acquire() as conn:
@@ -487,10 +707,10 @@ class Database:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_customer_rebind_referrer(%s, %s, %s)", (id, referrer_id, platform_id))
 
-        async def fetch_customer_list(self, platform_id: int, filter_by: str, filter: str) -> List[Dict[str, Any]]:
+        async def fetch_customer_list(self, platform_id: int, filter_by: str, filter: str, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_customer_list from yj_fetch_customer_list(%s, %s, %s)", (platform_id, filter_by, filter))
+                    await cur.execute(*keyset_call('yj_fetch_customer_list', 'o_customer_list', (platform_id, filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_customer_list']
 
@@ -507,6 +727,19 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_customer_id']
 
+        async def import_customers(self, platform_id: int, chunks: AsyncIterator[List[Dict[str, Any]]]) -> Dict[str, Any]:
+            return await ingest(self.db, 'yj_staging_customer',
+                                'line integer, mobile text, nick_name text, remarks_name text, description text, referrer_customer_id integer, referrer_mobile text',
+                                chunks, "select yj_customer_apply_import_staging(%s)", (platform_id, ))
+
+        async def import_customer_referrers(self, platform_id: int, chunks: AsyncIterator[List[Dict[str, Any]]]) -> Dict[str, Any]:
+            return await ingest(self.db, 'yj_staging_customer_referrer', 'line integer, customer_id integer, referrer_id integer',
+                                chunks, "select yj_customer_apply_referrer_staging(%s)", (platform_id, ))
+
+        async def owner_import_customer_platforms(self, chunks: AsyncIterator[List[Dict[str, Any]]]) -> Dict[str, Any]:
+            return await ingest(self.db, 'yj_staging_customer_platform', 'line integer, platform_id integer, customer_id integer, new_platform_id integer',
+                                chunks, "select yj_owner_apply_customer_platform_staging()", ())
+
         async def edit_customer(self, id: int, nick_name: Optional[str], internal_remarks_name: Optional[str], description: Optional[str]):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
@@ -574,7 +807,8 @@ class Database:
                         platform_id, name, sale_method, sale_unit, min_units_for_sale, stock_qty, price, market_price, service_fee_percent,
                         hosting_days, cover_photo_id, photos_album_id, sales_keywords, intro, description))
                     result = await cur.fetchone()
-                    return result['o_product_id']
+            self.cache.invalidate('products', platform_id)
+            return result['o_product_id']
 
         async def edit_product(self,
                                id: int,
@@ -590,25 +824,32 @@ class Database:
                                photos_album_id: int,
                                sales_keywords: List[str],
                                intro: Optional[str] = None,
-                               description: Optional[str] = None):
+                               description: Optional[str] = None,
+                               *,
+                               platform_id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_platform_edit_product(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", (
                         id, name, sale_unit, min_units_for_sale, stock_qty, price, market_price, service_fee_percent,
                         hosting_days, cover_photo_id, photos_album_id, sales_keywords, intro, description))
+            self.cache.invalidate('products', platform_id)
 
-        async def change_product_state(self, id: int, state: str):
+        async def change_product_state(self, id: int, state: str, *, platform_id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_platform_product_change_state(%s, %s)", (id, state))
+            self.cache.invalidate('products', platform_id)
 
-        async def purchase_product(self, id: int, customer_id: int, qty: int, paid_amount: int, grant_qty: int, internal_comment: Optional[str] = None) -> int:
+        async def purchase_product(self, id: int, customer_id: int, qty: int, paid_amount: int, grant_qty: int, internal_comment: Optional[str] = None,
+                                   *, platform_id: int) -> int:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_platform_product_purchase(%s, %s, %s, %s, %s, %s) as order_id", (
                         id, customer_id, qty, paid_amount, grant_qty, internal_comment))
                     result = await cur.fetchone()
-                    return result['order_id']
+            if result['order_id'] > 0:
+                self.cache.invalidate('products', platform_id)
+            return result['order_id']
 
         async def get_order(self, id: int) -> Optional[Dict[str, Any]]:
             async with self.db.acquire() as conn:
@@ -617,13 +858,16 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_order']
 
-        async def fetch_order_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None) -> List[Dict[str, Any]]:
+        async def fetch_order_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_order_list from yj_platform_fetch_order_list(%s, %s, %s)", (platform_id, filter_by, filter))
+                    await cur.execute(*keyset_call('yj_platform_fetch_order_list', 'o_order_list', (platform_id, filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_order_list']
 
+        def export_order_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+            return iter_cursor(self.db, 'yj_platform_order_rows', (platform_id, filter_by, filter, None))
+
         async def comment_order(self, id: int, comment: str):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
@@ -674,6 +918,17 @@ class Database:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_platform_order_finish(%s)", (id,))
 
+        async def transition_orders(self, platform_id: int, ids: List[int], action: str, function: str, args: List[Optional[int]], id_arg: int,
+                                    dry_run: bool = False) -> List[Dict[str, Any]]:
+            async with self.db.acquire() as conn:
+                async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                    await cur.execute("select yj_platform_order_transition(%s, %s::integer[], %s, %s, %s::integer[], %s, %s) as o_results",
+                                      (platform_id, ids, action, function, args, id_arg, dry_run))
+                    result = await cur.fetchone()
+            if not dry_run:
+                await self.statistics.touch(platform_id=platform_id)
+            return result['o_results'] if result else []
+
         async def create_order_fiat_payment(self,
                                             id: int,
                                             bank_name: str,
@@ -690,10 +945,12 @@ class Database:
         async def fetch_order_fiat_payment_list(self,
                                                 platform_id: int,
                                                 filter_by: str,
-                                                filter: Optional[str] = None) -> List[Dict[str, Any]]:
+                                                filter: Optional[str] = None,
+                                                limit: Optional[int] = None,
+                                                after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_payment_list from yj_order_fiat_payment_fetch_list(%s, %s, %s)", (platform_id, filter_by, filter))
+                    await cur.execute(*keyset_call('yj_order_fiat_payment_fetch_list', 'o_payment_list', (platform_id, filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_payment_list']
 
@@ -712,10 +969,12 @@ class Database:
         async def fetch_order_crypto_payment_list(self,
                                                   platform_id: int,
                                                   filter_by: str,
-                                                  filter: Optional[str] = None) -> List[Dict[str, Any]]:
+                                                  filter: Optional[str] = None,
+                                                  limit: Optional[int] = None,
+                                                  after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_payment_list from yj_order_crypto_payment_fetch_list(%s, %s, %s)", (platform_id, filter_by, filter))
+                    await cur.execute(*keyset_call('yj_order_crypto_payment_fetch_list', 'o_payment_list', (platform_id, filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_payment_list']
 
@@ -726,10 +985,10 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_seal_cost']
 
-        async def get_filecoin_seal_cost_payment_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None) -> List[Dict[str, Any]]:
+        async def get_filecoin_seal_cost_payment_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_payment_list from yj_platform_fetch_filecoin_seal_cost_payment_list(%s, %s, %s)", (platform_id, filter_by, filter))
+                    await cur.execute(*keyset_call('yj_platform_fetch_filecoin_seal_cost_payment_list', 'o_payment_list', (platform_id, filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_payment_list']
 
@@ -740,13 +999,16 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_payment_id']
 
-        async def fetch_filecoin_withdraw_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None) -> List[Dict[str, Any]]:
+        async def fetch_filecoin_withdraw_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_withdraw_list from yj_platform_filecoin_withdraw_fetch_list(%s, %s, %s)", (platform_id, filter_by, filter))
+                    await cur.execute(*keyset_call('yj_platform_filecoin_withdraw_fetch_list', 'o_withdraw_list', (platform_id, filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_withdraw_list']
 
+        def export_filecoin_withdraw_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+            return iter_cursor(self.db, 'yj_platform_filecoin_withdraw_rows', (platform_id, filter_by, filter, None))
+
         async def get_filecoin_withdraw(self, id: int) -> Optional[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
@@ -759,15 +1021,17 @@ class Database:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_platform_filecoin_withdraw_process_apply(%s, %s)", (id, comment))
 
-        async def complete_filecoin_withdraw_apply(self, id: int, message_id: str, comment: Optional[str] = None):
+        async def complete_filecoin_withdraw_apply(self, id: int, message_id: str, comment: Optional[str] = None, platform_id: Optional[int] = None):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_platform_filecoin_withdraw_complete_apply(%s, %s, %s)", (id, message_id, comment))
+            await self.statistics.touch(platform_id=platform_id)
 
-        async def refuse_filecoin_withdraw_apply(self, id: int, comment: Optional[str] = None):
+        async def refuse_filecoin_withdraw_apply(self, id: int, comment: Optional[str] = None, *, platform_id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_platform_filecoin_withdraw_apply_refuse(%s, %s)", (id, comment))
+            await self.statistics.touch(platform_id=platform_id)
 
         async def get_filecoin_storage(self, order_id: int):
             async with self.db.acquire() as conn:
@@ -776,10 +1040,10 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_storage']
 
-        async def fetch_filecoin_storage_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None):
+        async def fetch_filecoin_storage_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None, limit: Optional[int] = None, after_id: Optional[int] = None):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_storage_list from yj_platform_filecoin_storage_fetch_list(%s, %s, %s)", (platform_id, filter_by, filter))
+                    await cur.execute(*keyset_call('yj_platform_filecoin_storage_fetch_list', 'o_storage_list', (platform_id, filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_storage_list']
 
@@ -788,32 +1052,49 @@ class Database:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_filecoin_storage_add_sealed_storage(%s, %s)", (order_id, storage))
 
+        async def ingest_sealed_storage(self, platform_id: int, chunks: AsyncIterator[List[Dict[str, Any]]]) -> Dict[str, Any]:
+            summary = await ingest(self.db, 'yj_staging_sealed_storage', 'line integer, order_id integer, storage bigint', chunks,
+                                   "select yj_filecoin_storage_apply_sealed_staging(%s)", (platform_id, ))
+            await self.statistics.touch(platform_id=platform_id)
+            return summary
+
         async def create_filecoin_settlement(self, platform_id: int, mining_efficiency: int, comment: Optional[str] = None) -> str:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_settlement_no from yj_customer_filecoin_settlement_create(%s, %s, %s)", (platform_id, mining_efficiency, comment))
                     result = await cur.fetchone()
-                    return result['o_settlement_no']
+            await self.statistics.touch(platform_id=platform_id)
+            return result['o_settlement_no']
 
-        async def create_filecoin_settlement_in_day(self, platform_id: int, settle_day_at: date, mining_efficiency: int, comment: Optional[str] = None) -> str:
+        async def create_filecoin_settlement_in_day(self, platform_id: int, settle_day_at: date, mining_efficiency: int, comment: Optional[str] = None,
+                                                    owner: str = 'manual') -> Tuple[str, bool]:
+            # settles through the checkpoint, so a day is never settled twice;
+            # returns the settlement number and whether it was created now
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_settlement_no from yj_customer_filecoin_settlement_day_create(%s, %s, %s, %s)", (platform_id, settle_day_at, mining_efficiency, comment))
+                    await cur.execute("select o_settlement_no, o_created from yj_settlement_checkpoint_settle(%s, %s, %s, %s, %s)",
+                                      (platform_id, settle_day_at, mining_efficiency, comment, owner))
                     result = await cur.fetchone()
-                    return result['o_settlement_no']
+            if result['o_created']:
+                await self.statistics.touch(platform_id=platform_id)
+            return result['o_settlement_no'], result['o_created']
 
-        async def confirm_filecoin_settlement(self, settlement_no: str, mining_efficiency: int, comment: Optional[str] = None):
+        async def confirm_filecoin_settlement(self, settlement_no: str, mining_efficiency: int, comment: Optional[str] = None, platform_id: Optional[int] = None):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_customer_filecoin_settlement_confirm(%s, %s, %s)", (settlement_no, comment, mining_efficiency))
+            await self.statistics.touch(platform_id=platform_id)
 
-        async def fetch_filecoin_settlement_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None) -> List[Dict[str, Any]]:
+        async def fetch_filecoin_settlement_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_settlement_list from yj_filecoin_settlement_fetch_list(%s, %s, %s)", (platform_id, filter_by, filter))
+                    await cur.execute(*keyset_call('yj_filecoin_settlement_fetch_list', 'o_settlement_list', (platform_id, filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_settlement_list']
 
+        def export_filecoin_settlement_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+            return iter_cursor(self.db, 'yj_platform_filecoin_settlement_rows', (platform_id, filter_by, filter, None))
+
         async def get_filecoin_settlement(self, platform_id: int, settlement_no: str) -> Optional[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
@@ -821,10 +1102,10 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_settlement']
 
-        async def fetch_filecoin_settlement_platform_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None) -> List[Dict[str, Any]]:
+        async def fetch_filecoin_settlement_platform_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_settlement_list from yj_filecoin_settlement_platform_fetch_list(%s, %s, %s)", (platform_id, filter_by, filter))
+                    await cur.execute(*keyset_call('yj_filecoin_settlement_platform_fetch_list', 'o_settlement_list', (platform_id, filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_settlement_list']
 
@@ -842,19 +1123,15 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_settlement']
 
-        async def get_filecoin_settlement_referrer_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None) -> List[Dict[str, Any]]:
+        async def get_filecoin_settlement_referrer_list(self, platform_id: int, filter_by: str, filter: Optional[str] = None, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_settlement_list from yj_filecoin_settlement_referrere_fetch_list(%s, %s, %s)", (platform_id, filter_by, filter))
+                    await cur.execute(*keyset_call('yj_filecoin_settlement_referrere_fetch_list', 'o_settlement_list', (platform_id, filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_settlement_list']
 
         async def get_filecoin_statitics(self, platform_id: int) -> Dict[str, Any]:
-            async with self.db.acquire() as conn:
-                async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_statitics from yj_platform_filecoin_statitics(%s)", (platform_id, ))
-                    result = await cur.fetchone()
-                    return result['o_statitics']
+            return await self.statistics.get_platform(platform_id)
 
         async def bind_fil_withdraw_address(self, platform_id: int, address: str):
             async with self.db.acquire() as conn:
@@ -866,7 +1143,8 @@ class Database:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_result from yj_platform_filecoin_platform_withdraw_apply(%s, %s)", (platform_id, amount))
                     result = await cur.fetchone()
-                    return result['o_result']
+            await self.statistics.touch(platform_id=platform_id)
+            return result['o_result']
 
         async def owner_process_platform_filecoin_withdraw_apply(self, withdraw_no: str, comment: Optional[str] = None):
             async with self.db.acquire() as conn:
@@ -877,11 +1155,13 @@ class Database:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_owner_filecoin_complete_platform_withdraw_apply(%s, %s)", (withdraw_no, message_id))
+            await self.statistics.touch()
 
         async def owner_refuse_platform_filecoin_withdraw_apply(self, withdraw_no: str, comment: Optional[str] = None):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_owner_filecoin_refuse_platform_withdraw_apply(%s, %s)", (withdraw_no, comment))
+            await self.statistics.touch()
 
         async def owner_fetch_platform_filecoin_withdraw_apply_list(self, platform_id: int, state: str) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
@@ -916,7 +1196,8 @@ class Database:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select o_flash_id from yj_flash_create(%s, %s, %s, %s, %s)", (platform_id, title, content, display_popup, read_confirm))
                     result = await cur.fetchone()
-                    return result['o_flash_id']
+            self.cache.invalidate('flashes', platform_id)
+            return result['o_flash_id']
 
         async def fetch_flash_list(self, platform_id: int) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
@@ -932,27 +1213,26 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_flash'] if result else None
 
-        async def edit_flash(self, id: int, title: str, content: str, display_popup: bool = False, read_confirm=False):
+        async def edit_flash(self, id: int, title: str, content: str, display_popup: bool = False, read_confirm=False, *, platform_id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_flash_edit(%s, %s, %s, %s, %s)", (id, title, content, display_popup, read_confirm))
+            self.cache.invalidate('flashes', platform_id)
 
-        async def publish_flash(self, id: int):
+        async def publish_flash(self, id: int, *, platform_id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_flash_publish(%s)", (id,))
+            self.cache.invalidate('flashes', platform_id)
 
-        async def revoke_flash(self, id: int):
+        async def revoke_flash(self, id: int, *, platform_id: int):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_flash_revoke(%s)", (id,))
+            self.cache.invalidate('flashes', platform_id)
 
         async def fetch_owner_get_filecoin_statitics(self) -> List[Dict[str, Any]]:
-            async with self.db.acquire() as conn:
-                async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_statitics from yj_owner_platform_filecoin_statitics()")
-                    result = await cur.fetchone()
-                    return result['o_statitics']
+            return await self.statistics.get_owner()
 
         async def fetch_owner_get_filecoin_profites_list(self, settle_day_at: date) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
@@ -979,6 +1259,7 @@ class Database:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_discarded_filecoin_settlement(%s,%s)", (platform_id, settlement_no))
+            await self.statistics.touch(platform_id=platform_id)
 
         async def fetch_owner_get_customer_independent_node_list(self, mobile: str, node_no: str, state: str) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
@@ -987,10 +1268,10 @@ class Database:
                     result = await cur.fetchone()
                     return result['o_customer_node_list']
 
-        async def fetch_owner_get_customer_list(self, filter_by: str, filter: str) -> List[Dict[str, Any]]:
+        async def fetch_owner_get_customer_list(self, filter_by: str, filter: str, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_owner_customer_list from yj_fetch_owner_get_customer_list(%s, %s)", (filter_by, filter))
+                    await cur.execute(*keyset_call('yj_fetch_owner_get_customer_list', 'o_owner_customer_list', (filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_owner_customer_list']
 
@@ -1009,10 +1290,10 @@ class Database:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_finish_owner_customer_independent_node(%s)", (id,))
 
-        async def fetch_owner_customer_independent_node_withdraw_list(self, filter_by: str, filter: str) -> List[Dict[str, Any]]:
+        async def fetch_owner_customer_independent_node_withdraw_list(self, filter_by: str, filter: str, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_customer_node_withdraw_list from yj_fetch_owner_customer_independent_node_withdraw_list(%s, %s)", (filter_by, filter))
+                    await cur.execute(*keyset_call('yj_fetch_owner_customer_independent_node_withdraw_list', 'o_customer_node_withdraw_list', (filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_customer_node_withdraw_list']
 
@@ -1025,16 +1306,18 @@ class Database:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_complete_owner_customer_independent_node_withdraw_apply(%s, %s)", (withdraw_no, message_id))
+            await self.statistics.touch()
 
         async def refuse_owner_customer_independent_node_withdraw_apply(self, withdraw_no: str, comment: Optional[str] = None):
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_refuse_owner_customer_independent_node_withdraw_apply(%s, %s)", (withdraw_no, comment))
+            await self.statistics.touch()
 
-        async def fetch_owner_customer_expenses_list(self, filter_by: str, filter: str) -> List[Dict[str, Any]]:
+        async def fetch_owner_customer_expenses_list(self, filter_by: str, filter: str, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-                    await cur.execute("select o_owner_filecoin_customer_expenses_list from yj_owner_filecoin_customer_expenses_list(%s, %s)", (filter_by, filter))
+                    await cur.execute(*keyset_call('yj_owner_filecoin_customer_expenses_list', 'o_owner_filecoin_customer_expenses_list', (filter_by, filter), limit, after_id))
                     result = await cur.fetchone()
                     return result['o_owner_filecoin_customer_expenses_list']
 
@@ -1042,6 +1325,7 @@ class Database:
             async with self.db.acquire() as conn:
                 async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                     await cur.execute("select yj_owner_filecoin_customer_expenses_add(%s, %s, %s, %s, %s)", (customer_id, expenses_type, expenses_amount, reason, comment))
+            await self.statistics.touch(customer_id=customer_id)
 
         async def fetch_owner_customer_avaiable_amount(self, customer_id: int) -> int:
             async with self.db.acquire() as conn:
@@ -1061,16 +1345,19 @@ class Database:
           async with self.db.acquire() as conn:
               async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                   await cur.execute("select yj_filecoin_stop_customer_orders(%s,%s)",(platform_id,customer_id))
+          await self.statistics.touch(platform_id=platform_id, customer_id=customer_id)
 
         async def customer_clearing_fee(self,platform_id: int,customer_id: int,amount: int) -> int:
           async with self.db.acquire() as conn:
               async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                   await cur.execute("select yj_customer_clearing_fee(%s,%s,%s)",(platform_id,customer_id,amount))
+          await self.statistics.touch(platform_id=platform_id, customer_id=customer_id)
 
         async def order_stop(self,platform_id: int,order_id: int,few_days: int) -> int:
           async with self.db.acquire() as conn:
               async with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
                   await cur.execute("select yj_stop_order(%s,%s,%s)",(platform_id,order_id,few_days))
+          await self.statistics.touch(platform_id=platform_id)
 
 
 async def _on_startup(app: web.Application):
@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from aiohttp import web
+
+from mining.bulk import transaction
+
+logger = logging.getLogger('export')
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+# rows per FETCH from the export cursor
+EXPORT_BATCH_SIZE = 5000
+
+
+async def iter_cursor(pool, function: str, args: Tuple, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Stream the rows of a `yj_*_rows` function (sql/pagination.sql) in batches.
+
+    psycopg2 named cursors are unavailable in aiopg's asynchronous mode, so
+    the cursor is declared in SQL on one dedicated connection and read with
+    FETCH. The query runs once; only one batch is held in memory. The
+    connection and its read transaction are held until the export ends.
+    """
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            async with transaction(cur):
+                await cur.execute(f"DECLARE export NO SCROLL CURSOR FOR SELECT o_row FROM {function}({', '.join(['%s'] * len(args))})",
+                                  args)
+                while True:
+                    await cur.execute(f"FETCH {int(batch_size)} FROM export")
+                    rows = await cur.fetchall()
+                    if rows:
+                        yield [row[0] for row in rows]
+                    if len(rows) < batch_size:
+                        return
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+async def stream_rows(request: web.Request, pages: AsyncIterator[List[Dict[str, Any]]], export_format: str, file_name: str) -> web.StreamResponse:
+    if export_format == 'csv':
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        content_type = 'application/x-ndjson'
+
+    response = web.StreamResponse(headers={
+        'Content-Type': content_type,
+        'Content-Disposition': f'attachment; filename={file_name}.{export_format}',
+    })
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+
+    fieldnames = None
+    rows = 0
+    try:
+        async for page in pages:
+            buf = io.StringIO()
+            if export_format == 'csv':
+                writer = csv.DictWriter(buf, fieldnames=fieldnames or list(page[0].keys()), extrasaction='ignore')
+                if fieldnames is None:
+                    fieldnames = writer.fieldnames
+                    # BOM so spreadsheet apps detect utf-8 for chinese text
+                    buf.write('\ufeff')
+                    writer.writeheader()
+                writer.writerows({k: _csv_value(v) for k, v in row.items()} for row in page)
+            else:
+                for row in page:
+                    buf.write(json.dumps(row, ensure_ascii=False))
+                    buf.write('\n')
+            rows += len(page)
+            # `write` waits for the transport to drain, so a slow client
+            # throttles how fast pages are pulled from PostgreSQL
+            await response.write(buf.getvalue().encode('utf-8'))
+    except Exception as exc:
+        logger.error(f"""Export `{file_name}` failed after {rows} rows, reason: {str(exc)}""")
+        # a clean end of the chunked body would make the truncated export
+        # look complete to the client, so drop the connection instead
+        if request.transport is not None:
+            request.transport.abort()
+        return response
+    finally:
+        # ends the cursor's transaction now, not when the generator is collected
+        await pages.aclose()
+
+    await response.write_eof()
+    return response
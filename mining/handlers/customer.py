@@ -1,17 +1,24 @@
+from datetime import datetime, timezone
 import logging
 import hashlib
 import jwt
 import pyotp
 import base64
 import aiohttp
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from webargs.aiohttpparser import use_kwargs, use_args
-from marshmallow import fields
+from webargs.fields import DelimitedList
+from marshmallow import fields, validate
 from aiohttp.web_exceptions import HTTPBadRequest, HTTPServerError
 from aiohttp import web
 from marshmallow import Schema, fields
 
+from mining.blobs import MAX_ALBUM_BATCH, with_albums_urls
+from mining.idempotency import idempotent
 from mining.session import get_session, new_session
+from mining.network import HISTORY_STEPS, history_step
+from mining.pagination import PAGE_ARGS, keyset_args, page_response
+from mining.push import encode_event, stream_events
 from mining.permissions import login_required
 
 
@@ -199,29 +206,49 @@ async def get_latest_app_release(request: web.Request, platform: str) -> web.Res
 
 @login_required
 async def get_filecoin_network(request: web.Request) -> web.Response:
-    network_info = await request.app['db'].get_filecoin_network_info()
-    return web.json_response(network_info)
+    snapshot = request.app['network'].snapshot
+    return web.Response(body=snapshot.body, content_type='application/json', headers={'ETag': snapshot.etag})
 
 
 @login_required
 @use_kwargs({
-    'base_code': fields.Str(data_key='baseCode'),
-    'counter_code': fields.Str(data_key='counterCode'),
+    'from_at': fields.AwareDateTime(data_key='from', required=True, default_timezone=timezone.utc),
+    'to_at': fields.AwareDateTime(data_key='to', missing=None, default_timezone=timezone.utc),
+    'step': fields.Str(missing=None, validate=validate.OneOf(HISTORY_STEPS)),
 }, location='query')
-async def get_currency_price_index(request: web.Request, base_code: str, counter_code: str) -> web.Response:
+async def get_filecoin_network_history(request: web.Request, from_at: datetime, to_at: Optional[datetime], step: Optional[str]) -> web.Response:
+    to_at = to_at or datetime.now(timezone.utc)
+    step = history_step(from_at, to_at, step)
+    history = await request.app['db'].get_filecoin_network_history(from_at, to_at, step)
+    return web.json_response(history)
+
+
+@login_required
+async def get_events(request: web.Request) -> web.StreamResponse:
     session = await get_session(request)
-    return web.json_response({
-        'baseCode': 'FIL',
-        'counterCode': 'USDT',
-        'price': 70
-    })
+    snapshot = request.app['network'].snapshot
+    return await stream_events(request, request.app['push'], session['platform_id'], encode_event('network', snapshot.body))
+
+
+@login_required
+@use_kwargs({
+    'base_code': fields.Str(data_key='baseCode', missing='FIL'),
+    'counter_code': fields.Str(data_key='counterCode', missing='USDT'),
+}, location='query')
+async def get_currency_price_index(request: web.Request, base_code: str, counter_code: str) -> web.Response:
+    quote = request.app['prices'].quote(base_code, counter_code)
+    if quote is None:
+        raise HTTPBadRequest(reason='暂无该币种报价')
+    return web.json_response(quote.to_json())
 
 
 @login_required
 async def get_platform_notice_list(request: web.Request) -> web.Response:
     session = await get_session(request)
-    notice_list = await request.app['db'].customer.get_fetch_notice_list(session['platform_id'], session['user_id'])
-    return web.json_response(notice_list)
+    notice_list = await request.app['db'].customer.get_fetch_notice_list_entry(session['platform_id'], session['user_id'])
+    if notice_list is None:
+        return web.json_response(None)
+    return web.Response(body=notice_list.body, content_type='application/json', headers={'ETag': notice_list.etag})
 
 
 @login_required
@@ -245,6 +272,14 @@ async def get_platform_agreement(request: web.Request, Id: int) -> web.Response:
     return web.json_response(agreement)
 
 
+@login_required
+@use_kwargs({'ids': DelimitedList(fields.Int(), required=True, validate=validate.Length(min=1, max=MAX_ALBUM_BATCH))}, location='query')
+async def get_albums(request: web.Request, ids: List[int]) -> web.Response:
+    session = await get_session(request)
+    albums = await request.app['db'].customer.fetch_albums(session['platform_id'], ids)
+    return web.json_response(with_albums_urls(albums))
+
+
 @login_required
 async def get_product_list(request: web.Request) -> web.Response:
     session = await get_session(request)
@@ -263,11 +298,12 @@ async def get_product(request: web.Request, Id: int) -> web.Response:
 
 
 @login_required
+@idempotent(get_session)
 @use_kwargs({'Id': fields.Int()}, location='match_info')
-@use_kwargs({'qty': fields.Int(), 'comment': fields.Int(missing=None)})
+@use_kwargs({'qty': fields.Int(required=True, validate=validate.Range(min=1)), 'comment': fields.Int(missing=None)})
 async def purchase_product(request: web.Request, Id: int, qty: int, comment: Optional[str]) -> web.Response:
     session = await get_session(request)
-    order_id = await request.app['db'].customer.purchase_product(Id, session['user_id'], qty, comment)
+    order_id, order = await request.app['purchases'].purchase(Id, session['platform_id'], session['user_id'], qty, comment)
     if order_id <= 0:
         if order_id == -2:
             raise HTTPBadRequest(reason="该商品已下架, 不可购买")
@@ -276,15 +312,15 @@ async def purchase_product(request: web.Request, Id: int, qty: int, comment: Opt
         else:
             raise HTTPServerError(reason="创建商品失败, 请联系客服")
 
-    order = await request.app['db'].customer.get_order(order_id)
     return web.json_response(order)
 
 
 @login_required
-async def get_order_list(request: web.Request) -> web.Response:
+@use_kwargs(PAGE_ARGS, location='query')
+async def get_order_list(request: web.Request, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_session(request)
-    order_list = await request.app['db'].customer.get_order_list(session['user_id'])
-    return web.json_response(order_list)
+    order_list = await request.app['db'].customer.get_order_list(session['user_id'], *keyset_args(limit, cursor))
+    return page_response(order_list, limit)
 
 
 @login_required
@@ -317,23 +353,25 @@ async def get_filecoin_order_seal_cost(request: web.Request, Id: int) -> web.Res
 @login_required
 @use_kwargs({
     'filter_by': fields.Str(data_key='filterBy'),
-    'filter': fields.Str(missing=None)
+    'filter': fields.Str(missing=None),
+    **PAGE_ARGS,
 }, location='query')
-async def get_filecoin_seal_cost_payment_list(request: web.Request, filter_by: str, filter: Optional[str]) -> web.Response:
+async def get_filecoin_seal_cost_payment_list(request: web.Request, filter_by: str, filter: Optional[str], limit: Optional[int], cursor: Optional[str]) -> web.Response:
     order_id = int(filter) if filter_by == 'order' and not filter else None
     session = await get_session(request)
-    result = await request.app['db'].customer.get_filecoin_seal_cost_payment_list(session['user_id'], order_id)
-    return web.json_response(result)
+    result = await request.app['db'].customer.get_filecoin_seal_cost_payment_list(session['user_id'], order_id, *keyset_args(limit, cursor))
+    return page_response(result, limit)
 
 
 @login_required
 async def get_filecoin_revenue_statitics(request: web.Request) -> web.Response:
     session = await get_session(request)
-    result = await request.app['db'].customer.get_filecoin_revenue_statitics(session['user_id'])
+    result = await request.app['db'].customer.get_filecoin_revenue_statitics(session['user_id'], session['platform_id'])
     return web.json_response(result)
 
 
 @login_required
+@idempotent(get_session)
 @use_kwargs({
     'amount': fields.Str(),
     'verification_challenge_method': fields.Str(data_key='verificationChallengeMethod'),
@@ -369,34 +407,39 @@ async def apply_filecoin_withdraw(request: web.Request, amount: str, verificatio
 @login_required
 @use_kwargs({
     'filter_by': fields.Str(data_key='filterBy'),
-    'filter': fields.Str(missing=None)
+    'filter': fields.Str(missing=None),
+    **PAGE_ARGS,
 }, location='query')
-async def get_filecoin_withdraw_list(request: web.Request, filter_by: str, filter: Optional[str]) -> web.Response:
+async def get_filecoin_withdraw_list(request: web.Request, filter_by: str, filter: Optional[str], limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_session(request)
     state = filter if filter_by == 'state' and not filter else None
-    withdraw_list = await request.app['db'].customer.get_filecoin_withdraw_list(session['user_id'], state)
-    return web.json_response(withdraw_list)
+    withdraw_list = await request.app['db'].customer.get_filecoin_withdraw_list(session['user_id'], state, *keyset_args(limit, cursor))
+    return page_response(withdraw_list, limit)
 
 
 @login_required
-async def get_filecoin_settlement_list(request: web.Request) -> web.Response:
+@use_kwargs(PAGE_ARGS, location='query')
+async def get_filecoin_settlement_list(request: web.Request, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_session(request)
-    settlement_list = await request.app['db'].customer.get_filecoin_settlement_list(session['user_id'])
-    return web.json_response(settlement_list)
+    settlement_list = await request.app['db'].customer.get_filecoin_settlement_list(session['user_id'], *keyset_args(limit, cursor))
+    return page_response(settlement_list, limit)
 
 
 @login_required
-async def get_filecoin_settlement_referrer_list(request: web.Request) -> web.Response:
+@use_kwargs(PAGE_ARGS, location='query')
+async def get_filecoin_settlement_referrer_list(request: web.Request, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_session(request)
-    settlement_list = await request.app['db'].customer.get_filecoin_settlement_referrer_list(session['user_id'])
-    return web.json_response(settlement_list)
+    settlement_list = await request.app['db'].customer.get_filecoin_settlement_referrer_list(session['user_id'], *keyset_args(limit, cursor))
+    return page_response(settlement_list, limit)
 
 
 @login_required
 async def get_platform_flash_list(request: web.Request) -> web.Response:
     session = await get_session(request)
-    flash_list = await request.app['db'].customer.get_fetch_flash_list(session['platform_id'], session['user_id'])
-    return web.json_response(flash_list)
+    flash_list = await request.app['db'].customer.get_fetch_flash_list_entry(session['platform_id'], session['user_id'])
+    if flash_list is None:
+        return web.json_response(None)
+    return web.Response(body=flash_list.body, content_type='application/json', headers={'ETag': flash_list.etag})
 
 
 @login_required
@@ -414,7 +457,7 @@ async def get_platform_flash(request: web.Request, Id: int) -> web.Response:
 @use_kwargs({'Id': fields.Int()}, location='match_info')
 async def flash_confirm_read(request: web.Request, Id: int) -> web.Response:
     session = await get_session(request)
-    await request.app['db'].customer.flash_confirm_read(session['user_id'], Id)
+    await request.app['db'].customer.flash_confirm_read(session['user_id'], Id, session['platform_id'])
     return web.json_response({})
 
 
@@ -428,6 +471,7 @@ async def customer_independent_node_edit(request: web.Request, independentNode:
 
 
 @login_required
+@idempotent(get_session)
 @use_kwargs({
     'amount': fields.Str(),
     'node_id': fields.Int()
@@ -456,8 +500,8 @@ async def get_customer_independent_node_list(request: web.Request, state: str) -
 
 
 @login_required
-@use_kwargs({'filter_by': fields.Str(data_key='filterBy', missing='all'), 'filter': fields.Str(missing=None)}, location='query')
-async def get_customer_expense_list(request: web.Request, filter_by: str, filter: Optional[str]) -> web.Response:
+@use_kwargs({'filter_by': fields.Str(data_key='filterBy', missing='all'), 'filter': fields.Str(missing=None), **PAGE_ARGS}, location='query')
+async def get_customer_expense_list(request: web.Request, filter_by: str, filter: Optional[str], limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_session(request)
-    withdraw_list = await request.app['db'].customer.get_customer_expense_list(session['user_id'], filter_by, filter)
-    return web.json_response(withdraw_list)
+    withdraw_list = await request.app['db'].customer.get_customer_expense_list(session['user_id'], filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(withdraw_list, limit)
\ No newline at end of file
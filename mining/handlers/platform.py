@@ -1,7 +1,7 @@
-from datetime import date
+from datetime import date, datetime, timedelta, timezone
 import logging
 import hashlib
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from aiohttp.web_response import Response
 import jwt
 import pyotp
@@ -9,18 +9,29 @@ import base64
 import json
 
 from aiohttp.web_exceptions import HTTPBadRequest, HTTPForbidden, HTTPServerError
-from webargs.aiohttpparser import use_kwargs, use_args
-from marshmallow import Schema, fields
+from webargs.aiohttpparser import parser, use_kwargs, use_args
+from webargs.fields import DelimitedList
+from marshmallow import EXCLUDE, Schema, fields, validate
 
 import aiohttp
 from aiohttp import web
 
+from mining.blobs import MAX_ALBUM_BATCH, MAX_PHOTO_SIZE, blob_ref, decode_base64_photo, with_album_urls, with_albums_urls, with_photo_url
+from mining.bulk import BULK_FORMATS, BulkReport, bulk_format, iter_chunks
+from mining.idempotency import idempotent
 from mining.session import get_platform_session, new_platform_session
+from mining.network import HISTORY_STEPS, history_step
+from mining.orders import MAX_TRANSITION_BATCH, ORDER_TRANSITIONS, summarize, transition_args
+from mining.pagination import PAGE_ARGS, keyset_args, page_response
+from mining.export import EXPORT_FORMATS, stream_rows
 from mining.permissions import platform_login_required
+from mining.utils import gather_sections
 
 
 logger = logging.getLogger('api.platform')
 
+DASHBOARD_SECTION_TIMEOUT = 5
+
 
 class FiatPayMethodSchema(Schema):
     icon = fields.Str()
@@ -139,6 +150,14 @@ class PhotoSchema(Schema):
         strict = True
 
 
+class SealedStorageRowSchema(Schema):
+    order_id = fields.Int(data_key='orderId', required=True)
+    storage = fields.Int(required=True)
+
+    class Meta:
+        unknown = EXCLUDE
+
+
 class CustomerSchema(Schema):
     mobile = fields.Str(missing=None)
     nick_name = fields.Str(data_key='nickName', missing=None)
@@ -151,6 +170,35 @@ class CustomerSchema(Schema):
         strict = True
 
 
+class CustomerImportRowSchema(Schema):
+    mobile = fields.Str(required=True, validate=validate.Length(min=1, max=32))
+    nick_name = fields.Str(data_key='nickName', missing=None)
+    remarks_name = fields.Str(data_key='internalRemarksName', missing=None)
+    description = fields.Str(missing=None)
+    referrer_customer_id = fields.Int(data_key='referrerCustomerId', missing=None)
+    referrer_mobile = fields.Str(data_key='referrerMobile', missing=None)
+
+    class Meta:
+        unknown = EXCLUDE
+
+
+class CustomerReferrerRowSchema(Schema):
+    customer_id = fields.Int(data_key='customerId', required=True)
+    referrer_id = fields.Int(data_key='referrerId', required=True)
+
+    class Meta:
+        unknown = EXCLUDE
+
+
+class CustomerPlatformRowSchema(Schema):
+    platform_id = fields.Int(data_key='platformId', required=True)
+    customer_id = fields.Int(data_key='customerId', required=True)
+    new_platform_id = fields.Int(data_key='newPlatformId', required=True)
+
+    class Meta:
+        unknown = EXCLUDE
+
+
 class ProductSchema(Schema):
     name = fields.Str(required=True)
     sale_unit = fields.Int(data_key='saleUnit', required=True)
@@ -480,6 +528,20 @@ async def owner_rebind_customer_to_platform(request: web.Request, Id: int, custo
     return web.json_response({'Id': id})
 
 
+@platform_login_required
+@use_kwargs({'import_format': fields.Str(data_key='format', missing=None, validate=validate.OneOf(BULK_FORMATS))}, location='query')
+async def owner_import_customer_platforms(request: web.Request, import_format: Optional[str]) -> web.Response:
+    session = await get_platform_session(request)
+    if session['user_role'] != 'CenterAdmin':
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    report = BulkReport()
+    chunks = iter_chunks(request, bulk_format(request, import_format), CustomerPlatformRowSchema(), report)
+    summary = await request.app['db'].platform.owner_import_customer_platforms(chunks)
+    report.add_errors(summary.pop('errors', None))
+    return web.json_response(report.to_json(**summary))
+
+
 @platform_login_required
 @use_args(PlatformEditSchema)
 @use_kwargs({'Id': fields.Int()}, location='match_info')
@@ -515,8 +577,21 @@ async def get_platform(request: web.Request, Id: int) -> web.Response:
 
 @platform_login_required
 async def get_filecoin_network(request: web.Request) -> web.Response:
-    network_info = await request.app['db'].get_filecoin_network_info()
-    return web.json_response(network_info)
+    snapshot = request.app['network'].snapshot
+    return web.Response(body=snapshot.body, content_type='application/json', headers={'ETag': snapshot.etag})
+
+
+@platform_login_required
+@use_kwargs({
+    'from_at': fields.AwareDateTime(data_key='from', required=True, default_timezone=timezone.utc),
+    'to_at': fields.AwareDateTime(data_key='to', missing=None, default_timezone=timezone.utc),
+    'step': fields.Str(missing=None, validate=validate.OneOf(HISTORY_STEPS)),
+}, location='query')
+async def get_filecoin_network_history(request: web.Request, from_at: datetime, to_at: Optional[datetime], step: Optional[str]) -> web.Response:
+    to_at = to_at or datetime.now(timezone.utc)
+    step = history_step(from_at, to_at, step)
+    history = await request.app['db'].get_filecoin_network_history(from_at, to_at, step)
+    return web.json_response(history)
 
 
 @platform_login_required
@@ -568,7 +643,7 @@ async def edit_agreement(request: web.Request, agreement: Dict[str, Any], platfo
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    id = await request.app['db'].platform.edit_agreement(Id, agreement['title'], agreement['content'])
+    id = await request.app['db'].platform.edit_agreement(Id, agreement['title'], agreement['content'], platform_id=platform_id)
     return web.json_response({})
 
 
@@ -616,7 +691,7 @@ async def edit_notice(request: web.Request, notice: Dict[str, Any], platform_id:
         raise HTTPForbidden(reason='此账号无权访问')
 
     await request.app['db'].platform.edit_notice(
-        Id, notice['title'], notice['content'], notice['display_popup'], notice['read_confirm'])
+        Id, notice['title'], notice['content'], notice['display_popup'], notice['read_confirm'], platform_id=platform_id)
     return web.json_response({})
 
 
@@ -627,7 +702,8 @@ async def publish_notice(request: web.Request, platform_id: int, Id: int) -> web
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    await request.app['db'].platform.publish_notice(Id)
+    await request.app['db'].platform.publish_notice(Id, platform_id=platform_id)
+    request.app['push'].broadcast('notice', {'Id': Id, 'action': 'publish'}, platform_id)
     return web.json_response({})
 
 
@@ -638,7 +714,8 @@ async def revoke_notice(request: web.Request, platform_id: int, Id: int) -> web.
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    await request.app['db'].platform.revoke_notice(Id)
+    await request.app['db'].platform.revoke_notice(Id, platform_id=platform_id)
+    request.app['push'].broadcast('notice', {'Id': Id, 'action': 'revoke'}, platform_id)
     return web.json_response({})
 
 
@@ -654,6 +731,31 @@ async def create_albums(request: web.Request, platform_id: int, title: str) -> w
     return web.json_response({'Id': id})
 
 
+@platform_login_required
+@use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
+@use_kwargs({'ids': DelimitedList(fields.Int(), required=True, validate=validate.Length(min=1, max=MAX_ALBUM_BATCH))}, location='query')
+async def get_albums(request: web.Request, platform_id: int, ids: List[int]) -> web.Response:
+    session = await get_platform_session(request)
+    if platform_id not in session['platform_ids']:
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    albums = await request.app['db'].platform.fetch_albums(platform_id, ids)
+    return web.json_response(with_albums_urls(albums))
+
+
+@platform_login_required
+@use_kwargs({'platform_id': fields.Int(data_key='platformId'), 'Id': fields.Int()}, location='match_info')
+async def get_album_photos(request: web.Request, platform_id: int, Id: int) -> web.Response:
+    session = await get_platform_session(request)
+    if platform_id not in session['platform_ids']:
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    album = await request.app['db'].platform.fetch_album_photos(platform_id, Id)
+    if album is None:
+        raise web.HTTPNotFound(reason='相册未找到')
+    return web.json_response(with_album_urls(album))
+
+
 @platform_login_required
 @use_kwargs({'platform_id': fields.Int(data_key='platformId'), 'Id': fields.Int()}, location='match_info')
 async def get_photo(request: web.Request, platform_id: int, Id: int) -> web.Response:
@@ -662,20 +764,57 @@ async def get_photo(request: web.Request, platform_id: int, Id: int) -> web.Resp
         raise HTTPForbidden(reason='此账号无权访问')
 
     photo = await request.app['db'].platform.get_photo(platform_id, Id)
-    return web.json_response(photo)
+    if not photo:
+        raise web.HTTPNotFound(reason='图片未找到')
+    return web.json_response(with_photo_url(photo))
+
+
+async def _read_multipart_photo(request: web.Request) -> Dict[str, Any]:
+    photo: Dict[str, Any] = {'album_id': None}
+    reader = await request.multipart()
+    async for part in reader:
+        if part.name == 'photo':
+            digest, _, mime_type = await request.app['blobs'].put_part(part, MAX_PHOTO_SIZE)
+            photo.update(digest=digest, mime_type=mime_type)
+        elif part.name == 'albumId':
+            value = await part.text()
+            try:
+                photo['album_id'] = int(value) if value else None
+            except ValueError:
+                raise HTTPBadRequest(reason='albumId 参数不正确')
+    if 'digest' not in photo:
+        raise HTTPBadRequest(reason='缺少图片')
+    return photo
 
 
 @platform_login_required
-@use_args(PhotoSchema)
 @use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
-async def upload_photo(request: web.Request, photo: Dict[str, Any], platform_id: int) -> web.Response:
+async def upload_photo(request: web.Request, platform_id: int) -> web.Response:
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
+    if request.content_type.startswith('multipart/'):
+        photo = await _read_multipart_photo(request)
+    else:
+        # legacy clients still post the image base64 encoded in JSON
+        photo = await parser.parse(PhotoSchema(), request)
+        data = decode_base64_photo(photo.get('photo') or '')
+        if len(data) > MAX_PHOTO_SIZE:
+            raise web.HTTPRequestEntityTooLarge(max_size=MAX_PHOTO_SIZE, actual_size=len(data))
+        photo['digest'], _, photo['mime_type'] = await request.app['blobs'].put_bytes(data)
+    if photo['mime_type'] is None:
+        raise HTTPBadRequest(reason='不支持的图片格式')
+    # the size is measured rather than taken from the client
+    try:
+        photo['width'], photo['height'] = await request.app['images'].measure(photo['digest'])
+    except Exception as exc:
+        raise HTTPBadRequest(reason=f'图片无法解析: {str(exc)}')
+
     id = await request.app['db'].platform.upload_photo(
-        platform_id, photo['mime_type'], photo['height'], photo['width'], photo['photo'], photo['album_id'])
-    return web.json_response({'Id': id})
+        platform_id, photo['mime_type'], photo['height'], photo['width'], blob_ref(photo['digest']), photo['album_id'])
+    request.app['images'].prepare(photo['digest'])
+    return web.json_response(dict(with_photo_url({'photo': blob_ref(photo['digest'])}), Id=id))
 
 
 @platform_login_required
@@ -685,7 +824,8 @@ async def remove_photo(request: web.Request, platform_id: int, Id: int) -> web.R
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    await request.app['db'].platform.remove_photo(Id)
+    if not await request.app['db'].platform.remove_photo(platform_id, Id):
+        raise web.HTTPNotFound(reason='图片未找到')
     return web.json_response({})
 
 
@@ -714,14 +854,14 @@ async def rebind_customer_referrer(request: web.Request, platform_id: int, Id: i
 
 @platform_login_required
 @use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
-@use_kwargs({'filter_by': fields.Str(data_key='filterBy', missing='all'), 'filter': fields.Str(missing=None)}, location='query')
-async def get_customer_list(request: web.Request, platform_id: int, filter_by: str, filter: str) -> web.Response:
+@use_kwargs({'filter_by': fields.Str(data_key='filterBy', missing='all'), 'filter': fields.Str(missing=None), **PAGE_ARGS}, location='query')
+async def get_customer_list(request: web.Request, platform_id: int, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    customers = await request.app['db'].platform.fetch_customer_list(platform_id, filter_by, filter)
-    return web.json_response(customers)
+    customers = await request.app['db'].platform.fetch_customer_list(platform_id, filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(customers, limit)
 
 
 @platform_login_required
@@ -740,6 +880,36 @@ async def create_customer(request: web.Request, customer: Dict[str, Any], platfo
     return web.json_response({'Id': id})
 
 
+@platform_login_required
+@use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
+@use_kwargs({'import_format': fields.Str(data_key='format', missing=None, validate=validate.OneOf(BULK_FORMATS))}, location='query')
+async def import_customers(request: web.Request, platform_id: int, import_format: Optional[str]) -> web.Response:
+    session = await get_platform_session(request)
+    if platform_id not in session['platform_ids']:
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    report = BulkReport()
+    chunks = iter_chunks(request, bulk_format(request, import_format), CustomerImportRowSchema(), report)
+    summary = await request.app['db'].platform.import_customers(platform_id, chunks)
+    report.add_errors(summary.pop('errors', None))
+    return web.json_response(report.to_json(**summary))
+
+
+@platform_login_required
+@use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
+@use_kwargs({'import_format': fields.Str(data_key='format', missing=None, validate=validate.OneOf(BULK_FORMATS))}, location='query')
+async def import_customer_referrers(request: web.Request, platform_id: int, import_format: Optional[str]) -> web.Response:
+    session = await get_platform_session(request)
+    if platform_id not in session['platform_ids']:
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    report = BulkReport()
+    chunks = iter_chunks(request, bulk_format(request, import_format), CustomerReferrerRowSchema(), report)
+    summary = await request.app['db'].platform.import_customer_referrers(platform_id, chunks)
+    report.add_errors(summary.pop('errors', None))
+    return web.json_response(report.to_json(**summary))
+
+
 @platform_login_required
 @use_args(CustomerSchema)
 @use_kwargs({'platform_id': fields.Int(data_key='platformId'), 'Id': fields.Int()}, location='match_info')
@@ -827,7 +997,9 @@ async def edit_product(request: web.Request, product: Dict[str, Any], platform_i
                                                   product['name'], product['sale_unit'], product['min_units_for_sale'], product['stock_qty'],
                                                   product['price'], product['market_price'], product[
                                                       'service_fee_percent'], product['hosting_days'],
-                                                  product['cover'], product['photos'], product['sale_keywords'], product['intro'], product['description'])
+                                                  product['cover'], product['photos'], product['sale_keywords'], product['intro'], product['description'],
+                                                  platform_id=platform_id)
+    request.app['purchases'].invalidate(Id)
     return web.json_response({})
 
 
@@ -861,11 +1033,12 @@ async def change_product_state(request: web.Request, platform_id: int, Id: int,
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    await request.app['db'].platform.change_product_state(Id, state)
+    await request.app['db'].platform.change_product_state(Id, state, platform_id=platform_id)
     return web.json_response({})
 
 
 @platform_login_required
+@idempotent(get_platform_session)
 @use_args(PurchaseProductSchema)
 @use_kwargs({'platform_id': fields.Int(data_key='platformId'), 'Id': fields.Int()}, location='match_info')
 async def purchase_product(request: web.Request, purchase: Dict[str, Any], platform_id: int, Id: int) -> web.Response:
@@ -875,7 +1048,7 @@ async def purchase_product(request: web.Request, purchase: Dict[str, Any], platf
 
     order_id = await request.app['db'].platform.purchase_product(Id,
                                                                  purchase['customer_id'], purchase['qty'], purchase['paid_amount'],
-                                                                 purchase['grant_qty'], purchase['internal_comment'])
+                                                                 purchase['grant_qty'], purchase['internal_comment'], platform_id=platform_id)
 
     if order_id <= 0:
         if order_id == -2:
@@ -885,19 +1058,37 @@ async def purchase_product(request: web.Request, purchase: Dict[str, Any], platf
         else:
             raise HTTPServerError(reason="创建商品失败, 请联系客服")
 
+    # stock taken outside the purchase engine
+    request.app['purchases'].invalidate(Id)
     return web.json_response({'Id': order_id})
 
 
 @platform_login_required
 @use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
-@use_kwargs({'filter_by': fields.Str(data_key='filterBy'), 'filter': fields.Str(data_key='filter')}, location='query')
-async def get_order_list(request: web.Request, platform_id: int, filter_by: str, filter: str) -> web.Response:
+@use_kwargs({'filter_by': fields.Str(data_key='filterBy'), 'filter': fields.Str(data_key='filter'), **PAGE_ARGS}, location='query')
+async def get_order_list(request: web.Request, platform_id: int, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    orders = await request.app['db'].platform.fetch_order_list(platform_id, filter_by, filter)
-    return web.json_response(orders)
+    orders = await request.app['db'].platform.fetch_order_list(platform_id, filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(orders, limit)
+
+
+@platform_login_required
+@use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
+@use_kwargs({
+    'filter_by': fields.Str(data_key='filterBy'),
+    'filter': fields.Str(data_key='filter'),
+    'export_format': fields.Str(data_key='format', missing='ndjson', validate=validate.OneOf(EXPORT_FORMATS)),
+}, location='query')
+async def export_order_list(request: web.Request, platform_id: int, filter_by: str, filter: str, export_format: str) -> web.StreamResponse:
+    session = await get_platform_session(request)
+    if platform_id not in session['platform_ids']:
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    pages = request.app['db'].platform.export_order_list(platform_id, filter_by, filter)
+    return await stream_rows(request, pages, export_format, f'orders-{platform_id}')
 
 
 @platform_login_required
@@ -1026,6 +1217,34 @@ async def finish_order(request: web.Request, platform_id: int, Id: int) -> web.R
 
 
 @platform_login_required
+@use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
+@use_kwargs({
+    'ids': fields.List(fields.Int(), required=True, validate=validate.Length(min=1, max=MAX_TRANSITION_BATCH)),
+    'action': fields.Str(required=True, validate=validate.OneOf(list(ORDER_TRANSITIONS))),
+    'few_days': fields.Int(data_key='fewDays', missing=None),
+    'dry_run': fields.Bool(data_key='dryRun', missing=False),
+})
+async def transition_orders(request: web.Request, platform_id: int, ids: List[int], action: str, few_days: Optional[int], dry_run: bool) -> web.Response:
+    session = await get_platform_session(request)
+    if platform_id not in session['platform_ids']:
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    transition = ORDER_TRANSITIONS[action]
+    if transition.owner_only and session['user_role'] != 'CenterAdmin':
+        raise HTTPForbidden(reason='此账号无权访问')
+    try:
+        args, id_arg = transition_args(transition, platform_id, {'fewDays': few_days})
+    except KeyError as exc:
+        raise web.HTTPBadRequest(reason=f'缺少参数 {exc.args[0]}')
+
+    # a dry run tries every order and rolls it back, reporting what would apply now
+    results = await request.app['db'].platform.transition_orders(
+        platform_id, ids, transition.action, transition.function, args, id_arg, dry_run=dry_run)
+    return web.json_response({'results': results, 'summary': summarize(results), 'dryRun': dry_run})
+
+
+@platform_login_required
+@idempotent(get_platform_session)
 @use_args(OrderFiatPaymentSchema)
 @use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
 async def create_order_fiat_payment(request: web.Request, payment: Dict[str, Any], platform_id: int) -> web.Response:
@@ -1041,14 +1260,14 @@ async def create_order_fiat_payment(request: web.Request, payment: Dict[str, Any
 
 @platform_login_required
 @use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
-@use_kwargs({'filter_by': fields.Str(data_key='filterBy', required=True), 'filter': fields.Str(missing=None)}, location='query')
-async def get_order_fiat_payment_list(request: web.Request, platform_id: int, filter_by: str, filter: str) -> web.Response:
+@use_kwargs({'filter_by': fields.Str(data_key='filterBy', required=True), 'filter': fields.Str(missing=None), **PAGE_ARGS}, location='query')
+async def get_order_fiat_payment_list(request: web.Request, platform_id: int, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    payments = await request.app['db'].platform.fetch_order_fiat_payment_list(platform_id, filter_by, filter)
-    return web.json_response(payments)
+    payments = await request.app['db'].platform.fetch_order_fiat_payment_list(platform_id, filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(payments, limit)
 
 
 @platform_login_required
@@ -1066,14 +1285,14 @@ async def create_order_crypto_payment(request: web.Request, payment: Dict[str, A
 
 @platform_login_required
 @use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
-@use_kwargs({'filter_by': fields.Str(data_key='filterBy', required=True), 'filter': fields.Str(missing=None)}, location='query')
-async def get_order_crypto_payment_list(request: web.Request, platform_id: int, filter_by: str, filter: str) -> web.Response:
+@use_kwargs({'filter_by': fields.Str(data_key='filterBy', required=True), 'filter': fields.Str(missing=None), **PAGE_ARGS}, location='query')
+async def get_order_crypto_payment_list(request: web.Request, platform_id: int, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    payments = await request.app['db'].platform.fetch_order_crypto_payment_list(platform_id, filter_by, filter)
-    return web.json_response(payments)
+    payments = await request.app['db'].platform.fetch_order_crypto_payment_list(platform_id, filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(payments, limit)
 
 
 @platform_login_required
@@ -1090,17 +1309,18 @@ async def get_filecoin_seal_cost_for_order(request: web.Request, platform_id: in
 
 @platform_login_required
 @use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
-@use_kwargs({'filter_by': fields.Str(data_key='filterBy', required=True), 'filter': fields.Str(missing=None)}, location='query')
-async def get_filecoin_seal_cost_payment_list(request: web.Request, platform_id: int, filter_by: str, filter: str) -> web.Response:
+@use_kwargs({'filter_by': fields.Str(data_key='filterBy', required=True), 'filter': fields.Str(missing=None), **PAGE_ARGS}, location='query')
+async def get_filecoin_seal_cost_payment_list(request: web.Request, platform_id: int, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    payments = await request.app['db'].platform.get_filecoin_seal_cost_payment_list(platform_id, filter_by, filter)
-    return web.json_response(payments)
+    payments = await request.app['db'].platform.get_filecoin_seal_cost_payment_list(platform_id, filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(payments, limit)
 
 
 @platform_login_required
+@idempotent(get_platform_session)
 @use_args(OrderFilecoinSealCostPayment)
 @use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
 async def create_filecoin_seal_cost_payment(request: web.Request, payment: Dict[str, Any], platform_id: int) -> web.Response:
@@ -1118,14 +1338,31 @@ async def create_filecoin_seal_cost_payment(request: web.Request, payment: Dict[
 @use_kwargs({
     'filter_by': fields.Str(data_key='filterBy', required=True),
     'filter': fields.Str(data_key='filter', missing=None),
+    **PAGE_ARGS,
 }, location='query')
-async def get_filecoin_withdraw_list(request: web.Request, platform_id: int, filter_by: str, filter: str) -> web.Response:
+async def get_filecoin_withdraw_list(request: web.Request, platform_id: int, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    withdraw_list = await request.app['db'].platform.fetch_filecoin_withdraw_list(platform_id, filter_by, filter)
-    return web.json_response(withdraw_list)
+    withdraw_list = await request.app['db'].platform.fetch_filecoin_withdraw_list(platform_id, filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(withdraw_list, limit)
+
+
+@platform_login_required
+@use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
+@use_kwargs({
+    'filter_by': fields.Str(data_key='filterBy', required=True),
+    'filter': fields.Str(data_key='filter', missing=None),
+    'export_format': fields.Str(data_key='format', missing='ndjson', validate=validate.OneOf(EXPORT_FORMATS)),
+}, location='query')
+async def export_filecoin_withdraw_list(request: web.Request, platform_id: int, filter_by: str, filter: str, export_format: str) -> web.StreamResponse:
+    session = await get_platform_session(request)
+    if platform_id not in session['platform_ids']:
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    pages = request.app['db'].platform.export_filecoin_withdraw_list(platform_id, filter_by, filter)
+    return await stream_rows(request, pages, export_format, f'filecoin-withdraws-{platform_id}')
 
 
 @platform_login_required
@@ -1159,7 +1396,7 @@ async def complete_filecoin_withdraw_apply(request: web.Request, platform_id: in
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    await request.app['db'].platform.complete_filecoin_withdraw_apply(Id, message_id, comment)
+    await request.app['db'].platform.complete_filecoin_withdraw_apply(Id, message_id, comment, platform_id=platform_id)
     return web.json_response({})
 
 
@@ -1171,7 +1408,7 @@ async def refuse_filecoin_withdraw_apply(request: web.Request, platform_id: int,
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    await request.app['db'].platform.refuse_filecoin_withdraw_apply(Id, comment)
+    await request.app['db'].platform.refuse_filecoin_withdraw_apply(Id, comment, platform_id=platform_id)
     return web.json_response({})
 
 
@@ -1192,14 +1429,15 @@ async def get_filecoin_storage(request: web.Request, platform_id: int, order_id:
 @use_kwargs({
     'filter_by': fields.Str(data_key='filterBy', required=True),
     'filter': fields.Str(data_key='filter', missing=None),
+    **PAGE_ARGS,
 }, location='query')
-async def get_filecoin_storage_list(request: web.Request, platform_id: int, filter_by: str, filter: str) -> web.Response:
+async def get_filecoin_storage_list(request: web.Request, platform_id: int, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    storage_list = await request.app['db'].platform.fetch_filecoin_storage_list(platform_id, filter_by, filter)
-    return web.json_response(storage_list)
+    storage_list = await request.app['db'].platform.fetch_filecoin_storage_list(platform_id, filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(storage_list, limit)
 
 
 @platform_login_required
@@ -1217,6 +1455,21 @@ async def add_filecoin_sealed_storage(request: web.Request, platform_id: int, or
     return web.json_response({})
 
 
+@platform_login_required
+@use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
+@use_kwargs({'import_format': fields.Str(data_key='format', missing=None, validate=validate.OneOf(BULK_FORMATS))}, location='query')
+async def import_filecoin_sealed_storage(request: web.Request, platform_id: int, import_format: Optional[str]) -> web.Response:
+    session = await get_platform_session(request)
+    if platform_id not in session['platform_ids']:
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    report = BulkReport()
+    chunks = iter_chunks(request, bulk_format(request, import_format), SealedStorageRowSchema(), report)
+    summary = await request.app['db'].platform.ingest_sealed_storage(platform_id, chunks)
+    report.add_errors(summary.pop('errors', None))
+    return web.json_response(report.to_json(**summary))
+
+
 @platform_login_required
 @use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
 @use_kwargs({
@@ -1227,6 +1480,8 @@ async def create_filecoin_settlement(request: web.Request, platform_id: int, min
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
+    if session['user_role'] != 'CenterAdmin':
+        raise HTTPForbidden(reason='此账号无权访问')
 
     settlement_no = await request.app['db'].platform.create_filecoin_settlement(platform_id, mining_efficiency, comment)
     return web.json_response({'settlement_no': settlement_no})
@@ -1245,8 +1500,9 @@ async def create_filecoin_settlement_in_day(request: web.Request, platform_id: i
         raise HTTPForbidden(reason='此账号无权访问')
     if session['user_role'] != 'CenterAdmin':
         raise HTTPForbidden(reason='此账号无权访问')
-    settlement_no = await request.app['db'].platform.create_filecoin_settlement_in_day(platform_id, settle_day_at, mining_efficiency, comment)
-    return web.json_response({'settlement_no': settlement_no})
+    settlement_no, created = await request.app['db'].platform.create_filecoin_settlement_in_day(
+        platform_id, settle_day_at, mining_efficiency, comment, owner=f"manual:{session['user_id']}")
+    return web.json_response({'settlement_no': settlement_no, 'created': created})
 
 
 @platform_login_required
@@ -1260,7 +1516,7 @@ async def confirm_filecoin_settlement(request: web.Request, platform_id: int, se
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    await request.app['db'].platform.confirm_filecoin_settlement(settlement_no, mining_efficiency, comment)
+    await request.app['db'].platform.confirm_filecoin_settlement(settlement_no, mining_efficiency, comment, platform_id=platform_id)
     return web.json_response({})
 
 
@@ -1269,14 +1525,31 @@ async def confirm_filecoin_settlement(request: web.Request, platform_id: int, se
 @use_kwargs({
     'filter_by': fields.Str(data_key='filterBy', required=True),
     'filter': fields.Str(data_key='filter', missing=None),
+    **PAGE_ARGS,
 }, location='query')
-async def get_filecoin_settlement_list(request: web.Request, platform_id: int, filter_by: str, filter: str) -> web.Response:
+async def get_filecoin_settlement_list(request: web.Request, platform_id: int, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    settlement_list = await request.app['db'].platform.fetch_filecoin_settlement_list(platform_id, filter_by, filter)
-    return web.json_response(settlement_list)
+    settlement_list = await request.app['db'].platform.fetch_filecoin_settlement_list(platform_id, filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(settlement_list, limit)
+
+
+@platform_login_required
+@use_kwargs({'platform_id': fields.Int(data_key='platformId')}, location='match_info')
+@use_kwargs({
+    'filter_by': fields.Str(data_key='filterBy', required=True),
+    'filter': fields.Str(data_key='filter', missing=None),
+    'export_format': fields.Str(data_key='format', missing='ndjson', validate=validate.OneOf(EXPORT_FORMATS)),
+}, location='query')
+async def export_filecoin_settlement_list(request: web.Request, platform_id: int, filter_by: str, filter: str, export_format: str) -> web.StreamResponse:
+    session = await get_platform_session(request)
+    if platform_id not in session['platform_ids']:
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    pages = request.app['db'].platform.export_filecoin_settlement_list(platform_id, filter_by, filter)
+    return await stream_rows(request, pages, export_format, f'filecoin-settlements-{platform_id}')
 
 
 @platform_login_required
@@ -1295,14 +1568,15 @@ async def get_filecoin_settlement(request: web.Request, platform_id: int, settle
 @use_kwargs({
     'filter_by': fields.Str(data_key='filterBy', required=True),
     'filter': fields.Str(data_key='filter', missing=None),
+    **PAGE_ARGS,
 }, location='query')
-async def get_filecoin_settlement_platform_list(request: web.Request, platform_id: int, filter_by: str, filter: str) -> web.Response:
+async def get_filecoin_settlement_platform_list(request: web.Request, platform_id: int, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    settlement_list = await request.app['db'].platform.fetch_filecoin_settlement_platform_list(platform_id, filter_by, filter)
-    return web.json_response(settlement_list)
+    settlement_list = await request.app['db'].platform.fetch_filecoin_settlement_platform_list(platform_id, filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(settlement_list, limit)
 
 
 @platform_login_required
@@ -1332,14 +1606,15 @@ async def get_filecoin_settlement_referrer(request: web.Request, platform_id: in
 @use_kwargs({
     'filter_by': fields.Str(data_key='filterBy', required=True),
     'filter': fields.Str(data_key='filter', missing=None),
+    **PAGE_ARGS,
 }, location='query')
-async def get_filecoin_settlement_referrer_list(request: web.Request, platform_id: int, filter_by: str, filter: str) -> web.Response:
+async def get_filecoin_settlement_referrer_list(request: web.Request, platform_id: int, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    settlement_list = await request.app['db'].platform.get_filecoin_settlement_referrer_list(platform_id, filter_by, filter)
-    return web.json_response(settlement_list)
+    settlement_list = await request.app['db'].platform.get_filecoin_settlement_referrer_list(platform_id, filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(settlement_list, limit)
 
 
 @platform_login_required
@@ -1535,7 +1810,7 @@ async def edit_flash(request: web.Request, flash: Dict[str, Any], platform_id: i
         raise HTTPForbidden(reason='此账号无权访问')
 
     await request.app['db'].platform.edit_flash(
-        Id, flash['title'], flash['content'], flash['display_popup'], flash['read_confirm'])
+        Id, flash['title'], flash['content'], flash['display_popup'], flash['read_confirm'], platform_id=platform_id)
     return web.json_response({})
 
 
@@ -1546,7 +1821,8 @@ async def publish_flash(request: web.Request, platform_id: int, Id: int) -> web.
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    await request.app['db'].platform.publish_flash(Id)
+    await request.app['db'].platform.publish_flash(Id, platform_id=platform_id)
+    request.app['push'].broadcast('flash', {'Id': Id, 'action': 'publish'}, platform_id)
     return web.json_response({})
 
 
@@ -1557,7 +1833,8 @@ async def revoke_flash(request: web.Request, platform_id: int, Id: int) -> web.R
     if platform_id not in session['platform_ids']:
         raise HTTPForbidden(reason='此账号无权访问')
 
-    await request.app['db'].platform.revoke_flash(Id)
+    await request.app['db'].platform.revoke_flash(Id, platform_id=platform_id)
+    request.app['push'].broadcast('flash', {'Id': Id, 'action': 'revoke'}, platform_id)
     return web.json_response({})
 
 
@@ -1622,14 +1899,14 @@ async def discarded_filecoin_settlement(request: web.Request, platform_id: int,
 
 
 @platform_login_required
-@use_kwargs({'filter_by': fields.Str(data_key='filterBy', missing='all'), 'filter': fields.Str(missing=None)}, location='query')
-async def owner_get_customer_list(request: web.Request, filter_by: str, filter: str) -> web.Response:
+@use_kwargs({'filter_by': fields.Str(data_key='filterBy', missing='all'), 'filter': fields.Str(missing=None), **PAGE_ARGS}, location='query')
+async def owner_get_customer_list(request: web.Request, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if session['user_role'] != 'CenterAdmin':
         raise HTTPForbidden(reason='此账号无权访问')
 
-    node_customer_list = await request.app['db'].platform.fetch_owner_get_customer_list(filter_by,  filter)
-    return web.json_response(node_customer_list)
+    node_customer_list = await request.app['db'].platform.fetch_owner_get_customer_list(filter_by,  filter, *keyset_args(limit, cursor))
+    return page_response(node_customer_list, limit)
 
 
 @platform_login_required
@@ -1684,14 +1961,14 @@ async def owner_customer_independent_node_finish(request: web.Request, id: int)
 
 
 @platform_login_required
-@use_kwargs({'filter_by': fields.Str(data_key='filterBy', missing='all'), 'filter': fields.Str(missing=None)}, location='query')
-async def owner_customer_independent_node_withdraw_list(request: web.Request, filter_by: str, filter: str) -> web.Response:
+@use_kwargs({'filter_by': fields.Str(data_key='filterBy', missing='all'), 'filter': fields.Str(missing=None), **PAGE_ARGS}, location='query')
+async def owner_customer_independent_node_withdraw_list(request: web.Request, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if session['user_role'] != 'CenterAdmin':
         raise HTTPForbidden(reason='此账号无权访问')
 
-    node_customer_withdraw_list = await request.app['db'].platform.fetch_owner_customer_independent_node_withdraw_list(filter_by, filter)
-    return web.json_response(node_customer_withdraw_list)
+    node_customer_withdraw_list = await request.app['db'].platform.fetch_owner_customer_independent_node_withdraw_list(filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(node_customer_withdraw_list, limit)
 
 
 @platform_login_required
@@ -1731,14 +2008,14 @@ async def owner_refuse_customer_independent_node_withdraw_apply(request: web.Req
 
 
 @platform_login_required
-@use_kwargs({'filter_by': fields.Str(data_key='filterBy', missing='all'), 'filter': fields.Str(missing=None)}, location='query')
-async def owner_customer_expenses_list(request: web.Request, filter_by: str, filter: str) -> web.Response:
+@use_kwargs({'filter_by': fields.Str(data_key='filterBy', missing='all'), 'filter': fields.Str(missing=None), **PAGE_ARGS}, location='query')
+async def owner_customer_expenses_list(request: web.Request, filter_by: str, filter: str, limit: Optional[int], cursor: Optional[str]) -> web.Response:
     session = await get_platform_session(request)
     if session['user_role'] != 'CenterAdmin':
         raise HTTPForbidden(reason='此账号无权访问')
 
-    customer_expenses_list = await request.app['db'].platform.fetch_owner_customer_expenses_list(filter_by, filter)
-    return web.json_response(customer_expenses_list)
+    customer_expenses_list = await request.app['db'].platform.fetch_owner_customer_expenses_list(filter_by, filter, *keyset_args(limit, cursor))
+    return page_response(customer_expenses_list, limit)
 
 
 @platform_login_required
@@ -1808,4 +2085,93 @@ async def order_stop(request: web.Request,platform_id: int,order_id: int,few_day
         raise HTTPForbidden(reason='此账号无权访问')
 
     await request.app['db'].platform.order_stop(platform_id, order_id,few_days)
-    return web.json_response({})
\ No newline at end of file
+    return web.json_response({})
+
+
+@platform_login_required
+async def owner_get_cache_stats(request: web.Request) -> web.Response:
+    session = await get_platform_session(request)
+    if session['user_role'] != 'CenterAdmin':
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    return web.json_response(request.app['db'].cache.stats())
+
+
+@platform_login_required
+async def owner_get_job_list(request: web.Request) -> web.Response:
+    session = await get_platform_session(request)
+    if session['user_role'] != 'CenterAdmin':
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    jobs = await request.app['db'].fetch_job_list()
+    return web.json_response({'jobs': jobs, 'worker': request.app['jobs'].stats()})
+
+
+@platform_login_required
+async def owner_get_slow_requests(request: web.Request) -> web.Response:
+    session = await get_platform_session(request)
+    if session['user_role'] != 'CenterAdmin':
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    sampler = request.app['sampler']
+    return web.json_response({'since': sampler.since, 'requests': sampler.recent_slow_requests()})
+
+
+@platform_login_required
+async def owner_get_db_function_stats(request: web.Request) -> web.Response:
+    session = await get_platform_session(request)
+    if session['user_role'] != 'CenterAdmin':
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    sampler = request.app['sampler']
+    return web.json_response({'since': sampler.since, 'functions': sampler.function_stats()})
+
+
+@platform_login_required
+@use_kwargs({
+    'settle_day_at': fields.Date(data_key='settleDayAt', required=True),
+    'mining_efficiency': fields.Int(data_key='miningEfficiency', missing=None),
+    'platform_ids': fields.List(fields.Int(), data_key='platformIds', missing=None),
+    'comment': fields.Str(missing=None),
+})
+async def owner_run_filecoin_settlement(request: web.Request, settle_day_at: date, mining_efficiency: Optional[int], platform_ids: Optional[List[int]], comment: Optional[str]) -> web.Response:
+    session = await get_platform_session(request)
+    if session['user_role'] != 'CenterAdmin':
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    request.app['settlement'].start_day(settle_day_at, mining_efficiency, platform_ids, comment)
+    return web.json_response({})
+
+
+@platform_login_required
+@use_kwargs({'settle_day_at': fields.Date(data_key='settleDayAt', required=True)}, location='query')
+async def owner_get_filecoin_settlement_progress(request: web.Request, settle_day_at: date) -> web.Response:
+    session = await get_platform_session(request)
+    if session['user_role'] != 'CenterAdmin':
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    progress = await request.app['settlement'].progress(settle_day_at)
+    return web.json_response(progress)
+
+
+@platform_login_required
+@use_kwargs({'settle_day_at': fields.Date(data_key='settleDayAt', missing=None)}, location='query')
+async def owner_get_dashboard(request: web.Request, settle_day_at: Optional[date]) -> web.Response:
+    session = await get_platform_session(request)
+    if session['user_role'] != 'CenterAdmin':
+        raise HTTPForbidden(reason='此账号无权访问')
+
+    db = request.app['db'].platform
+    settle_day_at = settle_day_at or date.today() - timedelta(days=1)
+    # every section takes its own pool connection, so the page costs the
+    # slowest query instead of their sum
+    sections, errors = await gather_sections({
+        'statitics': db.fetch_owner_get_filecoin_statitics(),
+        'platforms': db.owner_fetch_platform_list(),
+        'settlements': db.fetch_owner_get_settlement_newest_list(),
+        'profites': db.fetch_owner_get_filecoin_profites_list(settle_day_at),
+        'withdrawApplies': db.owner_fetch_platform_filecoin_withdraw_apply_list(0, 'all'),
+    }, DASHBOARD_SECTION_TIMEOUT)
+    for name, reason in errors.items():
+        logger.warning(f"""Dashboard section `{name}` unavailable, reason: {reason}""")
+    return web.json_response(dict(sections, errors=errors))
@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger('idempotency')
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# how long a response is replayed for the same key
+IDEMPOTENCY_TTL = 24 * 60 * 60
+# a key still pending after this long belongs to a request whose worker
+# died or could not store the response; retries are told the outcome is
+# unknown instead of running the request again
+IDEMPOTENCY_LEASE = 2 * 60
+# stored responses kept in memory per worker, the rest is read from PostgreSQL
+MEMORY_SIZE = 10000
+
+_Handler = Callable[..., Awaitable[web.StreamResponse]]
+
+
+class StoredResponse:
+    __slots__ = ('fingerprint', 'status', 'content_type', 'body', 'expires_at')
+
+    def __init__(self, fingerprint: str, status: int, content_type: str, body: bytes, expires_at: float):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.expires_at = expires_at
+
+    def replay(self) -> web.Response:
+        return web.Response(status=self.status, body=self.body, content_type=self.content_type,
+                            headers={'Idempotent-Replayed': 'true'})
+
+
+class IdempotencyStore:
+    """Responses of idempotent requests, by key.
+
+    Recent responses stay in a bounded in-memory LRU; every key is also
+    claimed in `yj_idempotency_key` (see sql/idempotency.sql) so a retry
+    that lands on another worker, or after a restart, is replayed too.
+    Concurrent retries on the same worker wait for the first request
+    instead of claiming the key again.
+
+    A key is released for a real retry only when the handler rejected the
+    request with an HTTP error, before any side effect. Once the handler
+    returned, or failed in a way that may have committed, the key stays
+    claimed until it expires: a response that cannot be replayed is marked
+    `unknown`, and so is a claim still pending after `lease` seconds, e.g.
+    because its response could not be stored. Retries of an `unknown` key
+    are answered 409 rather than run again.
+    """
+
+    def __init__(self, db, ttl: int = IDEMPOTENCY_TTL, size: int = MEMORY_SIZE, lease: int = IDEMPOTENCY_LEASE):
+        self.db = db
+        self.ttl = ttl
+        self.lease = lease
+        self.size = size
+        self._responses: 'OrderedDict[str, StoredResponse]' = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.replayed = 0
+        self.executed = 0
+
+    def _remember(self, key: str, response: StoredResponse):
+        self._responses[key] = response
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.size:
+            self._responses.popitem(last=False)
+
+    def _recall(self, key: str) -> Optional[StoredResponse]:
+        response = self._responses.get(key)
+        if response is None:
+            return None
+        if response.expires_at < time.time():
+            del self._responses[key]
+            return None
+        self._responses.move_to_end(key)
+        return response
+
+    async def run(self, key: str, fingerprint: str, handler: Callable[[], Awaitable[web.StreamResponse]]) -> web.StreamResponse:
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                await asyncio.shield(inflight)
+            except Exception:
+                pass
+
+        stored = self._recall(key)
+        if stored is None:
+            row = await self.db.begin_idempotency_key(key, fingerprint, self.ttl, self.lease)
+            if not row['o_claimed']:
+                if row['o_state'] == 'unknown':
+                    raise web.HTTPConflict(reason='请求结果未知, 请勿重复提交')
+                if row['o_state'] != 'done':
+                    raise web.HTTPConflict(reason='请求正在处理中, 请稍后重试')
+                stored = StoredResponse(row['o_fingerprint'], row['o_status'], row['o_content_type'],
+                                        bytes(row['o_body']), time.time() + self.ttl)
+                self._remember(key, stored)
+
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                raise web.HTTPUnprocessableEntity(reason='Idempotency-Key 已用于其他请求')
+            self.replayed += 1
+            return stored.replay()
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[key] = future
+        try:
+            try:
+                response = await handler()
+            except web.HTTPException:
+                # rejected by the handler itself, nothing was done
+                await asyncio.shield(self._release(key))
+                raise
+            except BaseException:
+                # may have committed, a retry must not run it again
+                await asyncio.shield(self._abandon(key))
+                raise
+            self.executed += 1
+            if not isinstance(response, web.Response) or not isinstance(response.body, bytes):
+                logger.warning(f"""Response to idempotency key {key} is not replayable, retries are answered as unknown""")
+                await asyncio.shield(self._abandon(key))
+                return response
+            stored = StoredResponse(fingerprint, response.status, response.content_type, response.body, time.time() + self.ttl)
+            # the side effect is done, a cancelled request must still record it;
+            # only a stored response is replayed, so every worker answers alike
+            if await asyncio.shield(self._finish(key, stored)):
+                self._remember(key, stored)
+            return response
+        finally:
+            del self._inflight[key]
+            future.set_result(None)
+
+    async def _finish(self, key: str, stored: StoredResponse) -> bool:
+        try:
+            await self.db.finish_idempotency_key(key, stored.status, stored.content_type, stored.body)
+            return True
+        except Exception as exc:
+            # never released: the claim stays pending and turns unknown after the lease
+            logger.error(f"""Finish idempotency key {key} failed, reason: {str(exc)}""")
+            await self._abandon(key)
+            return False
+
+    async def _abandon(self, key: str):
+        try:
+            await self.db.abandon_idempotency_key(key)
+        except Exception as exc:
+            logger.error(f"""Abandon idempotency key {key} failed, reason: {str(exc)}""")
+
+    async def _release(self, key: str):
+        try:
+            await self.db.release_idempotency_key(key)
+        except Exception as exc:
+            logger.error(f"""Release idempotency key {key} failed, reason: {str(exc)}""")
+
+    async def cleanup(self) -> int:
+        now = time.time()
+        for key in [key for key, response in self._responses.items() if response.expires_at < now]:
+            del self._responses[key]
+        return await self.db.cleanup_idempotency_keys()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'cached': len(self._responses), 'inflight': len(self._inflight),
+                'replayed': self.replayed, 'executed': self.executed}
+
+
+def idempotent(get_session: Callable[[web.Request], Awaitable[Any]]) -> Callable[[_Handler], _Handler]:
+    """Replay the stored response of a request repeated with the same `Idempotency-Key`.
+
+    Goes below the login decorator; requests without the header are
+    handled as before.
+    """
+    def decorator(fn: _Handler) -> _Handler:
+        @wraps(fn)
+        async def wrapped(request: web.Request, *args: Any, **kwargs: Any) -> web.StreamResponse:
+            client_key = request.headers.get(HEADER)
+            if not client_key:
+                return await fn(request, *args, **kwargs)
+            if len(client_key) > MAX_KEY_LENGTH:
+                raise web.HTTPBadRequest(reason='Idempotency-Key 过长')
+
+            session = await get_session(request)
+            key = hashlib.sha256(f'{request.path}\0{session.user_id}\0{client_key}'.encode('utf-8')).hexdigest()
+            # the body is cached by aiohttp, the argument parsers read it again
+            fingerprint = hashlib.sha256(await request.read()).hexdigest()
+            return await request.app['idempotency'].run(key, fingerprint, lambda: fn(request, *args, **kwargs))
+
+        return wrapped
+
+    return decorator
+
+
+async def cleanup_idempotency_keys(app: web.Application):
+    deleted = await app['idempotency'].cleanup()
+    if deleted:
+        logger.info(f"""Removed {deleted} expired idempotency keys""")
+
+
+async def _on_startup(app: web.Application):
+    store = IdempotencyStore(app['db'])
+    app['idempotency'] = store
+    for sub in app._subapps:
+        sub['idempotency'] = store
+
+
+def setup(app: web.Application):
+    app.on_startup.append(_on_startup)
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+from mining.blobs import IMMUTABLE, VARIANT_FORMATS, VARIANT_WIDTHS, variant_name
+
+logger = logging.getLogger('images')
+
+VARIANT_QUALITY = 80
+# left next to the variants of a blob Pillow cannot decode
+UNDECODABLE_MARKER = '.undecodable'
+
+
+class UndecodableImage(Exception):
+    pass
+
+
+def _measure(source: str) -> Tuple[int, int]:
+    from PIL import Image
+
+    with Image.open(source) as image:
+        # only the header is decoded
+        width, height = image.size
+        # EXIF orientations 5 to 8 rotate the picture by 90 degrees
+        if image.getexif().get(0x0112) in (5, 6, 7, 8):
+            width, height = height, width
+    return width, height
+
+
+def _render(source: str, targets: List[Tuple[int, str, str]]):
+    """Derive every (width, format, path) target from one decoded source.
+
+    Runs in a worker process; the import keeps Pillow out of the API
+    processes that never render anything.
+    """
+    from PIL import Image, ImageOps
+
+    # raised as our own type: only decoding marks a blob as broken, a full
+    # disk while saving must not
+    undecodable = (OSError, ValueError, SyntaxError, Image.DecompressionBombError)
+    try:
+        original = Image.open(source)
+    except undecodable as exc:
+        raise UndecodableImage(str(exc)) from None
+    with original:
+        try:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+        except undecodable as exc:
+            raise UndecodableImage(str(exc)) from None
+        for width, fmt, path in targets:
+            variant = image.copy()
+            # never upscale, a narrow original is served as is
+            variant.thumbnail((width, variant.height), Image.LANCZOS)
+            if fmt == 'jpeg' and variant.mode != 'RGB':
+                rgba = variant.convert('RGBA')
+                variant = Image.new('RGB', rgba.size, (255, 255, 255))
+                variant.paste(rgba, mask=rgba.getchannel('A'))
+            elif fmt == 'webp' and variant.mode not in ('RGB', 'RGBA'):
+                variant = variant.convert('RGBA')
+            tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+            variant.save(tmp, fmt.upper(), quality=VARIANT_QUALITY, optimize=fmt == 'jpeg')
+            os.replace(tmp, path)
+
+
+class ImagePipeline:
+    """Responsive variants of stored photos, rendered in a process pool.
+
+    Variants are derived right after an upload and otherwise on the first
+    request; concurrent requests for the same blob share one render. The
+    results are cached on disk next to the blobs, so they survive restarts
+    and are served with sendfile like the originals. So is the verdict on a
+    blob Pillow cannot decode: it is never submitted to the pool again.
+    """
+
+    def __init__(self, store, workers: Optional[int] = None):
+        self.store = store
+        self.root = Path(store.root) / 'variants'
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self._undecodable: Set[str] = set()
+        self.rendered = 0
+        self.failed = 0
+
+    def path(self, digest: str, width: int, fmt: str) -> Path:
+        return self.root / digest[:2] / digest / variant_name(width, fmt)
+
+    def _marker(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest / UNDECODABLE_MARKER
+
+    def undecodable(self, digest: str) -> bool:
+        if digest in self._undecodable:
+            return True
+        if self._marker(digest).is_file():
+            self._undecodable.add(digest)
+            return True
+        return False
+
+    def _mark_undecodable(self, digest: str):
+        self._undecodable.add(digest)
+        try:
+            self._marker(digest).touch()
+        except OSError as exc:
+            logger.error(f"""Mark blob {digest} undecodable failed, reason: {str(exc)}""")
+
+    def _flight(self, key: Tuple, digest: str, variants: List[Tuple[int, str]]) -> asyncio.Future:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(digest, variants))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return future
+
+    async def _run(self, digest: str, variants: List[Tuple[int, str]]):
+        targets = [(width, fmt, str(self.path(digest, width, fmt))) for width, fmt in variants]
+        if not targets:
+            return
+        self.path(digest, *variants[0]).parent.mkdir(parents=True, exist_ok=True)
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(self.executor, _render, str(self.store.path(digest)), targets)
+            self.rendered += len(targets)
+        except UndecodableImage as exc:
+            self.failed += 1
+            self._mark_undecodable(digest)
+            logger.warning(f"""Blob {digest} is not a decodable image, reason: {str(exc)}""")
+            raise
+        except Exception as exc:
+            self.failed += 1
+            logger.error(f"""Render variants of blob {digest} failed, reason: {str(exc)}""")
+            raise
+
+    async def measure(self, digest: str) -> Tuple[int, int]:
+        """Width and height of a stored image as displayed."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, _measure, str(self.store.path(digest)))
+
+    def prepare(self, digest: str) -> asyncio.Future:
+        """Render all missing variants of a freshly uploaded blob in the background."""
+        if self.undecodable(digest):
+            missing = []
+        else:
+            missing = [(width, fmt) for fmt in VARIANT_FORMATS for width in VARIANT_WIDTHS
+                       if not self.path(digest, width, fmt).is_file()]
+        future = self._flight((digest, ), digest, missing)
+        # the upload does not wait; errors are logged in _run
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return future
+
+    async def variant(self, digest: str, width: int, fmt: str) -> Path:
+        path = self.path(digest, width, fmt)
+        if path.is_file():
+            return path
+        if self.undecodable(digest):
+            raise UndecodableImage(digest)
+        eager = self._inflight.get((digest, ))
+        if eager is not None:
+            try:
+                await asyncio.shield(eager)
+            except Exception:
+                pass
+            if path.is_file():
+                return path
+            if self.undecodable(digest):
+                raise UndecodableImage(digest)
+        await asyncio.shield(self._flight((digest, width, fmt), digest, [(width, fmt)]))
+        return path
+
+    def close(self):
+        for future in list(self._inflight.values()):
+            future.cancel()
+        self.executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'inflight': len(self._inflight), 'rendered': self.rendered, 'failed': self.failed,
+                'undecodable': len(self._undecodable)}
+
+
+async def get_variant(request: web.Request) -> web.StreamResponse:
+    pipeline: ImagePipeline = request.app['images']
+    digest = request.match_info['digest']
+    width = int(request.match_info['width'])
+    fmt = request.match_info['format']
+    if width not in VARIANT_WIDTHS or fmt not in VARIANT_FORMATS or not pipeline.store.exists(digest):
+        raise web.HTTPNotFound()
+
+    etag = f'"{digest}-{variant_name(width, fmt)}"'
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers={'ETag': etag, 'Cache-Control': IMMUTABLE})
+
+    try:
+        path = await pipeline.variant(digest, width, fmt)
+    except Exception:
+        # not an image Pillow can decode, remembered per digest so it is not
+        # rendered again; the original is still served
+        raise web.HTTPNotFound()
+    return web.FileResponse(path, headers={
+        'Content-Type': VARIANT_FORMATS[fmt],
+        'Cache-Control': IMMUTABLE,
+        'ETag': etag,
+    })
+
+
+async def _on_startup(app: web.Application):
+    pipeline = ImagePipeline(app['blobs'], app['config'].get('images', {}).get('workers'))
+    app['images'] = pipeline
+    for sub in app._subapps:
+        sub['images'] = pipeline
+
+
+async def _on_shutdown(app: web.Application):
+    app['images'].close()
+
+
+def setup(app: web.Application):
+    app.on_startup.append(_on_startup)
+    app.on_shutdown.append(_on_shutdown)
@@ -1,71 +1,150 @@
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import logging
-from operator import ne
-import aiohttp
-import lxml.html
+import os
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
 from aiohttp import web
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-import json
-import math
-
-from trafaret import And
 
-HEADERS = {
-    'USER-AGENT': 'Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/40.0.2214.85 Safari/537.36',
-}
+from mining.crawler import Crawler, format_network_info
+from mining.idempotency import cleanup_idempotency_keys
 
 logger = logging.getLogger('jobs')
 
-
-def unit_transfer(original: str, method: str, count: int, splitCount: int):
-    p = abs(float(original))
-    if method == "MUL":
-        p = p * math.pow(1024, count)
-    elif method == "DIV":
-        p = p / math.pow(1024, count)
-    if float(original) < 0:
-        return f"""-{format(p, f'.{splitCount}f')}"""
-    else:
-        return format(p, f'.{splitCount}f')
+# upper bound of a single run; a lease still held after this is considered
+# abandoned by a dead worker
+JOB_LEASE = 10 * 60
 
 
 async def craw_network_info(app: web.Application):
-    try:
-        async with aiohttp.ClientSession() as session:
-            data = {"id": 1, "jsonrpc": "2.0",
-                    "method": 'filscan.StatChainInfo'}
-            async with session.post('https://api.filscan.io:8700/rpc/v1', data=json.dumps(data).encode("utf-8"), headers=HEADERS) as response:
-                async with session.get('https://api.coingecko.com/api/v3/simple/price?ids=binance-peg-filecoin&vs_currencies=usd', headers=HEADERS) as priceResopnse:
-                    res = await response.json()
-                    priceRes = await priceResopnse.json()
-                    if res['result']:
-                        data = res['result']['data']
-                        network_info = {
-                            'filPrice': f"""${priceRes['binance-peg-filecoin']['usd']}""",
-                            'networkStoragePower': unit_transfer(data['total_quality_power'], 'DIV', 6, 4) + ' EiB',
-                            'latest24hPowerGrowth': unit_transfer(data['power_increase_24h'], 'DIV', 5, 4) + ' PiB',
-                            'latest24hEfficiencny': unit_transfer(data['fil_per_tera'], 'EQUAL', 1, 4) + ' FIL/TiB',
-                            'sectorInitialPledge': unit_transfer(data['pledge_per_tera'], 'EQUAL', 1, 4) + ' FIL/TiB',
-                            'gasUsedOf32GSector': unit_transfer(data['gas_in_32g'], 'EQUAL', 1, 4) + ' FIL/TiB',
-                            'gasUsedOf64GSector': unit_transfer(data['gas_in_64g'], 'EQUAL', 1, 4) + ' FIL/TiB',
-                            'costOfSeal32GSector': unit_transfer(data['add_power_in_32g'], 'EQUAL', 1, 4) + ' FIL/TiB',
-                            'costOfSeal64GSector': unit_transfer(data['add_power_in_64g'], 'EQUAL', 1, 4) + ' FIL/TiB',
-                        }
-                        await app['db'].update_filecoin_network_info(network_info)
-    except Exception as exc:
-        logger.error(f"""Craw netowrk info failed, reason: {str(exc)}""")
+    sample = await app['crawler'].crawl()
+    if sample:
+        network_info = dict(app['network'].snapshot.info or {}, **format_network_info(sample))
+        await app['network'].update(network_info)
+    # the time series only gets what was observed this round; fields of a
+    # failed source stay NULL and are skipped by the rollup averages
+    fresh = app['crawler'].fresh
+    if fresh:
+        await app['db'].add_filecoin_network_sample(fresh)
+    if 'fil_price_usd' in fresh:
+        await app['prices'].update('FIL', 'USD', fresh['fil_price_usd'], 'coingecko')
+
+
+async def settle_previous_day(app: web.Application):
+    # idempotent per platform and day, so the hourly tick only settles what
+    # is still missing or failed
+    await app['settlement'].run_day(date.today() - timedelta(days=1))
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[web.Application], Awaitable[None]], interval: int):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_started_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'interval': self.interval,
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'failures': self.failures,
+            'lastStartedAt': self.last_started_at,
+            'lastDuration': self.last_duration,
+            'lastError': self.last_error,
+        }
+
+
+class JobRunner:
+    """Runs each scheduled job on exactly one worker per interval.
+
+    Every worker ticks every job, but a tick only proceeds after claiming
+    the job's lease in `yj_job_lease`; see sql/job_lease.sql. The lease
+    outlives a run, so a worker that dies mid-run is replaced once it
+    expires.
+    """
+
+    def __init__(self, app: web.Application):
+        self.app = app
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.jobs: Dict[str, Job] = {}
+        self.scheduler = AsyncIOScheduler()
+
+    def add(self, name: str, func: Callable[[web.Application], Awaitable[None]], interval: int):
+        job = Job(name, func, interval)
+        self.jobs[name] = job
+        self.scheduler.add_job(self._run, 'interval', args=[job, ], seconds=interval,
+                               next_run_time=datetime.now(), id=name, max_instances=1, coalesce=True)
+
+    async def _run(self, job: Job):
+        db = self.app['db']
+        try:
+            claimed = await db.try_claim_job(job.name, self.owner, job.interval, JOB_LEASE)
+        except Exception as exc:
+            logger.error(f"""Claim job `{job.name}` failed, reason: {str(exc)}""")
+            return
+        if not claimed:
+            job.skipped += 1
+            return
+
+        job.last_started_at = time.time()
+        started = time.monotonic()
+        error = None
+        try:
+            await job.func(self.app)
+        except Exception as exc:
+            error = str(exc) or exc.__class__.__name__
+            job.failures += 1
+            logger.error(f"""Job `{job.name}` failed, reason: {error}""")
+        job.runs += 1
+        job.last_duration = time.monotonic() - started
+        job.last_error = error
+
+        try:
+            await db.finish_job(job.name, self.owner, job.last_duration, error)
+        except Exception as exc:
+            logger.error(f"""Release job `{job.name}` failed, reason: {str(exc)}""")
+
+    def start(self):
+        self.scheduler.start()
+
+    def shutdown(self):
+        self.scheduler.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'owner': self.owner, 'jobs': [job.stats() for job in self.jobs.values()]}
 
 
 async def start_jobs(app: web.Application):
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(craw_network_info, 'interval', args=[
-                      app, ], minutes=5, next_run_time=datetime.now())
-    scheduler.start()
-    app['scheduler'] = scheduler
+    crawler = Crawler(app['config'].get('crawler'))
+    await crawler.start()
+    app['crawler'] = crawler
+
+    runner = JobRunner(app)
+    runner.add('craw_network_info', craw_network_info, 5 * 60)
+    # settling is a money movement, so the hourly job only runs when the
+    # deployment opts in; the owner endpoint settles a day on demand
+    if (app['config'].get('settlement') or {}).get('auto', False):
+        runner.add('settle_previous_day', settle_previous_day, 60 * 60)
+    runner.add('cleanup_idempotency_keys', cleanup_idempotency_keys, 60 * 60)
+    runner.start()
+    app['jobs'] = runner
+    for sub in app._subapps:
+        sub['jobs'] = runner
 
 
 async def stop_jobs(app: web.Application):
-    app['scheduler'].shutdown()
+    app['jobs'].shutdown()
+    await app['crawler'].close()
 
 
 def setup(app: web.Application):
@@ -2,10 +2,21 @@ import logging
 import sys
 
 from aiohttp import web
+from mining.blobs import setup as setup_blobs
+from mining.bus import setup as setup_bus
 from mining.db import setup as setup_db
+from mining.idempotency import setup as setup_idempotency
+from mining.images import setup as setup_images
 from mining.jobs import setup as setup_jobs
+from mining.metrics import setup as setup_metrics
+from mining.network import setup as setup_network
+from mining.prices import setup as setup_prices
+from mining.purchases import setup as setup_purchases
+from mining.sampler import setup as setup_sampler
+from mining.push import setup as setup_push
+from mining.settlement import setup as setup_settlement
 from mining.middlewares import setup_middlewares
-from mining.routes import setup_customer_routes, setup_platform_routes, setup_app_release_routes
+from mining.routes import setup_customer_routes, setup_platform_routes, setup_app_release_routes, setup_asset_routes
 from mining.settings import get_config
 from mining.utils import store_android_apk_to_temp_file
 
@@ -20,7 +31,18 @@ def main(argv):
     logging.basicConfig(level=logging.DEBUG)
     root = web.Application(client_max_size=1024**2*100)
     root['config'] = get_config(argv)
+    setup_metrics(root)
+    setup_sampler(root)
     setup_db(root)
+    setup_bus(root)
+    setup_network(root)
+    setup_prices(root)
+    setup_push(root)
+    setup_purchases(root)
+    setup_idempotency(root)
+    setup_settlement(root)
+    setup_blobs(root)
+    setup_images(root)
     setup_jobs(root)
 
     app = setup_customer_routes(root)
@@ -36,6 +58,9 @@ def main(argv):
     app = setup_app_release_routes(root)
     root.add_subapp('/app', app)
 
+    app = setup_asset_routes(root)
+    root.add_subapp('/assets', app)
+
     root.on_startup.append(on_startup)
 
     web.run_app(root, host=root['config']['host'], port=root['config']['port'])
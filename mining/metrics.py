@@ -0,0 +1,402 @@
+import contextvars
+import hmac
+import logging
+import re
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+from aiohttp.web_middlewares import _Handler
+
+logger = logging.getLogger('metrics')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_STATEMENT_RE = re.compile(r'\b(yj_\w+)|^\s*(\w+)', re.IGNORECASE)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels: Any, value: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in self.values.items():
+            yield f'{self.name}{_labels(self.labelnames, labels)} {value}'
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # per label set: bucket counts (non-cumulative, last one is +Inf), sum
+        self.values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: Any):
+        counts, total = self.values.get(labels) or self.values.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'), ), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {total[0]}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+
+class Gauge:
+    """Sampled on every scrape from `collect`, which returns (labels, value) pairs."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], collect: Callable[[], Iterable[Tuple[Tuple, float]]]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} gauge'
+        try:
+            samples = list(self.collect())
+        except Exception as exc:
+            logger.warning(f"""Collect {self.name} failed, reason: {str(exc)}""")
+            return
+        for labels, value in samples:
+            yield f'{self.name}{_labels(self.labelnames, labels)} {value}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Any] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self.metrics.values() for line in metric.render()) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'mining_request_seconds', 'Request latency by route.', ('method', 'route', 'status')))
+RESPONSE_BYTES = REGISTRY.register(Histogram(
+    'mining_response_bytes', 'Response body size by route.', ('method', 'route'), SIZE_BUCKETS))
+REQUEST_DB_SECONDS = REGISTRY.register(Histogram(
+    'mining_request_db_seconds', 'Time spent in PostgreSQL per request.', ('method', 'route')))
+REQUEST_DB_QUERIES = REGISTRY.register(Histogram(
+    'mining_request_db_queries', 'Statements executed per request.', ('method', 'route'), COUNT_BUCKETS))
+DB_SECONDS = REGISTRY.register(Histogram(
+    'mining_db_seconds', 'Statement latency by stored function.', ('function', )))
+DB_ERRORS = REGISTRY.register(Counter(
+    'mining_db_errors_total', 'Failed statements by stored function.', ('function', )))
+POOL_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'mining_db_pool_wait_seconds', 'Time waited for a pooled connection.'))
+SESSION_LOAD_SECONDS = REGISTRY.register(Histogram(
+    'mining_session_load_seconds', 'Time to load a session from PostgreSQL.', ('kind', )))
+
+
+class RequestTiming:
+    __slots__ = ('started', 'first_byte', 'db_time', 'db_calls', 'pool_wait', 'session_time', 'functions')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # set when a handler sends the headers itself, i.e. streams the body
+        self.first_byte: Optional[float] = None
+        self.db_time = 0.0
+        self.db_calls = 0
+        self.pool_wait = 0.0
+        self.session_time = 0.0
+        # statement name -> [calls, seconds]
+        self.functions: Dict[str, List[float]] = {}
+
+
+# called with (name, elapsed, failed) for every statement and with
+# (request, route, status, elapsed, timing) for every request
+_statement_listeners: List[Callable[[str, float, bool], None]] = []
+_request_listeners: List[Callable[[web.Request, str, int, float, RequestTiming], None]] = []
+
+
+def add_statement_listener(listener: Callable[[str, float, bool], None]):
+    _statement_listeners.append(listener)
+
+
+def add_request_listener(listener: Callable[[web.Request, str, int, float, RequestTiming], None]):
+    _request_listeners.append(listener)
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar('mining_request_timing', default=None)
+
+
+def current_timing() -> Optional[RequestTiming]:
+    return _current.get()
+
+
+def statement_name(operation: str) -> str:
+    match = _STATEMENT_RE.search(operation)
+    if match is None:
+        return 'other'
+    return match.group(1) or match.group(2).lower()
+
+
+def observe_statement(operation: str, elapsed: float, failed: bool = False):
+    name = statement_name(operation)
+    DB_SECONDS.observe(elapsed, name)
+    if failed:
+        DB_ERRORS.inc(name)
+    timing = _current.get()
+    if timing is not None:
+        timing.db_time += elapsed
+        timing.db_calls += 1
+        function = timing.functions.get(name) or timing.functions.setdefault(name, [0, 0.0])
+        function[0] += 1
+        function[1] += elapsed
+    for listener in _statement_listeners:
+        listener(name, elapsed, failed)
+
+
+def observe_pool_wait(elapsed: float):
+    POOL_WAIT_SECONDS.observe(elapsed)
+    timing = _current.get()
+    if timing is not None:
+        timing.pool_wait += elapsed
+
+
+def observe_session_load(elapsed: float, is_customer: bool):
+    SESSION_LOAD_SECONDS.observe(elapsed, 'customer' if is_customer else 'platform')
+    timing = _current.get()
+    if timing is not None:
+        timing.session_time += elapsed
+
+
+class _TimedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+    async def execute(self, operation: str, *args: Any, **kwargs: Any):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await self._cursor.execute(operation, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            observe_statement(operation, time.perf_counter() - started, failed)
+
+
+class _TimedCursorContext:
+    def __init__(self, context):
+        self._context = context
+
+    def __await__(self):
+        return self._open().__await__()
+
+    async def _open(self):
+        return _TimedCursor(await self._context)
+
+    async def __aenter__(self):
+        return _TimedCursor(await self._context.__aenter__())
+
+    async def __aexit__(self, *exc_info):
+        return await self._context.__aexit__(*exc_info)
+
+
+class TimedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args: Any, **kwargs: Any) -> _TimedCursorContext:
+        return _TimedCursorContext(self._conn.cursor(*args, **kwargs))
+
+
+class _TimedAcquire:
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn: Optional[TimedConnection] = None
+
+    def __await__(self):
+        return self._acquire().__await__()
+
+    async def _acquire(self) -> TimedConnection:
+        started = time.perf_counter()
+        conn = await self._pool.acquire()
+        observe_pool_wait(time.perf_counter() - started)
+        return TimedConnection(conn)
+
+    async def __aenter__(self) -> TimedConnection:
+        self._conn = await self._acquire()
+        return self._conn
+
+    async def __aexit__(self, *exc_info):
+        await self._pool.release(self._conn._conn)
+
+
+class TimedPool:
+    """aiopg pool proxy timing connection waits and statements.
+
+    `Database` and everything built on it keep using `acquire`/`cursor`/
+    `execute` as before; everything else is passed through to the pool.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def __getattr__(self, name: str):
+        return getattr(self._pool, name)
+
+    def acquire(self) -> _TimedAcquire:
+        return _TimedAcquire(self._pool)
+
+    def release(self, conn):
+        return self._pool.release(getattr(conn, '_conn', conn))
+
+
+def _route(request: web.Request) -> str:
+    route = request.match_info.route
+    if route is None or route.resource is None:
+        return 'unmatched'
+    return route.resource.canonical
+
+
+def _response_size(response: web.StreamResponse) -> int:
+    if response.prepared:
+        return response.body_length
+    body = getattr(response, 'body', None)
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    return response.content_length or 0
+
+
+@web.middleware
+async def metrics_middleware(request: web.Request, handler: _Handler):
+    timing = RequestTiming()
+    token = _current.set(timing)
+    status = 500
+    response = None
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as exc:
+        status = exc.status
+        raise
+    finally:
+        if timing.first_byte is not None:
+            # SSE and exports run for as long as the client reads, their
+            # latency is the time to the first byte
+            elapsed = timing.first_byte - timing.started
+        else:
+            elapsed = time.perf_counter() - timing.started
+        _current.reset(token)
+        route = _route(request)
+        REQUEST_SECONDS.observe(elapsed, request.method, route, status)
+        REQUEST_DB_SECONDS.observe(timing.db_time, request.method, route)
+        REQUEST_DB_QUERIES.observe(timing.db_calls, request.method, route)
+        if response is not None:
+            RESPONSE_BYTES.observe(_response_size(response), request.method, route)
+        for listener in _request_listeners:
+            listener(request, route, status, elapsed, timing)
+
+
+async def _on_response_prepare(request: web.Request, response: web.StreamResponse):
+    timing = _current.get()
+    if timing is not None and timing.first_byte is None:
+        timing.first_byte = time.perf_counter()
+
+
+def _authorized(request: web.Request, config: Dict[str, Any]) -> bool:
+    # behind the reverse proxy every peer is loopback, so only the token counts
+    token = config.get('token')
+    if not token:
+        return False
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode('utf-8'), token.encode('utf-8'))
+
+
+async def get_metrics(request: web.Request) -> web.Response:
+    config = request.app['config'].get('metrics', {})
+    if not config.get('public', False):
+        if not config.get('token'):
+            # not configured, the endpoint does not exist
+            raise web.HTTPNotFound()
+        if not _authorized(request, config):
+            raise web.HTTPUnauthorized(headers={'WWW-Authenticate': 'Bearer'})
+    return web.Response(body=REGISTRY.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+
+def _queue_depths(app: web.Application) -> Iterable[Tuple[Tuple, float]]:
+    if 'push' in app:
+        yield ('push', ), sum(s.queue.qsize() for s in list(app['push'].subscribers))
+    if 'purchases' in app:
+        yield ('purchases', ), app['purchases'].stats()['pending']
+    if 'images' in app:
+        yield ('images', ), app['images'].stats()['inflight']
+    if 'settlement' in app:
+        yield ('settlement', ), len(app['settlement']._tasks)
+    if 'bus' in app:
+        yield ('bus', ), len(app['bus']._pending)
+
+
+def _jobs(app: web.Application) -> Iterable[Tuple[Tuple, float]]:
+    if 'jobs' not in app:
+        return
+    for job in app['jobs'].jobs.values():
+        yield (job.name, ), job.last_duration or 0
+
+
+def _pool(app: web.Application) -> Iterable[Tuple[Tuple, float]]:
+    pool = app['db'].db
+    yield ('size', ), pool.size
+    yield ('free', ), pool.freesize
+
+
+async def _on_startup(app: web.Application):
+    REGISTRY.register(Gauge('mining_queue_depth', 'Items waiting in background queues.', ('queue', ), lambda: _queue_depths(app)))
+    REGISTRY.register(Gauge('mining_job_last_duration_seconds', 'Duration of the last run of each job.', ('job', ), lambda: _jobs(app)))
+    REGISTRY.register(Gauge('mining_db_pool_connections', 'Connections of the PostgreSQL pool.', ('state', ), lambda: _pool(app)))
+
+
+def setup(app: web.Application):
+    # on the root application, so every sub-application is measured
+    app.middlewares.append(metrics_middleware)
+    app.on_response_prepare.append(_on_response_prepare)
+    app.router.add_get('/metrics', get_metrics)
+    app.on_startup.append(_on_startup)
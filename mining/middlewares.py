@@ -12,6 +12,7 @@ import jwt
 from aiohttp import web, hdrs
 from aiohttp.web_middlewares import _Handler, _Middleware
 from mining.session import setup as session_setup, PgStorage
+from mining.utils import make_etag
 
 logger = logging.getLogger('mining')
 
@@ -60,12 +61,44 @@ async def error_middleware(request: web.Request, handler: _Handler):
         return web.json_response({'code': 500, 'message': str(exc)})
 
 
+def etag_matches(request: web.Request, etag: str) -> bool:
+    if_none_match = request.headers.get(hdrs.IF_NONE_MATCH)
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(','))
+
+
+@web.middleware
+async def conditional_middleware(request: web.Request, handler: _Handler):
+    response = await handler(request)
+    if request.method not in (hdrs.METH_GET, hdrs.METH_HEAD):
+        return response
+    if not isinstance(response, web.Response) or response.status != 200:
+        return response
+
+    etag = response.headers.get(hdrs.ETAG)
+    if etag is None:
+        body = response.body
+        if not isinstance(body, (bytes, bytearray)):
+            return response
+        etag = make_etag(body)
+        response.headers[hdrs.ETAG] = etag
+    response.headers.setdefault(hdrs.CACHE_CONTROL, 'private, no-cache')
+
+    if etag_matches(request, etag):
+        return web.Response(status=304, headers={hdrs.ETAG: etag, hdrs.CACHE_CONTROL: response.headers[hdrs.CACHE_CONTROL]})
+    return response
+
+
 def get_session_id(request: web.Request) -> str:
     return request['token']['session_id'] if 'token' in request else None
 
 
 def setup_middlewares(app: web.Application):
     app.middlewares.append(error_middleware)
+    app.middlewares.append(conditional_middleware)
     app.middlewares.append(JWTMiddleware(app['jwt_secret_key']))
 
     session_setup(app, PgStorage(app, get_session_id))
@@ -0,0 +1,94 @@
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from aiohttp import web
+
+from mining.utils import make_etag
+
+logger = logging.getLogger('network')
+
+HISTORY_STEPS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+MAX_HISTORY_POINTS = 1000
+
+
+class NetworkSnapshot(NamedTuple):
+    info: Optional[Dict[str, Any]]
+    body: bytes
+    etag: str
+    updated_at: float
+
+
+def make_snapshot(info: Optional[Dict[str, Any]]) -> NetworkSnapshot:
+    # serialized like `web.json_response` so the handlers can hand the bytes
+    # out as they are
+    body = json.dumps(info).encode('utf-8')
+    return NetworkSnapshot(info, body, make_etag(body), time.time())
+
+
+class NetworkInfo:
+    """Process-wide snapshot of the Filecoin network info.
+
+    The crawler job replaces the snapshot after storing a new value, other
+    workers are told over the invalidation bus and reload it from
+    PostgreSQL once, so `/filecoin/network` never queries the database.
+    """
+
+    def __init__(self, db, bus=None):
+        self.db = db
+        self.bus = bus
+        self.snapshot = make_snapshot(None)
+        self._listeners = []
+        if bus is not None:
+            bus.subscribe('network', self._on_notify)
+            bus.on_resync(self.reload)
+
+    def add_listener(self, listener: Callable[[NetworkSnapshot], None]):
+        self._listeners.append(listener)
+
+    def publish(self, info: Optional[Dict[str, Any]]):
+        self.snapshot = make_snapshot(info)
+        for listener in self._listeners:
+            try:
+                listener(self.snapshot)
+            except Exception as exc:
+                logger.error(f"""Network snapshot listener failed, reason: {str(exc)}""")
+
+    async def update(self, info: Dict[str, Any]):
+        await self.db.update_filecoin_network_info(info)
+        self.publish(info)
+        if self.bus is not None:
+            self.bus.publish('network', {})
+
+    async def reload(self):
+        self.publish(await self.db.get_filecoin_network_info())
+
+    async def _on_notify(self, message: Dict[str, Any]):
+        await self.reload()
+
+
+def history_step(from_at: datetime, to_at: datetime, step: Optional[str]) -> str:
+    if to_at <= from_at:
+        raise web.HTTPBadRequest(reason='时间范围不正确')
+    if step is None:
+        step = 'hour' if to_at - from_at <= timedelta(days=7) else 'day'
+    if (to_at - from_at) / HISTORY_STEPS[step] > MAX_HISTORY_POINTS:
+        raise web.HTTPBadRequest(reason='时间范围过大')
+    return step
+
+
+async def _on_startup(app: web.Application):
+    network = NetworkInfo(app['db'], app.get('bus'))
+    try:
+        await network.reload()
+    except Exception as exc:
+        logger.error(f"""Load network info failed, reason: {str(exc)}""")
+    app['network'] = network
+    for sub in app._subapps:
+        sub['network'] = network
+
+
+def setup(app: web.Application):
+    app.on_startup.append(_on_startup)
@@ -0,0 +1,49 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+MAX_TRANSITION_BATCH = 500
+
+
+class Transition(NamedTuple):
+    action: str
+    # stored function applying the transition to one order
+    function: str
+    # its arguments in order: 'Id' is the order, 'platformId' the platform,
+    # anything else an integer field of the request body
+    args: Tuple[str, ...] = ('Id', )
+    # only the platform owner may take it, like its single order endpoint
+    owner_only: bool = False
+
+
+# the bulk counterparts of the single order endpoints in mining/routes.py;
+# which states an order may leave from is decided by the stored function
+# itself, the order schema behind it is the only place that knows
+ORDER_TRANSITIONS: Dict[str, Transition] = {t.action: t for t in (
+    Transition('paymentComplete', 'yj_platform_order_payment_complete'),
+    Transition('sealCostPaymentComplete', 'yj_platform_order_seal_cost_payment_complete'),
+    Transition('sealingStart', 'yj_platform_order_sealing_start'),
+    Transition('miningStart', 'yj_platform_order_mining_start'),
+    Transition('finish', 'yj_platform_order_finish'),
+    Transition('cancelConfirm', 'yj_platform_order_cancel_confirm'),
+    Transition('stop', 'yj_stop_order', ('platformId', 'Id', 'fewDays'), owner_only=True),
+)}
+
+
+def transition_args(transition: Transition, platform_id: int, params: Dict[str, Optional[int]]) -> Tuple[List[Optional[int]], int]:
+    """The arguments of `transition.function` with the order id left out, and
+    the 1-based position it goes in. Raises KeyError naming a missing field."""
+    args = []
+    for name in transition.args:
+        if name == 'Id':
+            args.append(None)
+        elif name == 'platformId':
+            args.append(platform_id)
+        elif params.get(name) is None:
+            raise KeyError(name)
+        else:
+            args.append(params[name])
+    return args, transition.args.index('Id') + 1
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, int]:
+    ok = sum(1 for result in results if result['ok'])
+    return {'ok': ok, 'failed': len(results) - ok}
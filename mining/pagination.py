@@ -0,0 +1,63 @@
+import base64
+import binascii
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from marshmallow import fields, validate
+
+MAX_PAGE_SIZE = 500
+
+# Keyset pagination over the `yj_*_fetch_list` functions. Their paged
+# overloads (sql/pagination.sql) take two trailing arguments, `in_limit` and
+# `in_after_id`, and read the list's table through its (scope, id) index:
+# rows ordered by id descending, only those with `id < in_after_id` when it
+# is given, each carrying its `Id`. Omitting `limit` calls the legacy
+# function and keeps the unbounded array response.
+PAGE_ARGS = {
+    'limit': fields.Int(missing=None, validate=validate.Range(min=1, max=MAX_PAGE_SIZE)),
+    'cursor': fields.Str(missing=None),
+}
+
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([last_id]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        last_id, = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return int(last_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise web.HTTPBadRequest(reason='分页参数不正确')
+
+
+def keyset_args(limit: Optional[int], cursor: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    # one extra row tells whether another page follows without a count(*)
+    return (limit + 1 if limit else None), decode_cursor(cursor)
+
+
+def keyset_call(function: str, output: str, args: Tuple, limit: Optional[int], after_id: Optional[int]) -> Tuple[str, Tuple]:
+    """Statement and parameters of a list query, paged only when `limit` is set."""
+    if limit:
+        args = args + (limit, after_id)
+    return f"select {output} from {function}({', '.join(['%s'] * len(args))})", args
+
+
+def page_response(rows: Optional[List[Dict[str, Any]]], limit: Optional[int], key: str = 'Id') -> web.Response:
+    if not limit:
+        return web.json_response(rows)
+
+    rows = rows or []
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_id = rows[-1].get(key) if isinstance(rows[-1], dict) else None
+        if last_id is None:
+            # a list function that does not page by id; never hand out a
+            # cursor that would restart or skip rows
+            raise web.HTTPServerError(reason='分页失败, 列表缺少 Id')
+        next_cursor = encode_cursor(last_id)
+    return web.json_response({'list': rows, 'nextCursor': next_cursor})
@@ -0,0 +1,139 @@
+import logging
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger('prices')
+
+# quotes older than this are still served but flagged as stale
+MAX_QUOTE_AGE = 15 * 60
+
+# fixed rates that are not fetched from any feed, e.g. treating the USDT
+# stable coin as exactly one dollar; overridable from the config
+DEFAULT_PEGS = {
+    'USDT/USD': '1',
+}
+
+
+class Quote(NamedTuple):
+    base: str
+    counter: str
+    price: Decimal
+    source: str
+    quoted_at: float
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'baseCode': self.base,
+            'counterCode': self.counter,
+            # a string, so no digits are lost to float on the way
+            'price': str(self.price),
+            'source': self.source,
+            'quotedAt': datetime.fromtimestamp(self.quoted_at, timezone.utc).isoformat().replace('+00:00', 'Z'),
+            'stale': self.source != 'peg' and time.time() - self.quoted_at > MAX_QUOTE_AGE,
+        }
+
+
+def _invert(quote: Quote) -> Quote:
+    return Quote(quote.counter, quote.base, 1 / quote.price, quote.source, quote.quoted_at)
+
+
+class PriceIndex:
+    """Latest quote per currency pair, kept in memory.
+
+    Feeds push quotes with `update`; each quote is appended to the history
+    table for later valuation and announced on the invalidation bus so every
+    worker answers from memory. Pairs that are not quoted directly are
+    derived from the inverse or from a cross through one pivot currency.
+    """
+
+    def __init__(self, db, bus=None, pegs: Optional[Dict[str, Any]] = None):
+        self.db = db
+        self.bus = bus
+        self.quotes: Dict[Tuple[str, str], Quote] = {}
+        for pair, price in dict(DEFAULT_PEGS, **(pegs or {})).items():
+            base, counter = pair.split('/')
+            self._store(Quote(base, counter, Decimal(str(price)), 'peg', time.time()))
+        if bus is not None:
+            bus.subscribe('price', self._on_notify)
+            bus.on_resync(self.reload)
+
+    def _store(self, quote: Quote):
+        current = self.quotes.get((quote.base, quote.counter))
+        if current is None or current.quoted_at <= quote.quoted_at:
+            self.quotes[(quote.base, quote.counter)] = quote
+
+    async def update(self, base: str, counter: str, price: Decimal, source: str, quoted_at: Optional[float] = None):
+        quote = Quote(base, counter, price, source, quoted_at or time.time())
+        self._store(quote)
+        await self.db.add_currency_price(quote.base, quote.counter, quote.price, quote.source, datetime.fromtimestamp(quote.quoted_at, timezone.utc))
+        if self.bus is not None:
+            self.bus.publish('price', {
+                'base': quote.base,
+                'counter': quote.counter,
+                'price': str(quote.price),
+                'source': quote.source,
+                'quotedAt': quote.quoted_at,
+            })
+
+    def _direct(self, base: str, counter: str) -> Optional[Quote]:
+        quote = self.quotes.get((base, counter))
+        if quote is not None:
+            return quote
+        quote = self.quotes.get((counter, base))
+        return _invert(quote) if quote is not None else None
+
+    def quote(self, base: str, counter: str) -> Optional[Quote]:
+        base, counter = base.upper(), counter.upper()
+        if base == counter:
+            return Quote(base, counter, Decimal(1), 'peg', time.time())
+
+        quote = self._direct(base, counter)
+        if quote is not None:
+            return quote
+
+        best = None
+        for pivot in set(c for pair in self.quotes for c in pair) - {base, counter}:
+            first = self._direct(base, pivot)
+            second = self._direct(pivot, counter) if first is not None else None
+            if second is None:
+                continue
+            # a cross rate is only as fresh as its older live leg; pegs are
+            # timeless and must not make the cross look stale
+            live = [q for q in (first, second) if q.source != 'peg']
+            if live:
+                cross = Quote(base, counter, first.price * second.price, 'cross', min(q.quoted_at for q in live))
+            else:
+                cross = Quote(base, counter, first.price * second.price, 'peg', time.time())
+            if best is None or cross.quoted_at > best.quoted_at:
+                best = cross
+        return best
+
+    async def price_at(self, base: str, counter: str, at: datetime) -> Optional[Decimal]:
+        """Last recorded price of the pair at `at`, e.g. to value a settlement day."""
+        return await self.db.get_currency_price_at(base.upper(), counter.upper(), at)
+
+    async def reload(self):
+        for row in await self.db.get_latest_currency_prices():
+            self._store(Quote(row['base'], row['counter'], Decimal(str(row['price'])), row['source'], row['quotedAt']))
+
+    def _on_notify(self, message: Dict[str, Any]):
+        self._store(Quote(message['base'], message['counter'], Decimal(message['price']), message['source'], message['quotedAt']))
+
+
+async def _on_startup(app: web.Application):
+    prices = PriceIndex(app['db'], app.get('bus'), app['config'].get('prices', {}).get('pegs'))
+    try:
+        await prices.reload()
+    except Exception as exc:
+        logger.error(f"""Load currency prices failed, reason: {str(exc)}""")
+    app['prices'] = prices
+    for sub in app._subapps:
+        sub['prices'] = prices
+
+
+def setup(app: web.Application):
+    app.on_startup.append(_on_startup)
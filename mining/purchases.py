@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger('purchases')
+
+# the in-memory stock of a product is reloaded from the database this often
+STOCK_TTL = 5
+# reservations of one product are sent to the database together once this
+# many are pending, or after the window, whichever comes first
+BATCH_SIZE = 32
+BATCH_WINDOW = 0.005
+# products nobody bought for this long are forgotten, checked every sweep
+PRODUCT_IDLE = 10 * 60
+SWEEP_INTERVAL = 60
+
+# result codes of yj_customer_product_purchase
+SOLD_OUT = -3
+FAILED = -1
+
+
+class _Pending:
+    __slots__ = ('customer_id', 'qty', 'comment', 'future')
+
+    def __init__(self, customer_id: int, qty: int, comment: Optional[str]):
+        self.customer_id = customer_id
+        self.qty = qty
+        self.comment = comment
+        self.future = asyncio.get_event_loop().create_future()
+
+
+class _Product:
+    __slots__ = ('platform_id', 'available', 'loaded_at', 'used_at', 'reserved', 'pending', 'flush', 'loading')
+
+    def __init__(self, platform_id: int):
+        self.platform_id = platform_id
+        # None while unknown, purchases then go straight to the database
+        self.available: Optional[int] = None
+        self.loaded_at = 0.0
+        self.used_at = time.monotonic()
+        # qty reserved by purchases not committed yet
+        self.reserved = 0
+        self.pending: List[_Pending] = []
+        self.flush: Optional[asyncio.Handle] = None
+        self.loading: Optional[asyncio.Future] = None
+
+    def busy(self) -> bool:
+        return bool(self.reserved or self.pending or self.loading)
+
+
+class PurchaseEngine:
+    """Customer purchases with in-memory stock reservation.
+
+    Each worker keeps the stock left per product, reloaded from PostgreSQL
+    every `STOCK_TTL` seconds. A purchase first reserves its qty here, so
+    once a flash sale is sold out the remaining buyers are turned away
+    without a database round trip. Reservations are committed in batches
+    per product through `yj_customer_product_purchase_batch`, which still
+    enforces the stock, so the counter only has to be approximately right
+    across workers. Only products whose stock could be loaded are kept, and
+    only until they sit idle for `PRODUCT_IDLE`, so posting arbitrary ids
+    does not grow the table.
+    """
+
+    def __init__(self, db, bus=None):
+        self.db = db
+        self.bus = bus
+        self.products: Dict[int, _Product] = {}
+        self._tasks = set()
+        self._swept_at = time.monotonic()
+        self.rejected = 0
+        self.committed = 0
+        self.batches = 0
+        if bus is not None:
+            bus.subscribe('product', self._on_notify)
+            bus.on_resync(self.clear)
+
+    async def _load(self, product_id: int, product: _Product):
+        try:
+            available = await self.db.customer.get_product_available_qty(product_id)
+        except Exception as exc:
+            logger.warning(f"""Load stock of product {product_id} failed, reason: {str(exc)}""")
+            available = None
+        # purchases still in flight are not part of the committed stock yet
+        product.available = None if available is None else available - product.reserved
+        product.loaded_at = time.monotonic()
+
+    def _sweep(self, now: float):
+        self._swept_at = now
+        for product_id, product in list(self.products.items()):
+            if now - product.used_at > PRODUCT_IDLE and not product.busy():
+                del self.products[product_id]
+
+    async def _product(self, product_id: int, platform_id: int) -> _Product:
+        now = time.monotonic()
+        if now - self._swept_at > SWEEP_INTERVAL:
+            self._sweep(now)
+        product = self.products.get(product_id)
+        if product is None:
+            product = self.products[product_id] = _Product(platform_id)
+        product.used_at = now
+        if now - product.loaded_at > STOCK_TTL:
+            if product.loading is None:
+                product.loading = asyncio.ensure_future(self._load(product_id, product))
+                product.loading.add_done_callback(lambda _: setattr(product, 'loading', None))
+            await asyncio.shield(product.loading)
+            if product.available is None and not product.busy() and self.products.get(product_id) is product:
+                # unknown or unreadable, the purchase goes straight to the database
+                del self.products[product_id]
+        return product
+
+    async def purchase(self, product_id: int, platform_id: int, customer_id: int, qty: int,
+                       comment: Optional[str] = None) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Returns the order id, or a negative result code, and the order."""
+        product = await self._product(product_id, platform_id)
+        if product.available is not None and product.available < qty:
+            self.rejected += 1
+            return SOLD_OUT, None
+
+        if product.available is not None:
+            product.available -= qty
+        product.reserved += qty
+        pending = _Pending(customer_id, qty, comment)
+        product.pending.append(pending)
+        if len(product.pending) >= BATCH_SIZE:
+            self._flush(product_id, product)
+        elif product.flush is None:
+            product.flush = asyncio.get_event_loop().call_later(BATCH_WINDOW, self._flush, product_id, product)
+
+        try:
+            order_id, order = await asyncio.shield(pending.future)
+        except Exception:
+            order_id, order = FAILED, None
+        if order_id <= 0 and product.available is not None:
+            # give the reservation back; a sold out product reloads next time
+            product.available += qty
+            if order_id == SOLD_OUT:
+                product.loaded_at = 0.0
+        return order_id, order
+
+    def _flush(self, product_id: int, product: _Product):
+        if product.flush is not None:
+            product.flush.cancel()
+            product.flush = None
+        batch, product.pending = product.pending, []
+        if batch:
+            task = asyncio.ensure_future(self._commit(product_id, product, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _commit(self, product_id: int, product: _Product, batch: List[_Pending]):
+        try:
+            results = await self.db.customer.purchase_products(product_id, [
+                {'customerId': p.customer_id, 'qty': p.qty, 'comment': p.comment} for p in batch
+            ], product.platform_id)
+        except Exception as exc:
+            logger.error(f"""Commit {len(batch)} purchases of product {product_id} failed, reason: {str(exc)}""")
+            results = [(FAILED, None)] * len(batch)
+        finally:
+            product.reserved -= sum(p.qty for p in batch)
+
+        self.batches += 1
+        results = list(results) + [(FAILED, None)] * (len(batch) - len(results))
+        for pending, (order_id, order) in zip(batch, results):
+            if order_id > 0:
+                self.committed += 1
+            if not pending.future.done():
+                pending.future.set_result((order_id, order))
+
+    def invalidate(self, product_id: int, publish: bool = True):
+        """Reload the stock of a product on its next purchase, e.g. after an edit."""
+        product = self.products.get(product_id)
+        if product is not None:
+            product.loaded_at = 0.0
+        if publish and self.bus is not None:
+            self.bus.publish('product', {'Id': product_id})
+
+    def _on_notify(self, message: Dict[str, Any]):
+        self.invalidate(message['Id'], publish=False)
+
+    def clear(self):
+        for product in self.products.values():
+            product.loaded_at = 0.0
+
+    async def close(self):
+        for product_id, product in list(self.products.items()):
+            self._flush(product_id, product)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'products': len(self.products),
+            'pending': sum(len(p.pending) for p in self.products.values()),
+            'rejected': self.rejected,
+            'committed': self.committed,
+            'batches': self.batches,
+        }
+
+
+async def _on_startup(app: web.Application):
+    engine = PurchaseEngine(app['db'], app.get('bus'))
+    app['purchases'] = engine
+    for sub in app._subapps:
+        sub['purchases'] = engine
+
+
+async def _on_shutdown(app: web.Application):
+    await app['purchases'].close()
+
+
+def setup(app: web.Application):
+    app.on_startup.append(_on_startup)
+    app.on_shutdown.append(_on_shutdown)
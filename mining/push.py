@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional, Set
+
+from aiohttp import web
+
+logger = logging.getLogger('push')
+
+# frames buffered per connection before the client counts as too slow
+QUEUE_SIZE = 32
+# comment frames keep proxies from closing an idle stream
+KEEPALIVE_INTERVAL = 20
+
+
+def encode_event(event: str, body: bytes) -> bytes:
+    return b'event: ' + event.encode('utf-8') + b'\ndata: ' + body + b'\n\n'
+
+
+class Subscriber:
+    __slots__ = ('platform_id', 'queue', 'dropped')
+
+    def __init__(self, platform_id: Optional[int]):
+        self.platform_id = platform_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.dropped = False
+
+    def offer(self, frame: Optional[bytes]) -> bool:
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self):
+        # make room for the end-of-stream marker even if the queue is full
+        while not self.offer(None):
+            self.queue.get_nowait()
+
+
+class PushHub:
+    """Per-worker fan-out of server-sent events to customer apps.
+
+    Every event is encoded once and handed to the bounded queue of each
+    matching connection without waiting. A connection whose queue is full
+    is dropped rather than slowing down everyone else; the app reconnects
+    and refetches. Platform events are relayed to the other workers over
+    the invalidation bus.
+    """
+
+    def __init__(self, bus=None):
+        self.bus = bus
+        self.subscribers: Set[Subscriber] = set()
+        self.sent = 0
+        self.dropped = 0
+        if bus is not None:
+            bus.subscribe('push', self._on_notify)
+
+    def subscribe(self, platform_id: Optional[int]) -> Subscriber:
+        subscriber = Subscriber(platform_id)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def send(self, event: str, body: bytes, platform_id: Optional[int] = None):
+        frame = encode_event(event, body)
+        for subscriber in list(self.subscribers):
+            if platform_id is not None and subscriber.platform_id != platform_id:
+                continue
+            if subscriber.offer(frame):
+                self.sent += 1
+            else:
+                logger.warning(f"""Drop slow push subscriber of platform {subscriber.platform_id}""")
+                self.dropped += 1
+                subscriber.dropped = True
+                subscriber.close()
+                self.unsubscribe(subscriber)
+
+    def broadcast(self, event: str, data: Dict[str, Any], platform_id: Optional[int] = None):
+        self.send(event, json.dumps(data).encode('utf-8'), platform_id)
+        if self.bus is not None:
+            self.bus.publish('push', {'event': event, 'data': data, 'platformId': platform_id})
+
+    def _on_notify(self, message: Dict[str, Any]):
+        self.send(message['event'], json.dumps(message['data']).encode('utf-8'), message.get('platformId'))
+
+    def close(self):
+        for subscriber in list(self.subscribers):
+            subscriber.close()
+        self.subscribers.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'connections': len(self.subscribers), 'sent': self.sent, 'dropped': self.dropped}
+
+
+async def stream_events(request: web.Request, hub: PushHub, platform_id: Optional[int], initial: Optional[bytes] = None) -> web.StreamResponse:
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    await response.prepare(request)
+
+    subscriber = hub.subscribe(platform_id)
+    try:
+        if initial is not None:
+            await response.write(initial)
+        while True:
+            try:
+                frame = await asyncio.wait_for(subscriber.queue.get(), timeout=KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                frame = b': keepalive\n\n'
+            if frame is None:
+                break
+            await response.write(frame)
+    except ConnectionResetError:
+        # client went away mid-write
+        pass
+    finally:
+        hub.unsubscribe(subscriber)
+    return response
+
+
+async def _on_startup(app: web.Application):
+    hub = PushHub(app.get('bus'))
+    if 'network' in app:
+        app['network'].add_listener(lambda snapshot: hub.send('network', snapshot.body))
+    app['push'] = hub
+    for sub in app._subapps:
+        sub['push'] = hub
+
+
+async def _on_shutdown(app: web.Application):
+    app['push'].close()
+
+
+def setup(app: web.Application):
+    app.on_startup.append(_on_startup)
+    app.on_shutdown.append(_on_shutdown)
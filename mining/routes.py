@@ -1,5 +1,6 @@
 from aiohttp import web
 
+from . import blobs, images
 from .handlers import customer, platform, app_release
 
 
@@ -23,6 +24,8 @@ def setup_customer_routes(root: web.Application) -> web.Application:
     app.router.add_get('/app/releases/latest', customer.get_latest_app_release)
 
     app.router.add_get('/filecoin/network', customer.get_filecoin_network)
+    app.router.add_get('/filecoin/network/history', customer.get_filecoin_network_history)
+    app.router.add_get('/events', customer.get_events)
     app.router.add_get('/currency/price/index',
                        customer.get_currency_price_index)
 
@@ -33,6 +36,8 @@ def setup_customer_routes(root: web.Application) -> web.Application:
     app.router.add_get(
         '/platform/agreements/{Id:\d+}', customer.get_platform_agreement)
 
+    app.router.add_get('/albums', customer.get_albums)
+
     app.router.add_get('/products/list', customer.get_product_list)
     app.router.add_get('/products/{Id:\d+}', customer.get_product)
     app.router.add_post(
@@ -89,6 +94,7 @@ def setup_platform_routes(root: web.Application) -> web.Application:
     app.router.add_post('/auth/signout', platform.signout)
 
     app.router.add_get('/filecoin/network', platform.get_filecoin_network)
+    app.router.add_get('/filecoin/network/history', platform.get_filecoin_network_history)
     app.router.add_get('/filecoin/network/mining/efficiency',
                        platform.get_filecoin_mining_efficiency)
 
@@ -96,6 +102,8 @@ def setup_platform_routes(root: web.Application) -> web.Application:
                         platform.owner_create_platform)
     app.router.add_post(
         '/owner/platforms/{Id:\d+}/customer/rebind', platform.owner_rebind_customer_to_platform)
+    app.router.add_post(
+        '/owner/customers/platform/rebind/import', platform.owner_import_customer_platforms)
     app.router.add_post(
         '/owner/platforms/{Id:\d+}/setting/edit', platform.owner_setting_platform)
     app.router.add_get('/owner/platforms/list',
@@ -141,8 +149,14 @@ def setup_platform_routes(root: web.Application) -> web.Application:
 
     app.router.add_post(
         '/platforms/{platformId:\d+}/albums/create', platform.create_albums)
+    app.router.add_get(
+        '/platforms/{platformId:\d+}/albums', platform.get_albums)
+    app.router.add_get(
+        '/platforms/{platformId:\d+}/albums/{Id:\d+}/photos', platform.get_album_photos)
     app.router.add_post(
         '/platforms/{platformId:\d+}/photos/{Id:\d+}', platform.get_photo)
+    app.router.add_get(
+        '/platforms/{platformId:\d+}/photos/{Id:\d+}', platform.get_photo)
     app.router.add_post(
         '/platforms/{platformId:\d+}/photos/{Id:\d+}/delete', platform.remove_photo)
     app.router.add_post(
@@ -152,6 +166,10 @@ def setup_platform_routes(root: web.Application) -> web.Application:
         '/platforms/{platformId:\d+}/customers/{Id:\d+}', platform.get_customer)
     app.router.add_post(
         '/platforms/{platformId:\d+}/customers/create', platform.create_customer)
+    app.router.add_post(
+        '/platforms/{platformId:\d+}/customers/import', platform.import_customers)
+    app.router.add_post(
+        '/platforms/{platformId:\d+}/customers/referrer/rebind/import', platform.import_customer_referrers)
     app.router.add_post(
         '/platforms/{platformId:\d+}/customers/{Id:\d+}/referrer/rebind', platform.rebind_customer_referrer)
     app.router.add_post(
@@ -185,6 +203,10 @@ def setup_platform_routes(root: web.Application) -> web.Application:
         '/platforms/{platformId:\d+}/orders/{Id:\d+}', platform.get_order)
     app.router.add_get(
         '/platforms/{platformId:\d+}/orders/list', platform.get_order_list)
+    app.router.add_get(
+        '/platforms/{platformId:\d+}/orders/export', platform.export_order_list)
+    app.router.add_post(
+        '/platforms/{platformId:\d+}/orders/transition', platform.transition_orders)
     app.router.add_post(
         '/platforms/{platformId:\d+}/orders/{Id:\d+}/comment', platform.comment_order)
     app.router.add_post(
@@ -223,6 +245,8 @@ def setup_platform_routes(root: web.Application) -> web.Application:
 
     app.router.add_get(
         '/platforms/{platformId:\d+}/filecoin/withdraw/list', platform.get_filecoin_withdraw_list)
+    app.router.add_get(
+        '/platforms/{platformId:\d+}/filecoin/withdraw/export', platform.export_filecoin_withdraw_list)
     app.router.add_get(
         '/platforms/{platformId:\d+}/filecoin/withdraw/{Id:\d+}', platform.get_filecoin_withdraw_line)
     app.router.add_post(
@@ -238,6 +262,8 @@ def setup_platform_routes(root: web.Application) -> web.Application:
         '/platforms/{platformId:\d+}/filecoin/storage/list', platform.get_filecoin_storage_list)
     app.router.add_get(
         '/platforms/{platformId:\d+}/filecoin/storage/sealed/add', platform.add_filecoin_sealed_storage)
+    app.router.add_post(
+        '/platforms/{platformId:\d+}/filecoin/storage/sealed/import', platform.import_filecoin_sealed_storage)
 
     app.router.add_post(
         '/platforms/{platformId:\d+}/filecoin/settlement/create', platform.create_filecoin_settlement)
@@ -248,6 +274,8 @@ def setup_platform_routes(root: web.Application) -> web.Application:
 
     app.router.add_get(
         '/platforms/{platformId:\d+}/filecoin/settlement/list', platform.get_filecoin_settlement_list)
+    app.router.add_get(
+        '/platforms/{platformId:\d+}/filecoin/settlement/export', platform.export_filecoin_settlement_list)
     app.router.add_get(
         '/platforms/{platformId:\d+}/filecoin/settlement/{settlementNo}', platform.get_filecoin_settlement)
 
@@ -345,7 +373,15 @@ def setup_platform_routes(root: web.Application) -> web.Application:
     app.router.add_get('/platforms/{platformId:\d+}/filecoin/customer/{Id:\d+}/stop',platform.stop_customer_orders)
     app.router.add_post('/platforms/{platformId:\d+}/filecoin/customer/{Id:\d+}/clearing/fee',platform.customer_clearing_fee)
     app.router.add_post('/platforms/{platformId:\d+}/filecoin/order/stop', platform.order_stop)
-    
+
+    app.router.add_get('/owner/cache/stats', platform.owner_get_cache_stats)
+    app.router.add_get('/owner/jobs', platform.owner_get_job_list)
+    app.router.add_get('/owner/slow/requests', platform.owner_get_slow_requests)
+    app.router.add_get('/owner/db/functions', platform.owner_get_db_function_stats)
+    app.router.add_post('/owner/filecoin/settlement/run', platform.owner_run_filecoin_settlement)
+    app.router.add_get('/owner/filecoin/settlement/progress', platform.owner_get_filecoin_settlement_progress)
+    app.router.add_get('/owner/dashboard', platform.owner_get_dashboard)
+
     return app
 
 
@@ -356,3 +392,10 @@ def setup_app_release_routes(root: web.Application) -> web.Application:
     app.router.add_post('/preinstall/device/enroll',
                         app_release.enroll_preinstall_app_device)
     return app
+
+
+def setup_asset_routes(root: web.Application) -> web.Application:
+    app = web.Application()
+    app.router.add_get('/blobs/{digest:[0-9a-f]{64}}', blobs.get_blob)
+    app.router.add_get('/blobs/{digest:[0-9a-f]{64}}/{width:\d+}.{format:[a-z]+}', images.get_variant)
+    return app
@@ -0,0 +1,125 @@
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List
+
+from aiohttp import web
+
+from mining.metrics import RequestTiming, add_request_listener, add_statement_listener
+
+logger = logging.getLogger('sampler')
+
+# defaults of the optional `slow` config section
+SLOW_REQUEST_MS = 1000
+SLOW_STATEMENT_MS = 300
+SLOW_REQUEST_KEEP = 100
+# latencies kept per stored function for the percentiles
+FUNCTION_SAMPLES = 512
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class FunctionStats:
+    __slots__ = ('calls', 'errors', 'total', 'max', 'samples')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=FUNCTION_SAMPLES)
+
+    def add(self, elapsed: float, failed: bool):
+        self.calls += 1
+        self.errors += failed
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.samples.append(elapsed)
+
+    def to_json(self, name: str) -> Dict[str, Any]:
+        samples = sorted(self.samples)
+        return {
+            'function': name,
+            'calls': self.calls,
+            'errors': self.errors,
+            'totalMs': round(self.total * 1000, 1),
+            'avgMs': round(self.total / self.calls * 1000, 2) if self.calls else 0,
+            'p50Ms': round(_percentile(samples, 0.5) * 1000, 2),
+            'p95Ms': round(_percentile(samples, 0.95) * 1000, 2),
+            'p99Ms': round(_percentile(samples, 0.99) * 1000, 2),
+            'maxMs': round(self.max * 1000, 2),
+        }
+
+
+class Sampler:
+    """Per stored function latency and a ring buffer of slow requests.
+
+    Fed by the statement and request hooks of mining/metrics.py. Statements
+    slower than `statement_ms` are logged on their own; requests slower
+    than `request_ms` are logged and kept, the last `keep` of them, with
+    the time each `yj_*` function took within the request. Streamed
+    responses (SSE, exports) count up to their first byte, so a client
+    reading for minutes is not a slow request.
+    """
+
+    def __init__(self, request_ms: int = SLOW_REQUEST_MS, statement_ms: int = SLOW_STATEMENT_MS, keep: int = SLOW_REQUEST_KEEP):
+        self.request_threshold = request_ms / 1000
+        self.statement_threshold = statement_ms / 1000
+        self.functions: Dict[str, FunctionStats] = {}
+        self.slow_requests: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self.since = time.time()
+
+    def on_statement(self, name: str, elapsed: float, failed: bool):
+        stats = self.functions.get(name) or self.functions.setdefault(name, FunctionStats())
+        stats.add(elapsed, failed)
+        if elapsed >= self.statement_threshold:
+            logger.warning(f"""Slow statement {name} took {elapsed * 1000:.0f}ms""")
+
+    def on_request(self, request: web.Request, route: str, status: int, elapsed: float, timing: RequestTiming):
+        if elapsed < self.request_threshold:
+            return
+        functions = sorted(timing.functions.items(), key=lambda item: item[1][1], reverse=True)
+        entry = {
+            'at': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': status,
+            'streamed': timing.first_byte is not None,
+            'durationMs': round(elapsed * 1000, 1),
+            'dbMs': round(timing.db_time * 1000, 1),
+            'dbCalls': timing.db_calls,
+            'poolWaitMs': round(timing.pool_wait * 1000, 1),
+            'sessionMs': round(timing.session_time * 1000, 1),
+            'functions': [{'function': name, 'calls': int(calls), 'ms': round(seconds * 1000, 1)}
+                          for name, (calls, seconds) in functions],
+        }
+        self.slow_requests.append(entry)
+        breakdown = ', '.join(f"""{f['function']} x{f['calls']} {f['ms']}ms""" for f in entry['functions'][:5])
+        logger.warning(f"""Slow request {request.method} {route} took {entry['durationMs']}ms, """
+                       f"""db {entry['dbMs']}ms in {timing.db_calls} calls, pool wait {entry['poolWaitMs']}ms: {breakdown}""")
+
+    def function_stats(self) -> List[Dict[str, Any]]:
+        return sorted((stats.to_json(name) for name, stats in self.functions.items()), key=lambda f: f['totalMs'], reverse=True)
+
+    def recent_slow_requests(self) -> List[Dict[str, Any]]:
+        return list(reversed(self.slow_requests))
+
+
+async def _on_startup(app: web.Application):
+    config = app['config'].get('slow', {})
+    sampler = Sampler(config.get('request_ms', SLOW_REQUEST_MS), config.get('statement_ms', SLOW_STATEMENT_MS),
+                      config.get('keep', SLOW_REQUEST_KEEP))
+    add_statement_listener(sampler.on_statement)
+    add_request_listener(sampler.on_request)
+    app['sampler'] = sampler
+    for sub in app._subapps:
+        sub['sampler'] = sampler
+
+
+def setup(app: web.Application):
+    app.on_startup.append(_on_startup)
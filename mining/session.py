@@ -9,6 +9,8 @@ import psycopg2.extras
 from aiohttp import web
 from aiohttp.web_middlewares import _Handler, _Middleware
 
+from mining.metrics import observe_session_load
+
 from build.lib.mining import session
 
 
@@ -261,7 +263,9 @@ class PgStorage(AbstractStorage):
         if session_id is None:
             return Session(None, new=True, is_customer=is_customer, max_age=self.max_age)
         else:
+            started = time.perf_counter()
             session = await self.app['db'].load_session(session_id, is_customer)
+            observe_session_load(time.perf_counter() - started, is_customer)
             if not session:
                 return Session(None, new=True, is_customer=is_customer, max_age=self.max_age)
             return Session(session_id, new=False, is_customer=is_customer, data=session, max_age=self.max_age)
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger('settlement')
+
+SETTLEMENT_CONCURRENCY = 8
+SETTLEMENT_ATTEMPTS = 3
+SETTLEMENT_BACKOFF = 2
+
+
+class SettlementOrchestrator:
+    """Settles one day for every platform with bounded concurrency.
+
+    Every platform is settled through `yj_settlement_checkpoint_settle` (see
+    sql/settlement_checkpoint.sql), which creates the settlement and marks
+    the day done in one transaction. Repeating a day, retrying after a lost
+    response, or running it from several workers at once therefore only
+    settles the platforms that are not done yet.
+    """
+
+    def __init__(self, db, concurrency: int = SETTLEMENT_CONCURRENCY):
+        self.db = db
+        self.concurrency = concurrency
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._tasks = set()
+
+    async def run_day(self, settle_day: date, mining_efficiency: Optional[int] = None,
+                      platform_ids: Optional[List[int]] = None, comment: Optional[str] = None) -> Dict[str, int]:
+        if mining_efficiency is None:
+            efficiency = await self.db.get_filecoin_mining_efficiency(settle_day)
+            if efficiency is None:
+                logger.warning(f"""Skip settlement of {settle_day}, mining efficiency is not available yet""")
+                return {}
+            mining_efficiency = int(efficiency)
+        if platform_ids is None:
+            platform_ids = [p['Id'] for p in await self.db.platform.owner_fetch_platform_list() or []]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        results = await asyncio.gather(*(
+            self._settle(semaphore, platform_id, settle_day, mining_efficiency, comment) for platform_id in platform_ids
+        ))
+
+        summary: Dict[str, int] = {}
+        for status in results:
+            summary[status] = summary.get(status, 0) + 1
+        logger.info(f"""Settlement of {settle_day} finished in {time.monotonic() - started:.1f}s: {summary}""")
+        return summary
+
+    def start_day(self, *args, **kwargs):
+        task = asyncio.ensure_future(self.run_day(*args, **kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _settle(self, semaphore: asyncio.Semaphore, platform_id: int, settle_day: date,
+                      mining_efficiency: int, comment: Optional[str]) -> str:
+        async with semaphore:
+            started = time.monotonic()
+            error = None
+            attempts = 0
+            while attempts < SETTLEMENT_ATTEMPTS:
+                attempts += 1
+                try:
+                    # safe to retry: a settlement that committed before the
+                    # error comes back with created = false
+                    _, created = await self.db.platform.create_filecoin_settlement_in_day(platform_id, settle_day, mining_efficiency,
+                                                                                         comment, owner=self.owner)
+                    return 'done' if created else 'skipped'
+                except Exception as exc:
+                    error = str(exc) or exc.__class__.__name__
+                    logger.warning(f"""Settle platform {platform_id} on {settle_day} failed (attempt {attempts}), reason: {error}""")
+                    if attempts < SETTLEMENT_ATTEMPTS:
+                        await asyncio.sleep(random.uniform(0, SETTLEMENT_BACKOFF * 2 ** attempts))
+
+            try:
+                await self.db.fail_settlement_checkpoint(platform_id, settle_day, self.owner, attempts, time.monotonic() - started, error)
+            except Exception as exc:
+                logger.error(f"""Checkpoint settlement of platform {platform_id} on {settle_day} failed, reason: {str(exc)}""")
+            return 'failed'
+
+    async def progress(self, settle_day: date) -> Dict[str, Any]:
+        platforms = await self.db.fetch_settlement_checkpoint_list(settle_day) or []
+        summary: Dict[str, int] = {}
+        for row in platforms:
+            summary[row['status']] = summary.get(row['status'], 0) + 1
+        return {'settleDayAt': settle_day.isoformat(), 'summary': summary, 'platforms': platforms}
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def _on_startup(app: web.Application):
+    orchestrator = SettlementOrchestrator(app['db'])
+    app['settlement'] = orchestrator
+    for sub in app._subapps:
+        sub['settlement'] = orchestrator
+
+
+async def _on_shutdown(app: web.Application):
+    await app['settlement'].close()
+
+
+def setup(app: web.Application):
+    app.on_startup.append(_on_startup)
+    app.on_shutdown.append(_on_shutdown)
@@ -0,0 +1,33 @@
+"""Rebuild the materialized revenue statistics from scratch.
+
+    python -m mining.statistics -c config/mining.yaml
+
+Meant for reconciliation after data fixes made directly in PostgreSQL,
+which bypass the refresh done by the API mutations.
+"""
+import asyncio
+import logging
+import sys
+
+from mining.db import Database
+from mining.settings import get_config
+
+logger = logging.getLogger('statistics')
+
+
+async def rebuild(config) -> int:
+    db = await Database.create({'config': config})
+    try:
+        return await db.statistics.rebuild()
+    finally:
+        await db.close()
+
+
+def main(argv):
+    logging.basicConfig(level=logging.INFO)
+    rows = asyncio.run(rebuild(get_config(argv)))
+    logger.info(f"""Rebuilt statistics, {rows} rows materialized""")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,99 @@
+from decimal import ROUND_HALF_EVEN, Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+# Values are kept numeric end to end: storage sizes as integer bytes, FIL
+# amounts as integer attoFIL, prices as `Decimal`. Strings such as
+# `'12.3456 EiB'` are only produced at the response edge.
+
+ATTO_PER_FIL = 10 ** 18
+
+KINDS = ('bytes', 'atto', 'decimal')
+
+# unit -> (divisor applied to the raw value, display template)
+UNITS: Dict[str, Tuple[int, str]] = {
+    'B': (1, '{} B'),
+    'KiB': (1024, '{} KiB'),
+    'MiB': (1024 ** 2, '{} MiB'),
+    'GiB': (1024 ** 3, '{} GiB'),
+    'TiB': (1024 ** 4, '{} TiB'),
+    'PiB': (1024 ** 5, '{} PiB'),
+    'EiB': (1024 ** 6, '{} EiB'),
+    'FIL': (ATTO_PER_FIL, '{} FIL'),
+    'FIL/TiB': (ATTO_PER_FIL, '{} FIL/TiB'),
+    'USD': (1, '${}'),
+}
+
+# locale -> (decimal point, thousands separator); the default keeps the
+# ungrouped output the apps have always parsed
+DEFAULT_LOCALE = 'zh-CN'
+LOCALES: Dict[str, Tuple[str, str]] = {
+    'zh-CN': ('.', ''),
+    'en-US': ('.', ','),
+    'de-DE': (',', '.'),
+}
+
+
+def to_raw(value: Any, kind: str) -> Any:
+    """Convert a chain value to its canonical raw form.
+
+    `bytes` and `atto` give exact integers (the latter from a FIL amount),
+    `decimal` keeps the value as a `Decimal`. Floats go through `str` so
+    the shortest repr is used instead of the binary expansion.
+    """
+    d = value if isinstance(value, Decimal) else Decimal(str(value))
+    if not d.is_finite():
+        raise ValueError(f'not a finite number: {value!r}')
+    if kind == 'bytes':
+        return int(d.to_integral_value(ROUND_HALF_EVEN))
+    if kind == 'atto':
+        return int((d * ATTO_PER_FIL).to_integral_value(ROUND_HALF_EVEN))
+    if kind == 'decimal':
+        return d
+    raise ValueError(f'unknown kind: {kind}')
+
+
+def convert_many(values: Mapping[str, Any], kinds: Mapping[str, str]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Convert every field named in `kinds` at once.
+
+    Returns the converted fields and, separately, the reason each missing or
+    malformed field was skipped, so one bad field never discards the rest.
+    """
+    converted: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    for name, kind in kinds.items():
+        if values.get(name) is None:
+            errors[name] = 'missing'
+            continue
+        try:
+            converted[name] = to_raw(values[name], kind)
+        except InvalidOperation:
+            errors[name] = f'not a number: {values[name]!r}'
+        except (ValueError, TypeError) as exc:
+            errors[name] = str(exc) or exc.__class__.__name__
+    return converted, errors
+
+
+@lru_cache(maxsize=None)
+def formatter(unit: str, places: Optional[int] = 4, locale: str = DEFAULT_LOCALE) -> Callable[[Any], str]:
+    divisor, template = UNITS[unit]
+    point, group = LOCALES.get(locale, LOCALES[DEFAULT_LOCALE])
+    quantum = Decimal(1).scaleb(-places) if places is not None else None
+    spec = ',f' if group else 'f'
+
+    def format_value(value: Any) -> str:
+        d = value if isinstance(value, Decimal) else Decimal(str(value))
+        if divisor != 1:
+            d = d / divisor
+        if quantum is not None:
+            d = d.quantize(quantum, ROUND_HALF_EVEN)
+        text = format(d, spec)
+        if group or point != '.':
+            text = text.replace(',', '\0').replace('.', point).replace('\0', group)
+        return template.format(text)
+
+    return format_value
+
+
+def format_value(value: Any, unit: str, places: Optional[int] = 4, locale: str = DEFAULT_LOCALE) -> str:
+    return formatter(unit, places, locale)(value)
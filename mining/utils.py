@@ -1,6 +1,7 @@
 import asyncio
+import hashlib
 import re
-from typing import Optional
+from typing import Any, Awaitable, Dict, Optional, Tuple
 import trafaret as T
 import tempfile
 import os
@@ -22,6 +23,43 @@ TRAFARET = T.Dict({
         }),
     T.Key('host'): T.IP,
     T.Key('port'): T.Int(),
+    T.Key('crawler', optional=True):
+        T.Dict({
+            T.Key('filscan_url', optional=True): T.String(),
+            T.Key('coingecko_url', optional=True): T.String(),
+            T.Key('timeout', optional=True): T.Float(),
+            T.Key('retries', optional=True): T.Int(),
+            T.Key('backoff', optional=True): T.Float(),
+            T.Key('breaker_threshold', optional=True): T.Int(),
+            T.Key('breaker_reset', optional=True): T.Float(),
+        }),
+    T.Key('blobs', optional=True):
+        T.Dict({
+            T.Key('root', optional=True): T.String(),
+        }),
+    T.Key('metrics', optional=True):
+        T.Dict({
+            T.Key('public', optional=True): T.Bool(),
+            T.Key('token', optional=True): T.String(min_length=16),
+        }),
+    T.Key('images', optional=True):
+        T.Dict({
+            T.Key('workers', optional=True): T.Int(gte=1),
+        }),
+    T.Key('slow', optional=True):
+        T.Dict({
+            T.Key('request_ms', optional=True): T.Int(gte=0),
+            T.Key('statement_ms', optional=True): T.Int(gte=0),
+            T.Key('keep', optional=True): T.Int(gte=1),
+        }),
+    T.Key('settlement', optional=True):
+        T.Dict({
+            T.Key('auto', optional=True): T.Bool(),
+        }),
+    T.Key('prices', optional=True):
+        T.Dict({
+            T.Key('pegs', optional=True): T.Mapping(T.String(), T.String() | T.Float()),
+        }),
 })
 
 async def invoke(func):
@@ -31,6 +69,31 @@ async def invoke(func):
     return result
 
 
+async def gather_sections(sections: Dict[str, Awaitable[Any]], timeout: float) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Await named coroutines concurrently, each bounded by `timeout`.
+
+    Returns the results of the sections that finished and, separately, why
+    the others did not, so a caller can render what it has.
+    """
+    names = list(sections)
+    results = await asyncio.gather(*(asyncio.wait_for(sections[name], timeout) for name in names), return_exceptions=True)
+
+    data: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    for name, result in zip(names, results):
+        if isinstance(result, asyncio.TimeoutError):
+            errors[name] = 'timeout'
+        elif isinstance(result, Exception):
+            errors[name] = str(result) or result.__class__.__name__
+        else:
+            data[name] = result
+    return data, errors
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
 def check_request(request, entries):
     for pattern in entries:
         if re.match(pattern, request.path):
@@ -34,7 +34,8 @@ install_requires = ['aiohttp',
                     'PyJWT',
                     'pyotp',
                     'apscheduler',
-                    'aiofiles']
+                    'aiofiles',
+                    'Pillow']
 
 
 setup(name='mining-api-backend',
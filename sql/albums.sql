@@ -0,0 +1,21 @@
+-- Batched album fetch for mining/db.py `fetch_albums`.
+--
+-- The requested ids are joined once against yj_album(id, platform_id) (see
+-- sql/photos.sql), so albums of other platforms are left out like unknown
+-- ids, and the photos of each remaining album come from the legacy
+-- yj_fetch_album_photos unchanged: a JSON list, `[]` for an empty album.
+-- Repeated ids are returned once, in the position of their first
+-- occurrence.
+
+DROP FUNCTION IF EXISTS yj_fetch_albums(integer[]);
+
+CREATE OR REPLACE FUNCTION yj_fetch_albums(in_platform_id integer, in_ids integer[])
+RETURNS json AS $$
+    SELECT coalesce(json_agg(json_build_object('Id', a.id, 'album', coalesce(p.o_album::json, '[]'::json)) ORDER BY a.position), '[]'::json)
+      FROM (SELECT t.id, min(t.position) AS position
+              FROM unnest(in_ids) WITH ORDINALITY AS t(id, position)
+             WHERE t.id IS NOT NULL
+             GROUP BY t.id) a
+      JOIN yj_album al ON al.id = a.id AND al.platform_id = in_platform_id
+     CROSS JOIN LATERAL yj_fetch_album_photos(a.id) p;
+$$ LANGUAGE sql STABLE;
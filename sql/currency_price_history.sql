@@ -0,0 +1,46 @@
+-- Quotes pushed into the in-memory price index (mining/prices.py), kept so
+-- settlements can be valued at the price of their day.
+
+CREATE TABLE IF NOT EXISTS yj_currency_price_history (
+    base_code    text        NOT NULL,
+    counter_code text        NOT NULL,
+    quoted_at    timestamptz NOT NULL,
+    price        numeric     NOT NULL,
+    source       text        NOT NULL,
+    PRIMARY KEY (base_code, counter_code, quoted_at)
+);
+
+
+CREATE OR REPLACE FUNCTION yj_add_currency_price(in_base text, in_counter text, in_price numeric, in_source text, in_quoted_at timestamptz)
+RETURNS void AS $$
+    INSERT INTO yj_currency_price_history (base_code, counter_code, quoted_at, price, source)
+    VALUES (in_base, in_counter, in_quoted_at, in_price, in_source)
+    ON CONFLICT (base_code, counter_code, quoted_at) DO NOTHING;
+$$ LANGUAGE sql;
+
+
+CREATE OR REPLACE FUNCTION yj_get_latest_currency_prices()
+RETURNS json AS $$
+    SELECT coalesce(json_agg(json_build_object(
+               'base', h.base_code,
+               'counter', h.counter_code,
+               'price', h.price::text,
+               'source', h.source,
+               'quotedAt', extract(epoch FROM h.quoted_at)
+           )), '[]'::json)
+      FROM (
+        SELECT DISTINCT ON (base_code, counter_code) *
+          FROM yj_currency_price_history
+         ORDER BY base_code, counter_code, quoted_at DESC
+      ) h;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_get_currency_price_at(in_base text, in_counter text, in_at timestamptz)
+RETURNS numeric AS $$
+    SELECT price
+      FROM yj_currency_price_history
+     WHERE base_code = in_base AND counter_code = in_counter AND quoted_at <= in_at
+     ORDER BY quoted_at DESC
+     LIMIT 1;
+$$ LANGUAGE sql STABLE;
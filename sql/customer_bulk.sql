@@ -0,0 +1,220 @@
+-- Bulk customer import and rebinding, see the `import_*` methods of
+-- `Database.Platform` in mining/db.py and mining/bulk.py.
+--
+-- The API validates uploaded rows while streaming them into a temporary
+-- staging table of the session and then calls one of these functions in
+-- the same transaction. Each function is set-based, like
+-- sql/sealed_storage_bulk.sql. One statement joins the staging table
+-- against the customer table to find the lines to reject, reports them
+-- with their line number, and applies every other line with a single
+-- INSERT ... SELECT or UPDATE ... FROM.
+--
+-- The statements write what the single-customer functions write, and the
+-- single-customer endpoints still call those functions. The legacy schema
+-- is not in this repository. As in sql/pagination.sql, this assumes
+-- yj_customer(id, platform_id, mobile, nick_name, remarks_name,
+-- description, referrer_customer_id), with mobiles unique per platform
+-- and a serial id, and yj_platform(id).
+
+
+-- Rows of yj_staging_customer are created in file order. A referrer may be
+-- given by id or by the mobile of a customer created earlier in the same
+-- file; a mobile repeated in the file is only created once. A line whose
+-- referrer line is rejected is rejected too.
+CREATE OR REPLACE FUNCTION yj_customer_apply_import_staging(in_platform_id integer)
+RETURNS json AS $$
+DECLARE
+    v_summary json;
+BEGIN
+    WITH RECURSIVE numbered AS (
+        SELECT s.*,
+               row_number() OVER (PARTITION BY s.mobile ORDER BY s.line) AS nth
+          FROM yj_staging_customer s
+    ), checked AS (
+        SELECT n.*,
+               CASE WHEN n.nth > 1 OR c.id IS NOT NULL THEN '手机号重复'
+                    WHEN n.referrer_customer_id IS NOT NULL AND ref.id IS NULL THEN '推荐人未找到'
+                    WHEN n.referrer_customer_id IS NULL AND n.referrer_mobile IS NOT NULL
+                         AND NOT EXISTS (SELECT 1 FROM numbered p WHERE p.mobile = n.referrer_mobile AND p.nth = 1 AND p.line < n.line)
+                         THEN format('推荐人 %s 未在此前的行中导入', n.referrer_mobile)
+               END AS reason
+          FROM numbered n
+          LEFT JOIN yj_customer c ON c.platform_id = in_platform_id AND c.mobile = n.mobile
+          LEFT JOIN yj_customer ref ON ref.platform_id = in_platform_id AND ref.id = n.referrer_customer_id
+    ), accepted(line, mobile) AS (
+        -- lines referred by id or not at all, then those referred by an accepted line
+        SELECT k.line, k.mobile
+          FROM checked k
+         WHERE k.reason IS NULL
+           AND (k.referrer_customer_id IS NOT NULL OR k.referrer_mobile IS NULL)
+        UNION
+        SELECT k.line, k.mobile
+          FROM checked k
+          JOIN accepted a ON a.mobile = k.referrer_mobile
+         WHERE k.reason IS NULL
+           AND k.referrer_customer_id IS NULL
+    ), new_ids AS (
+        -- ids are drawn up front, so a line can point at the customer of an
+        -- earlier line in the same INSERT
+        SELECT k.line, nextval(pg_get_serial_sequence('yj_customer', 'id'))::integer AS id
+          FROM checked k
+          JOIN accepted a ON a.line = k.line
+         ORDER BY k.line
+    ), results AS (
+        SELECT k.line, k.mobile, k.nick_name, k.remarks_name, k.description, i.id,
+               coalesce(k.referrer_customer_id, ri.id) AS referrer_customer_id,
+               CASE WHEN i.id IS NULL THEN coalesce(k.reason, format('推荐人 %s 导入失败', k.referrer_mobile)) END AS reason
+          FROM checked k
+          LEFT JOIN new_ids i ON i.line = k.line
+          LEFT JOIN checked rk ON rk.mobile = k.referrer_mobile AND rk.nth = 1 AND k.referrer_customer_id IS NULL
+          LEFT JOIN new_ids ri ON ri.line = rk.line
+    ), inserted AS (
+        INSERT INTO yj_customer (id, platform_id, mobile, nick_name, remarks_name, description, referrer_customer_id)
+        SELECT r.id, in_platform_id, r.mobile, r.nick_name, r.remarks_name, r.description, r.referrer_customer_id
+          FROM results r
+         WHERE r.id IS NOT NULL
+         ORDER BY r.line
+        RETURNING id
+    )
+    SELECT json_build_object(
+               'created', (SELECT count(*) FROM inserted),
+               'customers', coalesce(json_agg(json_build_object('line', r.line, 'mobile', r.mobile, 'Id', r.id) ORDER BY r.line)
+                                     FILTER (WHERE r.id IS NOT NULL), '[]'::json),
+               'errors', coalesce(json_agg(json_build_object('line', r.line, 'mobile', r.mobile, 'reason', r.reason) ORDER BY r.line)
+                                  FILTER (WHERE r.id IS NULL), '[]'::json))
+      INTO v_summary
+      FROM results r;
+
+    RETURN v_summary;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- The last line wins when a customer is listed more than once. Both sides
+-- must be customers of the platform, and no line may close a referral
+-- cycle once every accepted line is applied.
+CREATE OR REPLACE FUNCTION yj_customer_apply_referrer_staging(in_platform_id integer)
+RETURNS json AS $$
+DECLARE
+    v_summary json;
+BEGIN
+    PERFORM 1
+       FROM yj_customer c
+      WHERE c.platform_id = in_platform_id
+        AND c.id IN (SELECT s.customer_id FROM yj_staging_customer_referrer s)
+      ORDER BY c.id
+        FOR UPDATE;
+
+    WITH RECURSIVE staged AS (
+        SELECT DISTINCT ON (s.customer_id) s.*
+          FROM yj_staging_customer_referrer s
+         ORDER BY s.customer_id, s.line DESC
+    ), checked AS (
+        SELECT s.line, s.customer_id, s.referrer_id,
+               CASE WHEN c.id IS NULL THEN '客户未找到'
+                    WHEN ref.id IS NULL THEN '推荐人未找到'
+                    WHEN s.referrer_id = s.customer_id THEN '不能推荐自己'
+               END AS reason
+          FROM staged s
+          LEFT JOIN yj_customer c ON c.platform_id = in_platform_id AND c.id = s.customer_id
+          LEFT JOIN yj_customer ref ON ref.platform_id = in_platform_id AND ref.id = s.referrer_id
+    ), edges AS (
+        -- the referrer of every customer of the platform once the import applied
+        SELECT c.id, coalesce(k.referrer_id, c.referrer_customer_id) AS referrer_id
+          FROM yj_customer c
+          LEFT JOIN checked k ON k.customer_id = c.id AND k.reason IS NULL
+         WHERE c.platform_id = in_platform_id
+    ), walk(start, id) AS (
+        SELECT k.customer_id, k.referrer_id
+          FROM checked k
+         WHERE k.reason IS NULL
+        UNION
+        SELECT w.start, e.referrer_id
+          FROM walk w
+          JOIN edges e ON e.id = w.id
+         WHERE w.id <> w.start
+           AND e.referrer_id IS NOT NULL
+    ), results AS (
+        SELECT k.line, k.customer_id, k.referrer_id,
+               coalesce(k.reason, CASE WHEN EXISTS (SELECT 1 FROM walk w WHERE w.start = k.customer_id AND w.id = k.customer_id)
+                                       THEN '推荐关系成环' END) AS reason
+          FROM checked k
+    ), updated AS (
+        UPDATE yj_customer c
+           SET referrer_customer_id = r.referrer_id
+          FROM results r
+         WHERE c.id = r.customer_id
+           AND r.reason IS NULL
+        RETURNING c.id
+    )
+    SELECT json_build_object(
+               'applied', (SELECT count(*) FROM updated),
+               'errors', coalesce(json_agg(json_build_object('line', r.line, 'customerId', r.customer_id, 'reason', r.reason) ORDER BY r.line)
+                                  FILTER (WHERE r.reason IS NOT NULL), '[]'::json))
+      INTO v_summary
+      FROM results r;
+
+    RETURN v_summary;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- The last line wins when a customer is listed more than once. A moved
+-- customer keeps its orders where they were placed. Referral links that
+-- would cross platforms afterwards are cleared, because referrers are
+-- scoped to a platform.
+CREATE OR REPLACE FUNCTION yj_owner_apply_customer_platform_staging()
+RETURNS json AS $$
+DECLARE
+    v_summary json;
+BEGIN
+    PERFORM 1
+       FROM yj_customer c
+      WHERE c.id IN (SELECT s.customer_id FROM yj_staging_customer_platform s)
+      ORDER BY c.id
+        FOR UPDATE;
+
+    WITH staged AS (
+        SELECT DISTINCT ON (s.customer_id) s.*
+          FROM yj_staging_customer_platform s
+         ORDER BY s.customer_id, s.line DESC
+    ), checked AS (
+        SELECT s.line, s.customer_id, s.new_platform_id,
+               CASE WHEN c.id IS NULL THEN '客户未找到'
+                    WHEN p.id IS NULL THEN '平台未找到'
+                    WHEN s.new_platform_id = s.platform_id THEN '客户已在该平台'
+                    WHEN EXISTS (SELECT 1 FROM yj_customer d WHERE d.platform_id = s.new_platform_id AND d.mobile = c.mobile)
+                         THEN '手机号重复'
+               END AS reason
+          FROM staged s
+          LEFT JOIN yj_customer c ON c.id = s.customer_id AND c.platform_id = s.platform_id
+          LEFT JOIN yj_platform p ON p.id = s.new_platform_id
+    ), moved AS (
+        UPDATE yj_customer c
+           SET platform_id = k.new_platform_id
+          FROM checked k
+         WHERE c.id = k.customer_id
+           AND k.reason IS NULL
+        RETURNING c.id, c.platform_id
+    ), summary AS (
+        SELECT (SELECT count(*) FROM moved) AS applied,
+               coalesce(json_agg(json_build_object('line', k.line, 'customerId', k.customer_id, 'reason', k.reason) ORDER BY k.line)
+                        FILTER (WHERE k.reason IS NOT NULL), '[]'::json) AS errors
+          FROM checked k
+    )
+    SELECT json_build_object('applied', s.applied, 'errors', s.errors)
+      INTO v_summary
+      FROM summary s;
+
+    -- the statement above is done, so the referral links are read as moved
+    UPDATE yj_customer c
+       SET referrer_customer_id = NULL
+      FROM yj_customer ref
+     WHERE ref.id = c.referrer_customer_id
+       AND ref.platform_id <> c.platform_id
+       AND (c.id IN (SELECT s.customer_id FROM yj_staging_customer_platform s)
+            OR ref.id IN (SELECT s.customer_id FROM yj_staging_customer_platform s));
+
+    RETURN v_summary;
+END;
+$$ LANGUAGE plpgsql;
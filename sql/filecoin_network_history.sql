@@ -0,0 +1,108 @@
+-- Time series of the Filecoin network metrics collected by the crawler job.
+--
+-- Raw samples are appended every crawl (one row per 5 minutes) and kept for
+-- a short window only; charts are served from the hourly and daily rollups,
+-- which are recomputed for the affected buckets on every insert.
+--
+-- Values are raw numbers as produced by mining/units.py: power in bytes,
+-- the per-TiB figures in attoFIL per TiB and the price in USD.
+
+CREATE TABLE IF NOT EXISTS yj_filecoin_network_sample (
+    sampled_at          timestamptz PRIMARY KEY,
+    total_quality_power numeric,
+    power_increase_24h  numeric,
+    fil_per_tera        numeric,
+    pledge_per_tera     numeric,
+    gas_in_32g          numeric,
+    gas_in_64g          numeric,
+    add_power_in_32g    numeric,
+    add_power_in_64g    numeric,
+    fil_price_usd       numeric
+);
+
+CREATE TABLE IF NOT EXISTS yj_filecoin_network_rollup (
+    step                text        NOT NULL CHECK (step IN ('hour', 'day')),
+    bucket              timestamptz NOT NULL,
+    samples             integer     NOT NULL,
+    total_quality_power numeric,
+    power_increase_24h  numeric,
+    fil_per_tera        numeric,
+    pledge_per_tera     numeric,
+    gas_in_32g          numeric,
+    gas_in_64g          numeric,
+    add_power_in_32g    numeric,
+    add_power_in_64g    numeric,
+    fil_price_usd       numeric,
+    PRIMARY KEY (step, bucket)
+);
+
+
+CREATE OR REPLACE FUNCTION yj_add_filecoin_network_sample(in_sample jsonb, in_sampled_at timestamptz DEFAULT now())
+RETURNS void AS $$
+DECLARE
+    v_step text;
+    v_bucket timestamptz;
+BEGIN
+    INSERT INTO yj_filecoin_network_sample
+    VALUES (
+        in_sampled_at,
+        (in_sample->>'total_quality_power')::numeric,
+        (in_sample->>'power_increase_24h')::numeric,
+        (in_sample->>'fil_per_tera')::numeric,
+        (in_sample->>'pledge_per_tera')::numeric,
+        (in_sample->>'gas_in_32g')::numeric,
+        (in_sample->>'gas_in_64g')::numeric,
+        (in_sample->>'add_power_in_32g')::numeric,
+        (in_sample->>'add_power_in_64g')::numeric,
+        (in_sample->>'fil_price_usd')::numeric
+    )
+    ON CONFLICT (sampled_at) DO NOTHING;
+
+    -- avg() skips NULLs, so a field a source failed to report does not drag
+    -- the bucket towards zero
+    FOREACH v_step IN ARRAY ARRAY['hour', 'day'] LOOP
+        v_bucket := date_trunc(v_step, in_sampled_at);
+        INSERT INTO yj_filecoin_network_rollup
+        SELECT v_step, v_bucket, count(*),
+               avg(total_quality_power), avg(power_increase_24h), avg(fil_per_tera), avg(pledge_per_tera),
+               avg(gas_in_32g), avg(gas_in_64g), avg(add_power_in_32g), avg(add_power_in_64g), avg(fil_price_usd)
+          FROM yj_filecoin_network_sample
+         WHERE sampled_at >= v_bucket AND sampled_at < v_bucket + ('1 ' || v_step)::interval
+        ON CONFLICT (step, bucket) DO UPDATE SET
+            samples = EXCLUDED.samples,
+            total_quality_power = EXCLUDED.total_quality_power,
+            power_increase_24h = EXCLUDED.power_increase_24h,
+            fil_per_tera = EXCLUDED.fil_per_tera,
+            pledge_per_tera = EXCLUDED.pledge_per_tera,
+            gas_in_32g = EXCLUDED.gas_in_32g,
+            gas_in_64g = EXCLUDED.gas_in_64g,
+            add_power_in_32g = EXCLUDED.add_power_in_32g,
+            add_power_in_64g = EXCLUDED.add_power_in_64g,
+            fil_price_usd = EXCLUDED.fil_price_usd;
+    END LOOP;
+
+    -- the daily rollup of the oldest day kept is complete long before its
+    -- raw samples are dropped
+    DELETE FROM yj_filecoin_network_sample WHERE sampled_at < in_sampled_at - interval '3 days';
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION yj_get_filecoin_network_history(in_from timestamptz, in_to timestamptz, in_step text)
+RETURNS json AS $$
+    SELECT coalesce(json_agg(json_build_object(
+               'bucket', r.bucket,
+               'samples', r.samples,
+               'totalQualityPower', r.total_quality_power,
+               'powerIncrease24h', r.power_increase_24h,
+               'filPerTera', r.fil_per_tera,
+               'pledgePerTera', r.pledge_per_tera,
+               'gasIn32g', r.gas_in_32g,
+               'gasIn64g', r.gas_in_64g,
+               'addPowerIn32g', r.add_power_in_32g,
+               'addPowerIn64g', r.add_power_in_64g,
+               'filPriceUsd', r.fil_price_usd
+           ) ORDER BY r.bucket), '[]'::json)
+      FROM yj_filecoin_network_rollup r
+     WHERE r.step = in_step AND r.bucket >= date_trunc(in_step, in_from) AND r.bucket < in_to;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,99 @@
+-- Stored responses of idempotent POST endpoints, see mining/idempotency.py.
+--
+-- `key` is a SHA-256 over the endpoint path, the caller and the client's
+-- Idempotency-Key header, so equal header values of different callers never
+-- collide. A row is `pending` while the first request runs and `done` once
+-- its response is stored; retries replay `body`. Pending rows of a request
+-- the handler rejected are deleted so the client can retry. A request that
+-- ran but whose response cannot be replayed, because the handler failed
+-- after its side effect or streamed its response, is marked `unknown`. A
+-- pending row older than the lease passed to `yj_idempotency_begin`, left
+-- by a worker that died or could not store the response, is reported as
+-- `unknown` too. An `unknown` key is never claimed again before it expires,
+-- so a retry cannot run the request twice. Expired rows are removed by
+-- `yj_idempotency_cleanup`, run from the job runner.
+
+CREATE TABLE IF NOT EXISTS yj_idempotency_key (
+    key          text        PRIMARY KEY,
+    fingerprint  text        NOT NULL,
+    state        text        NOT NULL DEFAULT 'pending' CHECK (state IN ('pending', 'done', 'unknown')),
+    status       integer,
+    content_type text,
+    body         bytea,
+    created_at   timestamptz NOT NULL DEFAULT now(),
+    claimed_at   timestamptz NOT NULL DEFAULT now(),
+    expires_at   timestamptz NOT NULL
+);
+
+ALTER TABLE yj_idempotency_key ADD COLUMN IF NOT EXISTS claimed_at timestamptz NOT NULL DEFAULT now();
+ALTER TABLE yj_idempotency_key DROP CONSTRAINT IF EXISTS yj_idempotency_key_state_check;
+ALTER TABLE yj_idempotency_key ADD CONSTRAINT yj_idempotency_key_state_check CHECK (state IN ('pending', 'done', 'unknown'));
+
+CREATE INDEX IF NOT EXISTS yj_idempotency_key_expires_idx ON yj_idempotency_key (expires_at);
+
+
+DROP FUNCTION IF EXISTS yj_idempotency_begin(text, text, integer);
+
+-- Claims `in_key` for a new request. Returns o_claimed = true when the
+-- caller must run the request, otherwise the row found, with a pending row
+-- past the lease reported as `unknown`.
+CREATE OR REPLACE FUNCTION yj_idempotency_begin(in_key text, in_fingerprint text, in_ttl_seconds integer,
+                                                in_lease_seconds integer,
+                                                OUT o_claimed boolean, OUT o_fingerprint text, OUT o_state text,
+                                                OUT o_status integer, OUT o_content_type text, OUT o_body bytea)
+AS $$
+BEGIN
+    DELETE FROM yj_idempotency_key
+     WHERE key = in_key
+       AND expires_at < now();
+
+    INSERT INTO yj_idempotency_key (key, fingerprint, expires_at)
+    VALUES (in_key, in_fingerprint, now() + make_interval(secs => in_ttl_seconds))
+    ON CONFLICT (key) DO NOTHING;
+
+    IF FOUND THEN
+        o_claimed := true;
+        RETURN;
+    END IF;
+
+    o_claimed := false;
+    SELECT fingerprint,
+           CASE WHEN state = 'pending' AND claimed_at < now() - make_interval(secs => in_lease_seconds)
+                THEN 'unknown' ELSE state END,
+           status, content_type, body
+      INTO o_fingerprint, o_state, o_status, o_content_type, o_body
+      FROM yj_idempotency_key
+     WHERE key = in_key;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION yj_idempotency_finish(in_key text, in_status integer, in_content_type text, in_body bytea)
+RETURNS void AS $$
+    UPDATE yj_idempotency_key
+       SET state = 'done', status = in_status, content_type = in_content_type, body = in_body
+     WHERE key = in_key AND state = 'pending';
+$$ LANGUAGE sql;
+
+
+CREATE OR REPLACE FUNCTION yj_idempotency_abandon(in_key text)
+RETURNS void AS $$
+    UPDATE yj_idempotency_key
+       SET state = 'unknown'
+     WHERE key = in_key AND state = 'pending';
+$$ LANGUAGE sql;
+
+
+CREATE OR REPLACE FUNCTION yj_idempotency_release(in_key text)
+RETURNS void AS $$
+    DELETE FROM yj_idempotency_key WHERE key = in_key AND state = 'pending';
+$$ LANGUAGE sql;
+
+
+CREATE OR REPLACE FUNCTION yj_idempotency_cleanup()
+RETURNS integer AS $$
+    WITH deleted AS (
+        DELETE FROM yj_idempotency_key WHERE expires_at < now() RETURNING 1
+    )
+    SELECT count(*)::integer FROM deleted;
+$$ LANGUAGE sql;
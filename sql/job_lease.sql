@@ -0,0 +1,75 @@
+-- Coordination of the background jobs in mining/jobs.py across workers.
+--
+-- Every worker schedules every job; on each tick the worker first claims the
+-- job here. A claim succeeds only when no other worker holds a live lease
+-- and the job has not been started within the current interval, so each job
+-- runs once per interval cluster-wide. If the worker running a job dies,
+-- its lease expires and the next tick of any other worker takes over.
+
+CREATE TABLE IF NOT EXISTS yj_job_lease (
+    name             text PRIMARY KEY,
+    owner            text,
+    lease_until      timestamptz,
+    last_started_at  timestamptz,
+    last_finished_at timestamptz,
+    last_duration    double precision,
+    last_error       text,
+    last_owner       text,
+    runs             bigint NOT NULL DEFAULT 0,
+    failures         bigint NOT NULL DEFAULT 0
+);
+
+
+CREATE OR REPLACE FUNCTION yj_job_try_claim(in_name text, in_owner text, in_interval_seconds integer, in_lease_seconds integer)
+RETURNS boolean AS $$
+DECLARE
+    v_claimed boolean;
+BEGIN
+    INSERT INTO yj_job_lease (name) VALUES (in_name) ON CONFLICT (name) DO NOTHING;
+
+    -- ticks of different workers drift by a few seconds, hence the slack
+    UPDATE yj_job_lease
+       SET owner = in_owner,
+           lease_until = now() + make_interval(secs => in_lease_seconds),
+           last_started_at = now()
+     WHERE name = in_name
+       AND (lease_until IS NULL OR lease_until < now())
+       AND (last_started_at IS NULL OR last_started_at < now() - make_interval(secs => in_interval_seconds * 0.9))
+    RETURNING true INTO v_claimed;
+
+    RETURN coalesce(v_claimed, false);
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION yj_job_finish(in_name text, in_owner text, in_duration double precision, in_error text)
+RETURNS void AS $$
+    UPDATE yj_job_lease
+       SET owner = NULL,
+           lease_until = NULL,
+           last_finished_at = now(),
+           last_duration = in_duration,
+           last_error = in_error,
+           last_owner = in_owner,
+           runs = runs + 1,
+           failures = failures + (CASE WHEN in_error IS NULL THEN 0 ELSE 1 END)
+     WHERE name = in_name AND owner = in_owner;
+$$ LANGUAGE sql;
+
+
+CREATE OR REPLACE FUNCTION yj_job_fetch_list()
+RETURNS json AS $$
+    SELECT coalesce(json_agg(json_build_object(
+               'name', name,
+               'owner', owner,
+               'leaseUntil', lease_until,
+               'lastStartedAt', last_started_at,
+               'lastFinishedAt', last_finished_at,
+               'lastDuration', last_duration,
+               'lastError', last_error,
+               'lastOwner', last_owner,
+               'runs', runs,
+               'failures', failures
+           ) ORDER BY name), '[]'::json)
+      FROM yj_job_lease;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,81 @@
+-- Bulk order transitions for mining/orders.py.
+--
+-- ORDER_TRANSITIONS maps an action to the existing stored function behind
+-- the matching single order endpoint. That function stays authoritative
+-- for which states an order may take the action from, because it is the
+-- one that knows the order schema. It also carries the side effects of a
+-- transition (balances, statistics), which is why it is reused instead of
+-- updating the order table directly.
+--
+-- `yj_platform_order_transition` first locks, in one statement, every
+-- requested order that belongs to the platform, joining on
+-- yj_order.platform_id (the base table assumed in sql/pagination.sql). The
+-- locks are taken in id order, so concurrent batches cannot deadlock, and
+-- no order changes between the check and the transition. Ids not found are
+-- reported without calling anything. Each remaining order then runs the
+-- function in its own subtransaction, so a rejected order is reported with
+-- its error without undoing the others. With in_dry_run every
+-- subtransaction is rolled back after the function returns. The report
+-- then says which orders would take the action now, and what the others
+-- would fail with.
+--
+-- The function receives in_args, with the order id placed at position
+-- in_id_arg. The arguments are integers, so the call is built from their
+-- text form.
+
+DROP FUNCTION IF EXISTS yj_platform_order_states(integer[]);
+DROP FUNCTION IF EXISTS yj_platform_order_transition(integer, integer[], text, text);
+
+CREATE OR REPLACE FUNCTION yj_platform_order_transition(in_platform_id integer, in_ids integer[], in_action text,
+                                                        in_function text, in_args integer[], in_id_arg integer,
+                                                        in_dry_run boolean)
+RETURNS json AS $$
+DECLARE
+    v_order   record;
+    v_args    integer[];
+    v_results json[] := '{}';
+BEGIN
+    IF in_function !~ '^yj_[a-z_]+$' THEN
+        RAISE EXCEPTION 'not an order transition function: %', in_function;
+    END IF;
+
+    PERFORM 1
+       FROM yj_order o
+      WHERE o.id = ANY (in_ids)
+        AND o.platform_id = in_platform_id
+      ORDER BY o.id
+        FOR UPDATE;
+
+    FOR v_order IN
+        SELECT u.id, o.id IS NOT NULL AS found
+          FROM (SELECT t.id, min(t.position) AS position
+                  FROM unnest(in_ids) WITH ORDINALITY AS t(id, position)
+                 WHERE t.id IS NOT NULL
+                 GROUP BY t.id) u
+          LEFT JOIN yj_order o ON o.id = u.id AND o.platform_id = in_platform_id
+         ORDER BY u.position
+    LOOP
+        IF NOT v_order.found THEN
+            v_results := v_results || json_build_object('Id', v_order.id, 'action', in_action, 'ok', false, 'reason', '订单未找到');
+            CONTINUE;
+        END IF;
+        v_args := in_args;
+        v_args[in_id_arg] := v_order.id;
+        BEGIN
+            EXECUTE format('SELECT %I(%s)', in_function, array_to_string(v_args, ', '));
+            IF in_dry_run THEN
+                RAISE EXCEPTION USING ERRCODE = 'YJ001';
+            END IF;
+            v_results := v_results || json_build_object('Id', v_order.id, 'action', in_action, 'ok', true, 'reason', NULL);
+        EXCEPTION
+            WHEN SQLSTATE 'YJ001' THEN
+                -- the dry run succeeded and was rolled back
+                v_results := v_results || json_build_object('Id', v_order.id, 'action', in_action, 'ok', true, 'reason', NULL);
+            WHEN others THEN
+                v_results := v_results || json_build_object('Id', v_order.id, 'action', in_action, 'ok', false, 'reason', SQLERRM);
+        END;
+    END LOOP;
+
+    RETURN array_to_json(v_results);
+END;
+$$ LANGUAGE plpgsql;
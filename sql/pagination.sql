@@ -0,0 +1,432 @@
+-- Keyset pagination of the list endpoints, for mining/pagination.py and
+-- the exports in mining/export.py.
+--
+-- Every paged list has a `yj_*_rows` function. It reads the list's table
+-- directly, newest first, and resumes below `in_after_id`:
+--
+--     WHERE <scope> AND <filter> AND id < in_after_id ORDER BY id DESC
+--
+-- It is a plain SQL function, so PostgreSQL inlines it. A LIMIT, or a
+-- cursor FETCH, on top of it walks the (scope, id DESC) index below and
+-- stops early. A page costs O(limit), whatever the size of the list.
+-- Every row carries its `Id`, which the next cursor is built from.
+--
+-- The `(legacy args..., in_limit, in_after_id)` overloads of the list
+-- functions return one page as a JSON array. The API only calls them when
+-- the client asks for `limit`. Unpaged requests keep calling the legacy
+-- functions.
+--
+-- The legacy schema is not part of this repository. The rows functions
+-- assume the tables the legacy functions read, with snake_case columns:
+--   - yj_order has platform_id, customer_id and state. Its rows are
+--     rendered by yj_customer_get_order / yj_platform_get_order, so they
+--     keep the legacy shape.
+--   - yj_filecoin_seal_cost_payment has platform_id, customer_id and order_id.
+--   - yj_filecoin_withdraw and yj_customer_independent_node_withdraw have
+--     platform_id, customer_id and state.
+--   - yj_filecoin_settlement has platform_id, customer_id and
+--     referrer_customer_id.
+--   - yj_filecoin_settlement_platform and yj_filecoin_storage have
+--     platform_id. The storage rows also have order_id.
+--   - yj_filecoin_customer_expense has customer_id and order_id.
+--   - yj_customer has platform_id and mobile.
+--   - yj_order_fiat_payment and yj_order_crypto_payment have platform_id
+--     and order_id.
+-- The other tables are rendered by yj_keyset_json: the row's columns in
+-- camelCase, with `id` as `Id`.
+--
+-- `filter_by` accepts 'all' and the filters listed in each function.
+-- Anything else raises an error instead of silently returning the
+-- unfiltered list.
+
+DROP FUNCTION IF EXISTS yj_keyset_page(json, integer, integer);
+
+
+CREATE OR REPLACE FUNCTION yj_keyset_json(in_row jsonb)
+RETURNS json AS $$
+    SELECT json_object_agg(
+               CASE WHEN e.key = 'id' THEN 'Id'
+                    ELSE (SELECT string_agg(CASE WHEN u.n = 1 THEN u.part ELSE initcap(u.part) END, '' ORDER BY u.n)
+                            FROM unnest(string_to_array(e.key, '_')) WITH ORDINALITY AS u(part, n))
+               END, e.value)
+      FROM jsonb_each(in_row) e;
+$$ LANGUAGE sql IMMUTABLE;
+
+
+-- `in_filter_by` if the list supports it, 'all' when it is empty
+CREATE OR REPLACE FUNCTION yj_keyset_filter(in_filter_by text, in_allowed text[])
+RETURNS text AS $$
+BEGIN
+    IF in_filter_by IS NULL OR in_filter_by = '' THEN
+        RETURN 'all';
+    END IF;
+    IF NOT (in_filter_by = ANY (in_allowed)) THEN
+        RAISE EXCEPTION '不支持的筛选条件: %', in_filter_by USING ERRCODE = '22023';
+    END IF;
+    RETURN in_filter_by;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- keyset indexes: the scope column, then id descending
+CREATE INDEX IF NOT EXISTS yj_order_customer_id_id_idx ON yj_order (customer_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_filecoin_seal_cost_payment_customer_id_id_idx ON yj_filecoin_seal_cost_payment (customer_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_filecoin_withdraw_customer_id_id_idx ON yj_filecoin_withdraw (customer_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_filecoin_settlement_customer_id_id_idx ON yj_filecoin_settlement (customer_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_filecoin_settlement_referrer_customer_id_id_idx ON yj_filecoin_settlement (referrer_customer_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_filecoin_customer_expense_customer_id_id_idx ON yj_filecoin_customer_expense (customer_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_customer_platform_id_id_idx ON yj_customer (platform_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_order_platform_id_id_idx ON yj_order (platform_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_filecoin_seal_cost_payment_platform_id_id_idx ON yj_filecoin_seal_cost_payment (platform_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_filecoin_withdraw_platform_id_id_idx ON yj_filecoin_withdraw (platform_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_filecoin_storage_platform_id_id_idx ON yj_filecoin_storage (platform_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_filecoin_settlement_platform_id_id_idx ON yj_filecoin_settlement (platform_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_filecoin_settlement_platform_platform_id_id_idx ON yj_filecoin_settlement_platform (platform_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_customer_id_desc_idx ON yj_customer (id DESC);
+CREATE INDEX IF NOT EXISTS yj_customer_independent_node_withdraw_id_desc_idx ON yj_customer_independent_node_withdraw (id DESC);
+CREATE INDEX IF NOT EXISTS yj_filecoin_customer_expense_id_desc_idx ON yj_filecoin_customer_expense (id DESC);
+CREATE INDEX IF NOT EXISTS yj_order_fiat_payment_platform_id_id_idx ON yj_order_fiat_payment (platform_id, id DESC);
+CREATE INDEX IF NOT EXISTS yj_order_crypto_payment_platform_id_id_idx ON yj_order_crypto_payment (platform_id, id DESC);
+
+
+CREATE OR REPLACE FUNCTION yj_customer_order_rows(in_customer_id integer, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, ((SELECT o.o_order::jsonb FROM yj_customer_get_order(t.id) o) || jsonb_build_object('Id', t.id))::json
+      FROM yj_order t
+     WHERE t.customer_id = in_customer_id
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_customer_fetch_order_list(in_customer_id integer, in_limit integer, in_after_id integer, OUT o_order_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_customer_order_rows(in_customer_id, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_customer_filecoin_seal_cost_payment_rows(in_customer_id integer, in_order_id integer, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_seal_cost_payment t
+     WHERE t.customer_id = in_customer_id
+       AND (in_order_id IS NULL OR t.order_id = in_order_id)
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_customer_fetch_filecoin_seal_cost_payment_list(in_customer_id integer, in_order_id integer, in_limit integer, in_after_id integer, OUT o_payment_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_customer_filecoin_seal_cost_payment_rows(in_customer_id, in_order_id, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_customer_filecoin_withdraw_rows(in_customer_id integer, in_state text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_withdraw t
+     WHERE t.customer_id = in_customer_id
+       AND (in_state IS NULL OR in_state = 'all' OR t.state = in_state)
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_customer_fetch_filecoin_withdraw_list(in_customer_id integer, in_state text, in_limit integer, in_after_id integer, OUT o_withdraw_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_customer_filecoin_withdraw_rows(in_customer_id, in_state, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_customer_filecoin_settlement_rows(in_customer_id integer, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_settlement t
+     WHERE t.customer_id = in_customer_id
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_filecoin_customer_settlement_fetch_list(in_customer_id integer, in_limit integer, in_after_id integer, OUT o_settlement_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_customer_filecoin_settlement_rows(in_customer_id, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_customer_filecoin_settlement_referrer_rows(in_customer_id integer, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_settlement t
+     WHERE t.referrer_customer_id = in_customer_id
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_filecoin_customer_settlement_fetch_referrer_list(in_customer_id integer, in_limit integer, in_after_id integer, OUT o_settlement_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_customer_filecoin_settlement_referrer_rows(in_customer_id, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_customer_filecoin_expense_rows(in_customer_id integer, in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_customer_expense t
+     WHERE t.customer_id = in_customer_id
+       AND CASE yj_keyset_filter(in_filter_by, '{all,order}')
+            WHEN 'all' THEN true
+            WHEN 'order' THEN t.order_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION get_customer_filcoin_expense_list(in_customer_id integer, in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_customer_expense_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_customer_filecoin_expense_rows(in_customer_id, in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_customer_rows(in_platform_id integer, in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_customer t
+     WHERE t.platform_id = in_platform_id
+       AND CASE yj_keyset_filter(in_filter_by, '{all,mobile}')
+            WHEN 'all' THEN true
+            WHEN 'mobile' THEN t.mobile = in_filter
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_fetch_customer_list(in_platform_id integer, in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_customer_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_platform_customer_rows(in_platform_id, in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_order_rows(in_platform_id integer, in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, ((SELECT o.o_order::jsonb FROM yj_platform_get_order(t.id) o) || jsonb_build_object('Id', t.id))::json
+      FROM yj_order t
+     WHERE t.platform_id = in_platform_id
+       AND CASE yj_keyset_filter(in_filter_by, '{all,state,customer}')
+            WHEN 'all' THEN true
+            WHEN 'state' THEN t.state = in_filter
+            WHEN 'customer' THEN t.customer_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_platform_fetch_order_list(in_platform_id integer, in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_order_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_platform_order_rows(in_platform_id, in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_filecoin_seal_cost_payment_rows(in_platform_id integer, in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_seal_cost_payment t
+     WHERE t.platform_id = in_platform_id
+       AND CASE yj_keyset_filter(in_filter_by, '{all,order,customer}')
+            WHEN 'all' THEN true
+            WHEN 'order' THEN t.order_id = nullif(in_filter, '')::integer
+            WHEN 'customer' THEN t.customer_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_platform_fetch_filecoin_seal_cost_payment_list(in_platform_id integer, in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_payment_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_platform_filecoin_seal_cost_payment_rows(in_platform_id, in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_filecoin_withdraw_rows(in_platform_id integer, in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_withdraw t
+     WHERE t.platform_id = in_platform_id
+       AND CASE yj_keyset_filter(in_filter_by, '{all,state,customer}')
+            WHEN 'all' THEN true
+            WHEN 'state' THEN t.state = in_filter
+            WHEN 'customer' THEN t.customer_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_platform_filecoin_withdraw_fetch_list(in_platform_id integer, in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_withdraw_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_platform_filecoin_withdraw_rows(in_platform_id, in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_filecoin_storage_rows(in_platform_id integer, in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_storage t
+     WHERE t.platform_id = in_platform_id
+       AND CASE yj_keyset_filter(in_filter_by, '{all,order}')
+            WHEN 'all' THEN true
+            WHEN 'order' THEN t.order_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_platform_filecoin_storage_fetch_list(in_platform_id integer, in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_storage_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_platform_filecoin_storage_rows(in_platform_id, in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_filecoin_settlement_rows(in_platform_id integer, in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_settlement t
+     WHERE t.platform_id = in_platform_id
+       AND CASE yj_keyset_filter(in_filter_by, '{all,customer}')
+            WHEN 'all' THEN true
+            WHEN 'customer' THEN t.customer_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_filecoin_settlement_fetch_list(in_platform_id integer, in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_settlement_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_platform_filecoin_settlement_rows(in_platform_id, in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_filecoin_settlement_platform_rows(in_platform_id integer, in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_settlement_platform t
+     WHERE t.platform_id = in_platform_id
+       AND CASE yj_keyset_filter(in_filter_by, '{all}')
+            WHEN 'all' THEN true
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_filecoin_settlement_platform_fetch_list(in_platform_id integer, in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_settlement_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_platform_filecoin_settlement_platform_rows(in_platform_id, in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_filecoin_settlement_referrer_rows(in_platform_id integer, in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_settlement t
+     WHERE t.platform_id = in_platform_id AND t.referrer_customer_id IS NOT NULL
+       AND CASE yj_keyset_filter(in_filter_by, '{all,customer}')
+            WHEN 'all' THEN true
+            WHEN 'customer' THEN t.referrer_customer_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_filecoin_settlement_referrere_fetch_list(in_platform_id integer, in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_settlement_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_platform_filecoin_settlement_referrer_rows(in_platform_id, in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_owner_customer_rows(in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_customer t
+     WHERE CASE yj_keyset_filter(in_filter_by, '{all,mobile,platform}')
+            WHEN 'all' THEN true
+            WHEN 'mobile' THEN t.mobile = in_filter
+            WHEN 'platform' THEN t.platform_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_fetch_owner_get_customer_list(in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_owner_customer_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_owner_customer_rows(in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_owner_customer_independent_node_withdraw_rows(in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_customer_independent_node_withdraw t
+     WHERE CASE yj_keyset_filter(in_filter_by, '{all,state,customer}')
+            WHEN 'all' THEN true
+            WHEN 'state' THEN t.state = in_filter
+            WHEN 'customer' THEN t.customer_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_fetch_owner_customer_independent_node_withdraw_list(in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_customer_node_withdraw_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_owner_customer_independent_node_withdraw_rows(in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_owner_filecoin_customer_expense_rows(in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_filecoin_customer_expense t
+     WHERE CASE yj_keyset_filter(in_filter_by, '{all,customer}')
+            WHEN 'all' THEN true
+            WHEN 'customer' THEN t.customer_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_owner_filecoin_customer_expenses_list(in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_owner_filecoin_customer_expenses_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_owner_filecoin_customer_expense_rows(in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_order_fiat_payment_rows(in_platform_id integer, in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_order_fiat_payment t
+     WHERE t.platform_id = in_platform_id
+       AND CASE yj_keyset_filter(in_filter_by, '{all,order}')
+            WHEN 'all' THEN true
+            WHEN 'order' THEN t.order_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_order_fiat_payment_fetch_list(in_platform_id integer, in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_payment_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_platform_order_fiat_payment_rows(in_platform_id, in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_order_crypto_payment_rows(in_platform_id integer, in_filter_by text, in_filter text, in_after_id integer)
+RETURNS TABLE (o_id bigint, o_row json) AS $$
+    SELECT t.id::bigint, (yj_keyset_json(to_jsonb(t)))::json
+      FROM yj_order_crypto_payment t
+     WHERE t.platform_id = in_platform_id
+       AND CASE yj_keyset_filter(in_filter_by, '{all,order}')
+            WHEN 'all' THEN true
+            WHEN 'order' THEN t.order_id = nullif(in_filter, '')::integer
+            END
+       AND (in_after_id IS NULL OR t.id < in_after_id)
+     ORDER BY t.id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION yj_order_crypto_payment_fetch_list(in_platform_id integer, in_filter_by text, in_filter text, in_limit integer, in_after_id integer, OUT o_payment_list json) AS $$
+    SELECT coalesce(json_agg(p.o_row ORDER BY p.o_id DESC), '[]'::json)
+      FROM (SELECT * FROM yj_platform_order_crypto_payment_rows(in_platform_id, in_filter_by, in_filter, in_after_id) LIMIT in_limit) p;
+$$ LANGUAGE sql STABLE;
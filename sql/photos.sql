@@ -0,0 +1,45 @@
+-- Platform-scoped photo and album access for mining/handlers/platform.py.
+--
+-- The legacy functions look photos and albums up by id alone, and what they
+-- return does not reliably name its platform: yj_fetch_album_photos returns
+-- the photos of an album as a JSON list. These wrappers therefore check the
+-- platform against the base tables the legacy functions read from, assumed
+-- to be yj_photo(id, platform_id) and yj_album(id, platform_id), and pass
+-- the legacy result through unchanged. A photo or album of another platform
+-- is reported like an unknown id.
+
+CREATE OR REPLACE FUNCTION yj_platform_get_photo(in_platform_id integer, in_id integer)
+RETURNS json AS $$
+    SELECT p.o_photo::json
+      FROM yj_photo t
+     CROSS JOIN LATERAL yj_get_photo(t.id) p
+     WHERE t.id = in_id
+       AND t.platform_id = in_platform_id;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_fetch_album_photos(in_platform_id integer, in_id integer)
+RETURNS json AS $$
+    SELECT coalesce(a.o_album::json, '[]'::json)
+      FROM yj_album t
+     CROSS JOIN LATERAL yj_fetch_album_photos(t.id) a
+     WHERE t.id = in_id
+       AND t.platform_id = in_platform_id;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_platform_remove_photo(in_platform_id integer, in_id integer)
+RETURNS boolean AS $$
+BEGIN
+    PERFORM 1
+       FROM yj_photo
+      WHERE id = in_id
+        AND platform_id = in_platform_id
+        FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN false;
+    END IF;
+    PERFORM yj_remove_photo(in_id);
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,46 @@
+-- Batched purchases for mining/purchases.py.
+--
+-- The API reserves stock in memory per product and sends the reservations
+-- of one product here together, so the product row lock taken by
+-- yj_customer_product_purchase is acquired by one transaction for a whole
+-- batch instead of once per buyer. Every purchase runs in its own
+-- subtransaction: a failing one returns -1 and leaves the others intact.
+-- The created order is returned alongside, saving the follow-up lookup.
+
+CREATE OR REPLACE FUNCTION yj_customer_product_purchase_batch(in_product_id integer, in_purchases json)
+RETURNS TABLE(o_position integer, o_order_id integer, o_order json) AS $$
+DECLARE
+    v_item record;
+BEGIN
+    FOR v_item IN
+        SELECT t.position::integer AS position, t.item
+          FROM json_array_elements(in_purchases) WITH ORDINALITY AS t(item, position)
+         ORDER BY t.position
+    LOOP
+        o_position := v_item.position;
+        o_order := NULL;
+        BEGIN
+            o_order_id := yj_customer_product_purchase(in_product_id,
+                                                       (v_item.item->>'customerId')::integer,
+                                                       (v_item.item->>'qty')::integer,
+                                                       v_item.item->>'comment');
+        EXCEPTION WHEN others THEN
+            RAISE WARNING 'purchase of product % by customer % failed: %', in_product_id, v_item.item->>'customerId', SQLERRM;
+            o_order_id := -1;
+        END;
+        IF o_order_id > 0 THEN
+            SELECT g.o_order INTO o_order FROM yj_customer_get_order(o_order_id) g;
+        END IF;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Stock left for sale, read from the column yj_customer_product_purchase
+-- decrements (assumed to be yj_product.stock_qty) rather than from the JSON
+-- rendering of the product. NULL for an unknown product.
+CREATE OR REPLACE FUNCTION yj_product_available_qty(in_product_id integer)
+RETURNS integer AS $$
+    SELECT p.stock_qty FROM yj_product p WHERE p.id = in_product_id;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,74 @@
+-- Bulk sealed storage ingestion, see `Platform.ingest_sealed_storage` in
+-- mining/db.py.
+--
+-- The API validates the uploaded rows while streaming them into the
+-- session's temporary table yj_staging_sealed_storage (line, order_id,
+-- storage), then calls this function in the same transaction. Deltas are
+-- summed per order, so an order reported several times is applied once.
+--
+-- The whole import is set-based. The orders it touches are locked in one
+-- statement, in id order. One join of the staging table against yj_order
+-- then finds the lines to reject, each reported with the first line its
+-- order appeared on:
+--   - the order is unknown or belongs to another platform (joined on
+--     yj_order.platform_id, so nothing is trusted from the order JSON);
+--   - the delta would take the sealed storage of the order below zero.
+-- The remaining orders are applied with one UPDATE ... FROM and one
+-- INSERT ... SELECT. Those two statements write what
+-- yj_filecoin_storage_add_sealed_storage writes for a single order, which
+-- the single order endpoint still calls. The legacy schema is not in this
+-- repository. As in sql/pagination.sql, this assumes the running total is
+-- yj_order.sealed_storage and that each addition is a yj_filecoin_storage
+-- (platform_id, order_id, storage) row.
+
+CREATE OR REPLACE FUNCTION yj_filecoin_storage_apply_sealed_staging(in_platform_id integer)
+RETURNS json AS $$
+DECLARE
+    v_summary json;
+BEGIN
+    PERFORM 1
+       FROM yj_order o
+      WHERE o.platform_id = in_platform_id
+        AND o.id IN (SELECT s.order_id FROM yj_staging_sealed_storage s)
+      ORDER BY o.id
+        FOR UPDATE;
+
+    WITH deltas AS (
+        SELECT s.order_id, sum(s.storage) AS storage, min(s.line) AS line
+          FROM yj_staging_sealed_storage s
+         GROUP BY s.order_id
+    ), checked AS (
+        SELECT d.order_id, d.storage, d.line,
+               CASE WHEN o.id IS NULL THEN '订单未找到'
+                    WHEN coalesce(o.sealed_storage, 0) + d.storage < 0 THEN '封装量不能小于 0'
+               END AS reason
+          FROM deltas d
+          LEFT JOIN yj_order o ON o.id = d.order_id AND o.platform_id = in_platform_id
+    ), updated AS (
+        UPDATE yj_order o
+           SET sealed_storage = coalesce(o.sealed_storage, 0) + c.storage
+          FROM checked c
+         WHERE o.id = c.order_id
+           AND c.reason IS NULL
+           AND c.storage <> 0
+        RETURNING o.id
+    ), inserted AS (
+        INSERT INTO yj_filecoin_storage (platform_id, order_id, storage)
+        SELECT in_platform_id, c.order_id, c.storage
+          FROM checked c
+         WHERE c.reason IS NULL
+           AND c.storage <> 0
+        RETURNING order_id
+    )
+    SELECT json_build_object(
+               'orders', count(*),
+               'applied', count(*) FILTER (WHERE c.reason IS NULL AND c.storage <> 0),
+               'storage', coalesce(sum(c.storage) FILTER (WHERE c.reason IS NULL), 0),
+               'errors', coalesce(json_agg(json_build_object('line', c.line, 'orderId', c.order_id, 'reason', c.reason) ORDER BY c.line)
+                                  FILTER (WHERE c.reason IS NOT NULL), '[]'::json))
+      INTO v_summary
+      FROM checked c;
+
+    RETURN v_summary;
+END;
+$$ LANGUAGE plpgsql;
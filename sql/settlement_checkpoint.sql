@@ -0,0 +1,101 @@
+-- Progress of the daily settlements, one row per platform and day. Every
+-- settlement of a day, from mining/settlement.py or from the manual admin
+-- endpoints, goes through yj_settlement_checkpoint_settle, which creates the
+-- settlement and marks the row `done` in the same transaction. A day is
+-- therefore settled at most once: a retry after a lost response, a second
+-- worker or a manual run finds the `done` row and gets its settlement back.
+-- `failed` rows only record the last error; the next run tries again.
+
+CREATE TABLE IF NOT EXISTS yj_settlement_checkpoint (
+    platform_id   integer     NOT NULL,
+    settle_day    date        NOT NULL,
+    status        text        NOT NULL CHECK (status IN ('running', 'done', 'failed')),
+    owner         text,
+    attempts      integer     NOT NULL DEFAULT 0,
+    settlement_no text,
+    duration      double precision,
+    last_error    text,
+    started_at    timestamptz NOT NULL DEFAULT now(),
+    finished_at   timestamptz,
+    PRIMARY KEY (settle_day, platform_id)
+);
+
+DROP FUNCTION IF EXISTS yj_settlement_checkpoint_claim(integer, date, text, integer);
+DROP FUNCTION IF EXISTS yj_settlement_checkpoint_finish(integer, date, text, text, integer, text, double precision, text);
+
+
+CREATE OR REPLACE FUNCTION yj_settlement_checkpoint_settle(in_platform_id integer, in_settle_day date, in_mining_efficiency integer,
+                                                           in_comment text, in_owner text,
+                                                           OUT o_settlement_no text, OUT o_created boolean) AS $$
+DECLARE
+    v_checkpoint yj_settlement_checkpoint%ROWTYPE;
+    v_started timestamptz := clock_timestamp();
+BEGIN
+    -- a concurrent settlement of the same day waits here for the first one
+    -- to commit and then sees its `done` row
+    INSERT INTO yj_settlement_checkpoint (platform_id, settle_day, status, owner)
+    VALUES (in_platform_id, in_settle_day, 'running', in_owner)
+    ON CONFLICT (settle_day, platform_id) DO NOTHING;
+
+    SELECT * INTO v_checkpoint
+      FROM yj_settlement_checkpoint
+     WHERE platform_id = in_platform_id AND settle_day = in_settle_day
+       FOR UPDATE;
+
+    IF v_checkpoint.status = 'done' THEN
+        o_settlement_no := v_checkpoint.settlement_no;
+        o_created := false;
+        RETURN;
+    END IF;
+
+    SELECT c.o_settlement_no INTO o_settlement_no
+      FROM yj_customer_filecoin_settlement_day_create(in_platform_id, in_settle_day, in_mining_efficiency, in_comment) c;
+    o_created := true;
+
+    UPDATE yj_settlement_checkpoint
+       SET status = 'done',
+           owner = in_owner,
+           attempts = attempts + 1,
+           settlement_no = o_settlement_no,
+           duration = extract(epoch FROM clock_timestamp() - v_started),
+           last_error = NULL,
+           started_at = v_started,
+           finished_at = clock_timestamp()
+     WHERE platform_id = in_platform_id AND settle_day = in_settle_day;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Records a settlement that failed after its retries; a `done` row is kept.
+CREATE OR REPLACE FUNCTION yj_settlement_checkpoint_fail(in_platform_id integer, in_settle_day date, in_owner text,
+                                                         in_attempts integer, in_duration double precision, in_error text)
+RETURNS void AS $$
+    INSERT INTO yj_settlement_checkpoint (platform_id, settle_day, status, owner, attempts, duration, last_error, finished_at)
+    VALUES (in_platform_id, in_settle_day, 'failed', in_owner, in_attempts, in_duration, in_error, now())
+    ON CONFLICT (settle_day, platform_id) DO UPDATE
+       SET status = 'failed',
+           owner = in_owner,
+           attempts = yj_settlement_checkpoint.attempts + in_attempts,
+           duration = in_duration,
+           last_error = in_error,
+           finished_at = now()
+     WHERE yj_settlement_checkpoint.status <> 'done';
+$$ LANGUAGE sql;
+
+
+CREATE OR REPLACE FUNCTION yj_settlement_checkpoint_fetch_list(in_settle_day date)
+RETURNS json AS $$
+    SELECT coalesce(json_agg(json_build_object(
+               'platformId', platform_id,
+               'status', status,
+               'owner', owner,
+               'attempts', attempts,
+               'settlementNo', settlement_no,
+               'duration', duration,
+               'lastError', last_error,
+               'startedAt', started_at,
+               'finishedAt', finished_at
+           ) ORDER BY platform_id), '[]'::json)
+      FROM yj_settlement_checkpoint
+     WHERE settle_day = in_settle_day;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,131 @@
+-- Materialized revenue statistics behind `Database.Statistics`.
+--
+-- Each row holds the result of one of the existing aggregate functions for
+-- one key, so a dashboard read is a primary key lookup:
+--
+--   customer_revenue  key = customer id  yj_customer_filecoin_revenue_statitics
+--   platform          key = platform id  yj_platform_filecoin_statitics
+--   owner             key = 0            yj_owner_platform_filecoin_statitics
+--
+-- Mutations call yj_statistics_touch, which only marks the rows they affect
+-- stale: the platform row (every platform row when the platform is not
+-- known), the owner row and the customer rows involved. A stale row is
+-- recomputed by its next read, so a burst of mutations costs one
+-- aggregation per row instead of one per mutation. The aggregates
+-- themselves live in the legacy functions above and are not incremental;
+-- a row is always recomputed whole.
+--
+-- Rows older than the max age passed to yj_statistics_get are recomputed
+-- as well, which bounds the staleness left by mutations that never touch,
+-- such as fixes made directly in PostgreSQL. `yj_statistics_rebuild`
+-- recomputes everything for reconciliation.
+
+CREATE TABLE IF NOT EXISTS yj_statistics_snapshot (
+    kind         text        NOT NULL CHECK (kind IN ('customer_revenue', 'platform', 'owner')),
+    key          integer     NOT NULL,
+    platform_id  integer,
+    data         json,
+    refreshed_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (kind, key)
+);
+
+ALTER TABLE yj_statistics_snapshot ADD COLUMN IF NOT EXISTS stale boolean NOT NULL DEFAULT false;
+
+CREATE INDEX IF NOT EXISTS yj_statistics_snapshot_platform_idx ON yj_statistics_snapshot (platform_id) WHERE kind = 'customer_revenue';
+
+
+CREATE OR REPLACE FUNCTION yj_statistics_compute(in_kind text, in_key integer)
+RETURNS json AS $$
+BEGIN
+    CASE in_kind
+        WHEN 'customer_revenue' THEN
+            RETURN (SELECT o_revenue_statitics::json FROM yj_customer_filecoin_revenue_statitics(in_key));
+        WHEN 'platform' THEN
+            RETURN (SELECT o_statitics::json FROM yj_platform_filecoin_statitics(in_key));
+        WHEN 'owner' THEN
+            RETURN (SELECT o_statitics::json FROM yj_owner_platform_filecoin_statitics());
+    END CASE;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+
+CREATE OR REPLACE FUNCTION yj_statistics_refresh(in_kind text, in_key integer, in_platform_id integer DEFAULT NULL)
+RETURNS json AS $$
+DECLARE
+    v_data json;
+BEGIN
+    v_data := yj_statistics_compute(in_kind, in_key);
+    INSERT INTO yj_statistics_snapshot (kind, key, platform_id, data, refreshed_at)
+    VALUES (in_kind, in_key, in_platform_id, v_data, now())
+    ON CONFLICT (kind, key) DO UPDATE
+       SET data = EXCLUDED.data,
+           platform_id = coalesce(EXCLUDED.platform_id, yj_statistics_snapshot.platform_id),
+           refreshed_at = EXCLUDED.refreshed_at,
+           stale = false;
+    RETURN v_data;
+END;
+$$ LANGUAGE plpgsql;
+
+
+DROP FUNCTION IF EXISTS yj_statistics_get(text, integer, integer);
+
+CREATE OR REPLACE FUNCTION yj_statistics_get(in_kind text, in_key integer, in_platform_id integer DEFAULT NULL, in_max_age integer DEFAULT NULL)
+RETURNS json AS $$
+DECLARE
+    v_data json;
+BEGIN
+    SELECT data INTO v_data
+      FROM yj_statistics_snapshot
+     WHERE kind = in_kind AND key = in_key AND NOT stale
+       AND (in_max_age IS NULL OR refreshed_at > now() - make_interval(secs => in_max_age));
+    IF FOUND THEN
+        RETURN v_data;
+    END IF;
+    RETURN yj_statistics_refresh(in_kind, in_key, in_platform_id);
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- called after a mutation of platform `in_platform_id` and/or customer
+-- `in_customer_id`; either may be NULL when the caller does not know it
+CREATE OR REPLACE FUNCTION yj_statistics_touch(in_platform_id integer, in_customer_id integer)
+RETURNS void AS $$
+BEGIN
+    IF in_customer_id IS NOT NULL THEN
+        SELECT coalesce(in_platform_id, platform_id) INTO in_platform_id
+          FROM yj_statistics_snapshot WHERE kind = 'customer_revenue' AND key = in_customer_id;
+        UPDATE yj_statistics_snapshot SET stale = true
+         WHERE kind = 'customer_revenue' AND key = in_customer_id AND NOT stale;
+    ELSIF in_platform_id IS NOT NULL THEN
+        UPDATE yj_statistics_snapshot SET stale = true
+         WHERE kind = 'customer_revenue' AND platform_id = in_platform_id AND NOT stale;
+    END IF;
+
+    IF in_platform_id IS NOT NULL THEN
+        UPDATE yj_statistics_snapshot SET stale = true
+         WHERE kind = 'platform' AND key = in_platform_id AND NOT stale;
+    ELSE
+        UPDATE yj_statistics_snapshot SET stale = true
+         WHERE kind = 'platform' AND NOT stale;
+    END IF;
+
+    UPDATE yj_statistics_snapshot SET stale = true
+     WHERE kind = 'owner' AND NOT stale;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION yj_statistics_rebuild()
+RETURNS integer AS $$
+DECLARE
+    v_rows integer;
+BEGIN
+    -- customer rows are refilled on demand
+    DELETE FROM yj_statistics_snapshot WHERE kind IN ('customer_revenue', 'platform');
+    PERFORM yj_statistics_refresh('platform', (p->>'Id')::integer, (p->>'Id')::integer)
+       FROM json_array_elements((SELECT o_platform_list::json FROM yj_platform_fetch_list())) p;
+    PERFORM yj_statistics_refresh('owner', 0);
+    SELECT count(*) INTO v_rows FROM yj_statistics_snapshot;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,32 @@
+from mining.blobs import blob_ref, blob_url, with_albums_urls
+
+DIGEST = 'ab' * 32
+
+
+def test_list_shaped_albums_get_photo_urls():
+    # yj_fetch_album_photos returns the photos of an album as a plain list
+    albums = [
+        {'Id': 7, 'album': [{'Id': 1, 'photo': blob_ref(DIGEST), 'width': 640}, {'Id': 2, 'photo': 'legacy-base64'}]},
+        {'Id': 3, 'album': []},
+    ]
+
+    shaped = with_albums_urls(albums)
+
+    assert [album['Id'] for album in shaped] == [7, 3]
+    first, second = shaped[0]['album']
+    assert first['url'] == blob_url(DIGEST)
+    assert 'photo' not in first and first['width'] == 640
+    assert first['variants']
+    assert second == {'Id': 2, 'photo': 'legacy-base64'}
+    assert shaped[1]['album'] == []
+    # the rows handed in are left as they were
+    assert albums[0]['album'][0]['photo'] == blob_ref(DIGEST)
+
+
+def test_dict_shaped_album_keeps_its_fields():
+    albums = [{'Id': 5, 'album': {'title': 'cover', 'photos': [{'Id': 9, 'photo': blob_ref(DIGEST)}]}}]
+
+    shaped = with_albums_urls(albums)
+
+    assert shaped[0]['album']['title'] == 'cover'
+    assert shaped[0]['album']['photos'][0]['url'] == blob_url(DIGEST)
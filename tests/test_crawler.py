@@ -0,0 +1,192 @@
+import asyncio
+import json
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from mining.crawler import CircuitBreaker, CircuitOpen, Crawler
+
+FILSCAN_DATA = {
+    'total_quality_power': '18446744073709551616',
+    'power_increase_24h': '1125899906842624',
+    'fil_per_tera': '0.005',
+    'pledge_per_tera': '0.2',
+    'gas_in_32g': '0.000001',
+    'gas_in_64g': '0.000002',
+    'add_power_in_32g': '0.3',
+    'add_power_in_64g': '0.31',
+}
+
+
+class FakeSources:
+    """Local stand-ins for filscan and coingecko.
+
+    `filscan` and `coingecko` hold the queued behaviours of the next calls:
+    a dict is answered as JSON, an int as that HTTP status, a float sleeps
+    that long first. Once the queue is empty the last behaviour repeats.
+    """
+
+    def __init__(self):
+        self.filscan = [{'result': {'data': FILSCAN_DATA}}]
+        self.coingecko = [{'binance-peg-filecoin': {'usd': 5.12}}]
+        self.calls = {'filscan': 0, 'coingecko': 0}
+
+    async def _answer(self, name: str) -> web.Response:
+        self.calls[name] += 1
+        queue = getattr(self, name)
+        behaviour = queue.pop(0) if len(queue) > 1 else queue[0]
+        if isinstance(behaviour, float):
+            await asyncio.sleep(behaviour)
+            behaviour = {'result': {'data': FILSCAN_DATA}} if name == 'filscan' else {'binance-peg-filecoin': {'usd': 5.12}}
+        if isinstance(behaviour, int):
+            return web.Response(status=behaviour)
+        return web.Response(text=json.dumps(behaviour), content_type='application/json')
+
+    async def handle_filscan(self, request: web.Request) -> web.Response:
+        return await self._answer('filscan')
+
+    async def handle_coingecko(self, request: web.Request) -> web.Response:
+        return await self._answer('coingecko')
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/rpc/v1', self.handle_filscan)
+        app.router.add_get('/simple/price', self.handle_coingecko)
+        return app
+
+
+async def _crawler(server: TestServer, **config) -> Crawler:
+    crawler = Crawler(dict({
+        'filscan_url': str(server.make_url('/rpc/v1')),
+        'coingecko_url': str(server.make_url('/simple/price')),
+        'timeout': 1,
+        'retries': 1,
+        'backoff': 0.01,
+        'breaker_threshold': 2,
+        'breaker_reset': 60,
+    }, **config))
+    await crawler.start()
+    return crawler
+
+
+def run_with_sources(test):
+    async def main():
+        sources = FakeSources()
+        server = TestServer(sources.app())
+        await server.start_server()
+        try:
+            await test(sources, server)
+        finally:
+            await server.close()
+
+    asyncio.run(main())
+
+
+def test_crawl_merges_sources():
+    async def test(sources, server):
+        crawler = await _crawler(server)
+        try:
+            sample = await crawler.crawl()
+        finally:
+            await crawler.close()
+        assert sample['total_quality_power'] == 2 ** 64
+        assert sample['fil_per_tera'] == 5 * 10 ** 15
+        assert str(sample['fil_price_usd']) == '5.12'
+
+    run_with_sources(test)
+
+
+def test_crawl_retries_a_failed_call():
+    async def test(sources, server):
+        sources.filscan.insert(0, 502)
+        crawler = await _crawler(server)
+        try:
+            sample = await crawler.crawl()
+        finally:
+            await crawler.close()
+        assert sources.calls['filscan'] == 2
+        assert sample['total_quality_power'] == 2 ** 64
+        assert crawler.stats()['filscan']['state'] == 'closed'
+
+    run_with_sources(test)
+
+
+def test_crawl_keeps_last_good_values_of_a_failing_source():
+    async def test(sources, server):
+        crawler = await _crawler(server)
+        try:
+            await crawler.crawl()
+            sources.coingecko = [500]
+            sample = await crawler.crawl()
+        finally:
+            await crawler.close()
+        assert 'fil_price_usd' not in crawler.fresh
+        assert str(sample['fil_price_usd']) == '5.12'
+        assert crawler.stats()['coingecko']['lastError']
+
+    run_with_sources(test)
+
+
+def test_crawl_times_out_a_hanging_source():
+    async def test(sources, server):
+        sources.coingecko = [2.0]
+        crawler = await _crawler(server, timeout=0.2, retries=0)
+        try:
+            sample = await crawler.crawl()
+        finally:
+            await crawler.close()
+        assert 'fil_price_usd' not in sample
+        assert sample['total_quality_power'] == 2 ** 64
+
+    run_with_sources(test)
+
+
+def test_crawl_skips_a_source_with_an_open_circuit():
+    async def test(sources, server):
+        sources.filscan = [503]
+        crawler = await _crawler(server, retries=0)
+        try:
+            await crawler.crawl()
+            await crawler.crawl()
+            calls = sources.calls['filscan']
+            await crawler.crawl()
+        finally:
+            await crawler.close()
+        assert calls == 2
+        assert sources.calls['filscan'] == 2
+        assert crawler.stats()['filscan']['state'] == 'open'
+
+    run_with_sources(test)
+
+
+def test_half_open_breaker_admits_one_trial_call():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.failure()
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+def test_half_open_source_sends_one_trial_request():
+    async def test(sources, server):
+        sources.filscan = [0.2]
+        crawler = await _crawler(server, retries=0)
+        filscan = crawler.sources[0]
+        filscan.breaker.failures = filscan.breaker.threshold
+        filscan.breaker.opened_at = time.monotonic() - filscan.breaker.reset_timeout
+        try:
+            results = await asyncio.gather(*(filscan.run(crawler.session) for _ in range(3)), return_exceptions=True)
+        finally:
+            await crawler.close()
+        assert sources.calls['filscan'] == 1
+        assert sum(isinstance(result, CircuitOpen) for result in results) == 2
+        assert filscan.breaker.state == 'closed'
+
+    run_with_sources(test)
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from mining.idempotency import IdempotencyStore
+
+
+class StubDatabase:
+    """In-memory stand-in for the yj_idempotency_* functions.
+
+    Pending rows are reported as `unknown` once `lapsed` is set, as if the
+    lease had passed.
+    """
+
+    def __init__(self, fail_finish=False, fail_abandon=False):
+        self.rows = {}
+        self.released = []
+        self.fail_finish = fail_finish
+        self.fail_abandon = fail_abandon
+        self.lapsed = False
+
+    async def begin_idempotency_key(self, key, fingerprint, ttl, lease):
+        row = self.rows.get(key)
+        if row is None:
+            self.rows[key] = {'o_fingerprint': fingerprint, 'o_state': 'pending'}
+            return {'o_claimed': True}
+        if row['o_state'] == 'pending' and self.lapsed:
+            return dict(row, o_state='unknown', o_claimed=False)
+        return dict(row, o_claimed=False)
+
+    async def finish_idempotency_key(self, key, status, content_type, body):
+        if self.fail_finish:
+            raise ConnectionError('connection lost')
+        self.rows[key].update(o_state='done', o_status=status, o_content_type=content_type, o_body=body)
+
+    async def abandon_idempotency_key(self, key):
+        if self.fail_abandon:
+            raise ConnectionError('connection lost')
+        if self.rows[key]['o_state'] == 'pending':
+            self.rows[key]['o_state'] = 'unknown'
+
+    async def release_idempotency_key(self, key):
+        self.released.append(key)
+        self.rows.pop(key, None)
+
+
+def test_response_is_stored_and_replayed():
+    async def main():
+        db = StubDatabase()
+        store = IdempotencyStore(db)
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            return web.json_response({'Id': len(calls)})
+
+        first = await store.run('k', 'f', handler)
+        # another worker only sees the database row
+        again = await IdempotencyStore(db).run('k', 'f', handler)
+        assert calls == [1]
+        assert again.body == first.body
+        assert again.headers['Idempotent-Replayed'] == 'true'
+
+    asyncio.run(main())
+
+
+def test_rejected_request_releases_the_key():
+    async def main():
+        db = StubDatabase()
+        store = IdempotencyStore(db)
+
+        async def handler():
+            raise web.HTTPBadRequest(reason='sold out')
+
+        with pytest.raises(web.HTTPBadRequest):
+            await store.run('k', 'f', handler)
+        assert db.released == ['k']
+
+    asyncio.run(main())
+
+
+def test_failure_after_the_side_effect_keeps_the_key():
+    async def main():
+        db = StubDatabase()
+        store = IdempotencyStore(db)
+
+        async def handler():
+            raise ConnectionError('lost after commit')
+
+        with pytest.raises(ConnectionError):
+            await store.run('k', 'f', handler)
+        assert db.released == []
+        with pytest.raises(web.HTTPConflict):
+            await IdempotencyStore(db).run('k', 'f', handler)
+
+    asyncio.run(main())
+
+
+def test_failed_finish_keeps_the_claim_and_answers_unknown():
+    async def main():
+        db = StubDatabase(fail_finish=True)
+        store = IdempotencyStore(db)
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            return web.json_response({'Id': 1})
+
+        first = await store.run('k', 'f', handler)
+        assert first.status == 200
+        for retry in (store, IdempotencyStore(db)):
+            with pytest.raises(web.HTTPConflict, match='未知'):
+                await retry.run('k', 'f', handler)
+        assert calls == [1]
+        assert db.released == []
+
+    asyncio.run(main())
+
+
+def test_unrecorded_claim_turns_unknown_after_the_lease():
+    async def main():
+        db = StubDatabase(fail_finish=True, fail_abandon=True)
+        store = IdempotencyStore(db)
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            return web.json_response({'Id': 1})
+
+        await store.run('k', 'f', handler)
+        with pytest.raises(web.HTTPConflict, match='处理中'):
+            await store.run('k', 'f', handler)
+        db.lapsed = True
+        with pytest.raises(web.HTTPConflict, match='未知'):
+            await store.run('k', 'f', handler)
+        assert calls == [1]
+
+    asyncio.run(main())
+
+
+def test_unreplayable_response_is_marked_unknown():
+    async def main():
+        db = StubDatabase()
+        store = IdempotencyStore(db)
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            return web.StreamResponse()
+
+        await store.run('k', 'f', handler)
+        assert db.rows['k']['o_state'] == 'unknown'
+        with pytest.raises(web.HTTPConflict, match='未知'):
+            await IdempotencyStore(db).run('k', 'f', handler)
+        assert calls == [1]
+
+    asyncio.run(main())
@@ -0,0 +1,33 @@
+import pytest
+
+from mining.orders import ORDER_TRANSITIONS, summarize, transition_args
+
+
+def test_every_transition_takes_the_order_id():
+    for action, transition in ORDER_TRANSITIONS.items():
+        assert transition.action == action
+        assert transition.function.startswith('yj_')
+        assert transition.args.count('Id') == 1
+
+
+def test_stop_is_reachable_by_the_owner_only():
+    stop = ORDER_TRANSITIONS['stop']
+    assert stop.function == 'yj_stop_order'
+    assert stop.owner_only
+    assert not any(t.owner_only for action, t in ORDER_TRANSITIONS.items() if action != 'stop')
+
+
+def test_transition_args_place_the_order_id():
+    assert transition_args(ORDER_TRANSITIONS['finish'], 7, {'fewDays': None}) == ([None], 1)
+    assert transition_args(ORDER_TRANSITIONS['stop'], 7, {'fewDays': 3}) == ([7, None, 3], 2)
+
+
+def test_transition_args_require_request_fields():
+    with pytest.raises(KeyError, match='fewDays'):
+        transition_args(ORDER_TRANSITIONS['stop'], 7, {'fewDays': None})
+
+
+def test_summarize_counts_results():
+    results = [{'Id': 1, 'ok': True}, {'Id': 2, 'ok': False}, {'Id': 3, 'ok': True}]
+    assert summarize(results) == {'ok': 2, 'failed': 1}
+    assert summarize([]) == {'ok': 0, 'failed': 0}
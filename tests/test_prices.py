@@ -0,0 +1,147 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from mining.prices import MAX_QUOTE_AGE, PriceIndex
+
+
+class StubHistory:
+    """In-memory stand-in for the yj_*currency_price* functions."""
+
+    def __init__(self):
+        self.rows = []
+
+    async def add_currency_price(self, base, counter, price, source, quoted_at):
+        self.rows.append({'base': base, 'counter': counter, 'price': price, 'source': source, 'quotedAt': quoted_at})
+
+    async def get_latest_currency_prices(self):
+        latest = {}
+        for row in self.rows:
+            latest[(row['base'], row['counter'])] = row
+        return [dict(row, price=str(row['price']), quotedAt=row['quotedAt'].timestamp()) for row in latest.values()]
+
+    async def get_currency_price_at(self, base, counter, at):
+        rows = [row for row in self.rows if (row['base'], row['counter']) == (base, counter) and row['quotedAt'] <= at]
+        return max(rows, key=lambda row: row['quotedAt'])['price'] if rows else None
+
+
+class StubFeed:
+    """Pushes scripted quotes into the index the way the crawler job does."""
+
+    def __init__(self, index: PriceIndex, source: str = 'stub'):
+        self.index = index
+        self.source = source
+
+    async def push(self, base: str, counter: str, price: str, age: float = 0):
+        await self.index.update(base, counter, Decimal(price), self.source, time.time() - age)
+
+
+class StubBus:
+    def __init__(self):
+        self.published = []
+        self.subscribers = {}
+
+    def subscribe(self, channel, callback):
+        self.subscribers[channel] = callback
+
+    def on_resync(self, callback):
+        pass
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+def test_direct_inverse_and_cross_quotes():
+    async def main():
+        index = PriceIndex(StubHistory())
+        feed = StubFeed(index)
+        await feed.push('FIL', 'USD', '5.12')
+        await feed.push('USD', 'CNY', '7.25')
+
+        assert index.quote('fil', 'usd').price == Decimal('5.12')
+        assert index.quote('USD', 'FIL').price == 1 / Decimal('5.12')
+        cross = index.quote('FIL', 'CNY')
+        assert cross.price == Decimal('5.12') * Decimal('7.25')
+        assert cross.source == 'cross'
+        # through the USDT/USD peg
+        assert index.quote('FIL', 'USDT').price == Decimal('5.12')
+        assert index.quote('ETH', 'USD') is None
+
+    asyncio.run(main())
+
+
+def test_quote_json_keeps_precision_and_utc():
+    async def main():
+        index = PriceIndex(StubHistory())
+        await StubFeed(index).push('FIL', 'USD', '5.123456789012345678901')
+        quote = index.quote('FIL', 'USD')
+        body = quote.to_json()
+        assert body['price'] == '5.123456789012345678901'
+        assert body['quotedAt'].endswith('Z')
+        quoted_at = datetime.fromisoformat(body['quotedAt'].replace('Z', '+00:00'))
+        assert abs(quoted_at.timestamp() - quote.quoted_at) < 0.001
+        assert body['stale'] is False
+
+    asyncio.run(main())
+
+
+def test_old_quotes_are_flagged_stale_but_pegs_never():
+    async def main():
+        index = PriceIndex(StubHistory())
+        await StubFeed(index).push('FIL', 'USD', '5', age=MAX_QUOTE_AGE + 60)
+        assert index.quote('FIL', 'USD').to_json()['stale'] is True
+        assert index.quote('USDT', 'USD').to_json()['stale'] is False
+        # a cross is as old as its live leg
+        assert index.quote('FIL', 'USDT').to_json()['stale'] is True
+
+    asyncio.run(main())
+
+
+def test_out_of_order_quote_does_not_replace_a_newer_one():
+    async def main():
+        index = PriceIndex(StubHistory())
+        feed = StubFeed(index)
+        await feed.push('FIL', 'USD', '6')
+        await feed.push('FIL', 'USD', '5', age=30)
+        assert index.quote('FIL', 'USD').price == Decimal('6')
+
+    asyncio.run(main())
+
+
+def test_history_is_recorded_in_utc_for_valuation():
+    async def main():
+        history = StubHistory()
+        index = PriceIndex(history)
+        feed = StubFeed(index)
+        await feed.push('FIL', 'USD', '4', age=7200)
+        await feed.push('FIL', 'USD', '5', age=60)
+
+        assert all(row['quotedAt'].tzinfo == timezone.utc for row in history.rows)
+        now = datetime.now(timezone.utc)
+        assert await index.price_at('fil', 'usd', now - timedelta(hours=1)) == Decimal('4')
+        assert await index.price_at('FIL', 'USD', now) == Decimal('5')
+        assert await index.price_at('FIL', 'USD', now - timedelta(days=1)) is None
+
+    asyncio.run(main())
+
+
+def test_reload_and_bus_keep_workers_in_step():
+    async def main():
+        history = StubHistory()
+        bus = StubBus()
+        index = PriceIndex(history, bus)
+        await StubFeed(index).push('FIL', 'USD', '5.5')
+
+        channel, message = bus.published[-1]
+        assert channel == 'price' and message['price'] == '5.5'
+        other_bus = StubBus()
+        other = PriceIndex(history, other_bus)
+        other_bus.subscribers['price'](message)
+        assert other.quote('FIL', 'USD').price == Decimal('5.5')
+
+        restarted = PriceIndex(history)
+        await restarted.reload()
+        assert restarted.quote('FIL', 'USD').price == Decimal('5.5')
+
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+import asyncio
+
+from mining import purchases
+from mining.purchases import SOLD_OUT, PurchaseEngine
+
+
+class StubCustomer:
+    """Stock per product id; ids missing from `stock` are unknown products."""
+
+    def __init__(self, stock):
+        self.stock = dict(stock)
+        self.loads = 0
+        self.batches = []
+
+    async def get_product_available_qty(self, product_id):
+        self.loads += 1
+        return self.stock.get(product_id)
+
+    async def purchase_products(self, product_id, purchases, platform_id):
+        self.batches.append((product_id, platform_id, len(purchases)))
+        results = []
+        for n, purchase in enumerate(purchases):
+            if product_id not in self.stock:
+                results.append((-2, None))
+            elif self.stock[product_id] < purchase['qty']:
+                results.append((SOLD_OUT, None))
+            else:
+                self.stock[product_id] -= purchase['qty']
+                results.append((100 + n, {'Id': 100 + n}))
+        return results
+
+
+class StubDatabase:
+    def __init__(self, stock):
+        self.customer = StubCustomer(stock)
+
+
+def test_purchases_are_batched_and_sold_out_is_answered_in_memory():
+    async def main():
+        db = StubDatabase({1: 3})
+        engine = PurchaseEngine(db)
+        results = await asyncio.gather(*(engine.purchase(1, 7, customer, 1) for customer in range(5)))
+        order_ids = sorted(order_id for order_id, _ in results)
+        assert order_ids.count(SOLD_OUT) == 2
+        assert [order_id for order_id in order_ids if order_id > 0] == [100, 101, 102]
+        assert db.customer.batches == [(1, 7, 3)]
+        assert engine.rejected == 2
+
+    asyncio.run(main())
+
+
+def test_unknown_products_are_not_tracked():
+    async def main():
+        db = StubDatabase({})
+        engine = PurchaseEngine(db)
+        for product_id in range(100):
+            order_id, _ = await engine.purchase(product_id, 7, 1, 1)
+            assert order_id == -2
+        assert engine.products == {}
+
+    asyncio.run(main())
+
+
+def test_idle_products_are_evicted():
+    async def main():
+        db = StubDatabase({1: 10, 2: 10})
+        engine = PurchaseEngine(db)
+        await engine.purchase(1, 7, 1, 1)
+        assert set(engine.products) == {1}
+
+        # pretend a sweep is due and product 1 was last bought long ago
+        engine.products[1].used_at -= purchases.PRODUCT_IDLE + 1
+        engine._swept_at -= purchases.SWEEP_INTERVAL + 1
+        await engine.purchase(2, 7, 1, 1)
+        assert set(engine.products) == {2}
+
+    asyncio.run(main())
+
+
+def test_stock_is_reloaded_from_the_database():
+    async def main():
+        db = StubDatabase({1: 5})
+        engine = PurchaseEngine(db)
+        order_id, _ = await engine.purchase(1, 7, 1, 1)
+        assert order_id > 0 and db.customer.loads == 1
+
+        # another worker sells the rest; the database turns the next buyer
+        # away and the one after is answered from the reloaded stock
+        db.customer.stock[1] = 0
+        order_id, _ = await engine.purchase(1, 7, 2, 1)
+        assert order_id == SOLD_OUT and len(db.customer.batches) == 2
+        order_id, _ = await engine.purchase(1, 7, 3, 1)
+        assert order_id == SOLD_OUT and len(db.customer.batches) == 2
+        assert db.customer.loads == 2 and engine.rejected == 1
+
+        # a restock is picked up once the product is invalidated
+        db.customer.stock[1] = 2
+        engine.invalidate(1)
+        order_id, _ = await engine.purchase(1, 7, 4, 2)
+        assert order_id > 0 and db.customer.stock[1] == 0
+
+    asyncio.run(main())